@@ -0,0 +1,142 @@
+"""
+Benchmark and tolerance check of the embedding backends against torch.
+
+Encodes the handbook chunks and the labeled questions with the torch
+reference model and with each ONNX backend, and reports:
+- model load time (cold start)
+- single-query latency (p50 / p99) and batch throughput
+- cosine similarity of every embedding to its torch counterpart
+- overlap@k: how many of the top-k chunks a backend's question embedding
+  retrieves from the torch-encoded chunks (i.e. the existing collection)
+  are the ones the torch question embedding retrieves
+
+Exits with status 1 if a backend falls outside TOLERANCES, so the check can
+gate a switch of the serving backend. backend/tests/test_embedding_backends.py
+runs the same check on a tiny generated model, without a download.
+
+    python -m backend.benchmarks.bench_embedding_backends --threads 4
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from backend.benchmarks.bench_hybrid_retrieval import HANDBOOK_PATH, load_questions
+from backend.rag_architecture.embeddings import load_embedding_model
+from backend.vector_db.parsers import split_text_by_headers
+
+# backend -> (minimum cosine similarity to torch, minimum mean overlap@k)
+TOLERANCES = {
+    "onnx": (0.9999, 1.0),
+    "onnx-int8": (0.98, 0.9),
+}
+
+
+def timed_load(model_name, backend, threads, model_dir):
+    start = time.perf_counter()
+    model = load_embedding_model(model_name, backend=backend, threads=threads, model_dir=model_dir)
+    model.encode(["warm up"])
+    return model, time.perf_counter() - start
+
+
+def query_latencies(model, questions, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for question in questions:
+            start = time.perf_counter()
+            model.encode([question])
+            latencies.append(time.perf_counter() - start)
+    return sorted(latencies)
+
+
+def top_k(query_vectors, chunk_vectors, k):
+    return np.argsort(-(query_vectors @ chunk_vectors.T), axis=1)[:, :k]
+
+
+def agreement(reference: dict, result: dict, k: int):
+    """
+    How closely a backend's embeddings match the reference ones.
+
+    Args:
+        reference, result: {"chunk_vectors", "query_vectors"} of the
+            reference backend and of the backend under test
+        k: Number of retrieved chunks compared
+
+    Returns:
+        (lowest cosine similarity of an embedding to its reference,
+        mean overlap@k of the chunks retrieved from the reference chunk
+        vectors)
+    """
+    vectors = np.concatenate([result["chunk_vectors"], result["query_vectors"]])
+    reference_vectors = np.concatenate([reference["chunk_vectors"], reference["query_vectors"]])
+    cosine = np.sum(vectors * reference_vectors, axis=1) / (
+        np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference_vectors, axis=1)
+    )
+    found = top_k(result["query_vectors"], reference["chunk_vectors"], k)
+    expected = top_k(reference["query_vectors"], reference["chunk_vectors"], k)
+    overlap = statistics.mean(len(set(a) & set(b)) / k for a, b in zip(found, expected))
+    return float(cosine.min()), overlap
+
+
+def within_tolerance(backend: str, min_cosine: float, overlap: float) -> bool:
+    """Whether `agreement` results are within the TOLERANCES of `backend`."""
+    required_cosine, required_overlap = TOLERANCES[backend]
+    return min_cosine >= required_cosine and overlap >= required_overlap
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backends", nargs="+", default=list(TOLERANCES), choices=list(TOLERANCES))
+    parser.add_argument("--threads", type=int, default=None, help="onnxruntime threads per encode")
+    parser.add_argument("--model-dir", default=None, help="Directory of the ONNX export")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes over the questions")
+    args = parser.parse_args()
+
+    with open(HANDBOOK_PATH, "r", encoding="utf-8") as file:
+        chunks = [chunk["content"] for chunk in split_text_by_headers(file.read())]
+    questions = [question["question"] for question in load_questions()]
+
+    results = {}
+    for backend in ["torch"] + args.backends:
+        model, load_seconds = timed_load(args.model, backend, args.threads, args.model_dir)
+        start = time.perf_counter()
+        chunk_vectors = np.asarray(model.encode(chunks, batch_size=args.batch_size), dtype=np.float32)
+        batch_seconds = time.perf_counter() - start
+        results[backend] = {
+            "load": load_seconds,
+            "chunks_per_second": len(chunks) / batch_seconds,
+            "latencies": query_latencies(model, questions, args.repeat),
+            "chunk_vectors": chunk_vectors,
+            "query_vectors": np.asarray(model.encode(questions), dtype=np.float32),
+        }
+
+    reference = results["torch"]
+    failed = False
+    print(f"{len(chunks)} chunks, {len(questions)} questions, k={args.k}")
+    print(f"{'backend':<10} {'load':>7} {'p50':>8} {'p99':>8} {'chunks/s':>9} {'min cos':>8} {'overlap@k':>9}")
+    for backend, result in results.items():
+        min_cosine, overlap = agreement(reference, result, args.k)
+        latencies = result["latencies"]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        status = ""
+        if backend in TOLERANCES:
+            ok = within_tolerance(backend, min_cosine, overlap)
+            failed |= not ok
+            required_cosine, required_overlap = TOLERANCES[backend]
+            status = "ok" if ok else f"FAIL (needs cos >= {required_cosine}, overlap >= {required_overlap})"
+        print(
+            f"{backend:<10} {result['load']:6.2f}s {statistics.median(latencies) * 1000:6.2f}ms "
+            f"{p99 * 1000:6.2f}ms {result['chunks_per_second']:9.1f} {min_cosine:8.5f} {overlap:9.3f} {status}"
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
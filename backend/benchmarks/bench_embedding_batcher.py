@@ -0,0 +1,106 @@
+"""
+Benchmark: micro-batched vs per-request query embedding.
+
+Simulates `clients` concurrent /chat requests, each repeatedly embedding one
+labeled handbook question (plus, with --augmented, three variants standing
+in for the generated questions), in two ways:
+- direct: every request runs its own `encode` on the embedding thread pool
+  (the behavior without the batcher)
+- batched: requests submit their texts to an EmbeddingBatcher
+
+The embedding cache is bypassed so every request reaches the model.
+Reported per mode and client count: queries/s, p50 / p99 request latency,
+and for the batcher the mean batch size and p95 queue wait.
+
+    python -m backend.benchmarks.bench_embedding_batcher --clients 1 8 64
+"""
+
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.benchmarks.bench_hybrid_retrieval import load_questions
+from backend.rag_architecture.batcher import EmbeddingBatcher
+from backend.rag_architecture.embeddings import load_embedding_model
+
+
+async def run_clients(embed, texts, clients: int, requests_per_client: int):
+    """Run `clients` concurrent loops of `embed` calls; returns (wall seconds, sorted latencies)."""
+    counter = itertools.count()
+    latencies = []
+
+    async def client():
+        for _ in range(requests_per_client):
+            request_texts = texts[next(counter) % len(texts)]
+            start = time.perf_counter()
+            await embed(request_texts)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - start, sorted(latencies)
+
+
+async def benchmark(model, texts, args):
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    loop = asyncio.get_running_loop()
+
+    async def direct(request_texts):
+        return await loop.run_in_executor(executor, model.encode, request_texts)
+
+    print(f"{'mode':<8} {'clients':>7} {'queries/s':>10} {'p50':>9} {'p99':>9} {'batch':>6} {'wait p95':>9}")
+    for clients in args.clients:
+        requests_per_client = max(1, args.requests // clients)
+        batcher = EmbeddingBatcher(
+            model.encode,
+            executor=executor,
+            max_batch_size=args.batch_size,
+            max_wait_ms=args.wait_ms,
+            concurrency=args.workers,
+        )
+        for mode, embed in (("direct", direct), ("batched", batcher.encode)):
+            await embed(texts[0])
+            seconds, latencies = await run_clients(embed, texts, clients, requests_per_client)
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            batch, wait = "", ""
+            if mode == "batched":
+                stats = batcher.stats()
+                batch = f"{stats['mean_batch_size']:6.1f}"
+                wait = f"{stats['queue_wait_ms']['p95']:7.2f}ms"
+                batcher.close()
+            print(
+                f"{mode:<8} {clients:7d} {len(latencies) / seconds:10.1f} {statistics.median(latencies) * 1000:7.2f}ms "
+                f"{p99 * 1000:7.2f}ms {batch:>6} {wait:>9}"
+            )
+    executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--embedding-backend", default="torch")
+    parser.add_argument("--threads", type=int, default=None, help="onnxruntime threads per encode")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--requests", type=int, default=512, help="Requests per client count")
+    parser.add_argument("--workers", type=int, default=2, help="Embedding thread pool size")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--wait-ms", type=float, default=2)
+    parser.add_argument("--augmented", action="store_true",
+                        help="Embed 4 texts per request, like a request with generated questions")
+    args = parser.parse_args()
+
+    model = load_embedding_model(args.model, backend=args.embedding_backend, threads=args.threads)
+    questions = [question["question"] for question in load_questions()]
+    if args.augmented:
+        texts = [[question, f"What is {question}", f"Explain: {question}", f"{question} details"]
+                 for question in questions]
+    else:
+        texts = [[question] for question in questions]
+    asyncio.run(benchmark(model, texts, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Offline end-to-end load test of the FastAPI backend.
+
+Serves backend/main.py with uvicorn on a local port, with
+- Gemini replaced by a FakeGeminiServer with configurable first-token
+  latency and token-rate distributions
+- the vector database replaced by an in-memory Qdrant collection
+  ('memory') or an on-disk LocalVectorIndex ('local'), seeded from
+  data/docs/handbook.txt
+
+and drives /chat or /chat/stream with a fixed number of concurrent clients
+asking the labeled handbook questions. Nothing leaves the machine; the
+embedding model is the real one.
+
+Reported: end-to-end latency (and time to first token for /chat/stream) and
+p50 / p95 / p99 and calls per second of every pipeline stage, timed by
+wrapping the RAG instance's stage methods. Results are written as JSON
+(named after the current commit by default) so runs can be compared;
+`--baseline` prints the change against an earlier result file.
+
+    python -m backend.benchmarks.bench_end_to_end --concurrency 16 --requests 400
+    python -m backend.benchmarks.bench_end_to_end --baseline backend/benchmarks/results/end_to_end-abc1234.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import functools
+import json
+import os
+import random
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+import numpy as np
+import uvicorn
+from qdrant_client import AsyncQdrantClient, QdrantClient, models
+
+from backend.benchmarks.bench_hybrid_retrieval import HANDBOOK_PATH, load_questions, seed_handbook
+from backend.benchmarks.fake_gemini import LATENCY_DISTRIBUTIONS, FakeGeminiServer
+from backend.rag_architecture import llm
+from backend.rag_architecture import rag as rag_module
+from backend.rag_architecture.embeddings import load_embedding_model
+from backend.rag_architecture.local_index import LocalVectorIndex, has_index
+from backend.rag_architecture.rag import RAG
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Stage name -> RAG method timed as that stage.
+STAGE_METHODS = {
+    "answer_cache": "_lookup_answer_async",
+    "augment": "augment_user_query_async",
+    "embed": "embed_user_queries_async",
+    "retrieve": "retrieve_top_k_points_async",
+    "pack": "pack_context_async",
+}
+
+
+class StageTimer:
+    """Collects the duration of every call of the wrapped coroutine functions, per stage."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, stage: str, function):
+        @functools.wraps(function)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - start)
+        return timed
+
+    def wrap_stream(self, stage: str, function):
+        @functools.wraps(function)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                async for item in function(*args, **kwargs):
+                    yield item
+            finally:
+                self.samples[stage].append(time.perf_counter() - start)
+        return timed
+
+    def instrument(self, rag):
+        """Time `rag`'s stage methods and the generation call; returns a function undoing it."""
+        for stage, method in STAGE_METHODS.items():
+            setattr(rag, method, self.wrap(stage, getattr(rag, method)))
+        originals = (rag_module.ask_llm_async, rag_module.stream_llm_async)
+        rag_module.ask_llm_async = self.wrap("generate", originals[0])
+        rag_module.stream_llm_async = self.wrap_stream("generate", originals[1])
+
+        def restore():
+            for method in STAGE_METHODS.values():
+                vars(rag).pop(method, None)
+            rag_module.ask_llm_async, rag_module.stream_llm_async = originals
+        return restore
+
+
+def summarize(samples, wall_seconds: float) -> dict:
+    """Latency percentiles in milliseconds and throughput of a list of durations in seconds."""
+    if not samples:
+        return {"count": 0}
+    milliseconds = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "per_second": len(samples) / wall_seconds,
+        "mean_ms": float(milliseconds.mean()),
+        "p50_ms": float(np.percentile(milliseconds, 50)),
+        "p95_ms": float(np.percentile(milliseconds, 95)),
+        "p99_ms": float(np.percentile(milliseconds, 99)),
+        "max_ms": float(milliseconds.max()),
+    }
+
+
+async def mirror_collection(source: QdrantClient, target: AsyncQdrantClient, collection_name: str):
+    """
+    Copy a collection between clients.
+
+    The sync and async in-memory clients each hold their own storage, so
+    the seeded collection is copied to the async client /chat searches.
+    """
+    params = source.get_collection(collection_name).config.params
+    await target.create_collection(
+        collection_name, vectors_config=params.vectors, sparse_vectors_config=params.sparse_vectors
+    )
+    offset = None
+    while True:
+        points, offset = source.scroll(collection_name, limit=256, offset=offset, with_payload=True, with_vectors=True)
+        await target.upsert(
+            collection_name,
+            points=[models.PointStruct(id=point.id, vector=point.vector, payload=point.payload) for point in points],
+        )
+        if offset is None:
+            break
+
+
+def build_rag(args, index_dir: str):
+    """RAG instance over a vector store seeded with the handbook."""
+    settings = {
+        "embedding_model_name": args.model,
+        "embedding_backend": args.embedding_backend,
+        "embedding_workers": args.embedding_workers,
+        "embedding_batch_size": args.embedding_batch_size,
+        "embedding_cache_bytes": args.embedding_cache_mb * 2 ** 20,
+        "answer_cache_size": args.answer_cache_size,
+        "retrieval_mode": args.retrieval_mode,
+    }
+    if args.vector_db == "memory":
+        rag = RAG(vector_db_url=":memory:", **settings)
+        seed_handbook(rag.vector_db_client, rag.vector_db_collection, rag.embedding_model, args.handbook)
+        asyncio.run(mirror_collection(rag.vector_db_client, rag.async_vector_db_client, rag.vector_db_collection))
+    else:
+        if not has_index(index_dir):
+            scratch = QdrantClient(":memory:")
+            model = load_embedding_model(args.model, backend=args.embedding_backend)
+            seed_handbook(scratch, "handbook", model, args.handbook)
+            LocalVectorIndex.export_from_qdrant(scratch, "handbook", index_dir)
+        rag = RAG(vector_db_backend="local", local_index_dir=index_dir, **settings)
+    rag.warm_up()
+    return rag
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app, port: int):
+    """Run `app` with uvicorn in a background thread; returns the server once it accepts connections."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+async def send_request(client: httpx.AsyncClient, endpoint: str, question: str) -> dict:
+    body = {"messages": [{"role": "user", "content": question}]}
+    start = time.perf_counter()
+    if endpoint == "chat":
+        response = await client.post("/chat", json=body)
+        ok = response.status_code == 200 and not response.json()["response"].startswith("Error:")
+        return {"latency": time.perf_counter() - start, "ttft": None, "ok": ok}
+
+    ttft, ok = None, False
+    async with client.stream("POST", "/chat/stream", json=body) as response:
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                if event is None and ttft is None:
+                    ttft = time.perf_counter() - start
+                ok = event == "done" or (ok and event is None)
+                if event in ("done", "error"):
+                    break
+                event = None
+    return {"latency": time.perf_counter() - start, "ttft": ttft, "ok": ok and response.status_code == 200}
+
+
+async def drive(base_url: str, endpoint: str, questions: list, concurrency: int, requests: int):
+    """Send `requests` questions from `concurrency` closed-loop clients; returns (wall seconds, records)."""
+    records, next_index = [], iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        async def worker():
+            for i in next_index:
+                try:
+                    records.append(await send_request(client, endpoint, questions[i % len(questions)]))
+                except httpx.HTTPError:
+                    records.append({"latency": None, "ttft": None, "ok": False})
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - start, records
+
+
+def git_commit() -> tuple:
+    """(short commit hash, whether the work tree has changes), or (None, None) outside git."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True
+        ).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def print_results(results: dict, baseline: dict = None):
+    rows = [("end_to_end", results["end_to_end"])]
+    if results.get("time_to_first_token"):
+        rows.append(("first_token", results["time_to_first_token"]))
+    rows += list(results["stages"].items())
+    base_rows = {}
+    if baseline:
+        base_rows = {"end_to_end": baseline["end_to_end"], "first_token": baseline.get("time_to_first_token")}
+        base_rows.update(baseline.get("stages", {}))
+
+    print(f"{'stage':<13} {'count':>6} {'per sec':>9} {'p50':>10} {'p95':>10} {'p99':>10}")
+    for name, row in rows:
+        if not row.get("count"):
+            continue
+        line = (f"{name:<13} {row['count']:6d} {row['per_second']:9.1f} "
+                f"{row['p50_ms']:8.1f}ms {row['p95_ms']:8.1f}ms {row['p99_ms']:8.1f}ms")
+        base = base_rows.get(name)
+        if base and base.get("count"):
+            changes = [
+                f"{key[:-3]} {(row[key] - base[key]) / base[key] * 100:+.0f}%"
+                for key in ("p50_ms", "p95_ms", "p99_ms") if base[key]
+            ]
+            line += "   vs baseline: " + ", ".join(changes)
+        print(line)
+    print(f"errors: {results['errors']} of {results['requests']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=["chat", "stream"], default="chat")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup-requests", type=int, default=8, help="Untimed requests sent first")
+    parser.add_argument("--vector-db", choices=["memory", "local"], default="memory",
+                        help="In-memory Qdrant collection or on-disk LocalVectorIndex")
+    parser.add_argument("--local-index-dir", default=None, help="Index directory of --vector-db local (reused if built)")
+    parser.add_argument("--handbook", default=HANDBOOK_PATH)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--embedding-backend", default="torch")
+    parser.add_argument("--embedding-workers", type=int, default=2)
+    parser.add_argument("--embedding-batch-size", type=int, default=64)
+    parser.add_argument("--embedding-cache-mb", type=int, default=32)
+    parser.add_argument("--answer-cache-size", type=int, default=0,
+                        help="Semantic answer cache entries (default 0: every request runs the pipeline)")
+    parser.add_argument("--retrieval-mode", choices=["hybrid", "dense"], default="hybrid")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Mean seconds to the first token")
+    parser.add_argument("--llm-latency-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-latency-distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=150)
+    parser.add_argument("--llm-tokens-per-second-jitter", type=float, default=30)
+    parser.add_argument("--llm-response-tokens", type=int, default=80)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None,
+                        help="Result file (default: results/end_to_end-<commit>.json next to this script)")
+    parser.add_argument("--baseline", default=None, help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    fake_gemini = FakeGeminiServer(
+        latency=args.llm_latency,
+        latency_jitter=args.llm_latency_jitter,
+        latency_distribution=args.llm_latency_distribution,
+        tokens_per_second=args.llm_tokens_per_second,
+        tokens_per_second_jitter=args.llm_tokens_per_second_jitter,
+        response_tokens=args.llm_response_tokens,
+    ).start()
+    llm.configure(api_key="fake", base_url=fake_gemini.url)
+
+    from backend import main as backend_main
+
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        rag = build_rag(args, args.local_index_dir or os.path.join(scratch_dir, "index"))
+        # The lifespan warm-up finds the instance already built.
+        backend_main.rag = rag
+        port = free_port()
+        server, thread = start_server(backend_main.app, port)
+        base_url = f"http://127.0.0.1:{port}"
+        questions = [question["question"] for question in load_questions()]
+
+        try:
+            asyncio.run(drive(base_url, args.endpoint, questions, args.concurrency, args.warmup_requests))
+            timer = StageTimer()
+            restore = timer.instrument(rag)
+            wall, records = asyncio.run(
+                drive(base_url, args.endpoint, questions, args.concurrency, args.requests)
+            )
+            restore()
+        finally:
+            server.should_exit = True
+            thread.join()
+            fake_gemini.stop()
+
+    commit, dirty = git_commit()
+    completed = [record for record in records if record["ok"]]
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": vars(args),
+        "requests": len(records),
+        "errors": len(records) - len(completed),
+        "wall_seconds": wall,
+        "end_to_end": summarize([record["latency"] for record in completed], wall),
+        "time_to_first_token": summarize(
+            [record["ttft"] for record in completed if record["ttft"] is not None], wall
+        ) if args.endpoint == "stream" else None,
+        "stages": {stage: summarize(samples, wall) for stage, samples in timer.samples.items()},
+        "embedding_batcher": rag.embedding_batcher.stats() if rag.embedding_batcher is not None else None,
+        "context": rag.context_packer.stats(),
+        "fake_gemini": {"requests": fake_gemini.requests, "connections": fake_gemini.connections},
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"end_to_end-{commit or 'unknown'}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
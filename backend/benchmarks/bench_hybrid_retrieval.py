@@ -0,0 +1,138 @@
+"""
+Benchmark: dense-only vs. hybrid (dense + BM25 sparse) retrieval.
+
+Searches every labeled question of handbook_questions.json (no query
+augmentation) and reports recall@k and search latency for both modes. A
+question counts as answered at k when one of the top-k chunks contains one
+of its "relevant" snippets.
+
+By default the handbook is ingested into an in-memory Qdrant first; pass
+--vector-db-url to benchmark a running server whose collection was
+ingested with sparse vectors.
+
+    python -m backend.benchmarks.bench_hybrid_retrieval
+    python -m backend.benchmarks.bench_hybrid_retrieval --vector-db-url http://localhost:6333
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+
+from qdrant_client import QdrantClient, models
+
+from backend.rag_architecture.embeddings import load_embedding_model
+from backend.rag_architecture.sparse import average_document_length, hybrid_query_request
+from backend.vector_db.data_preprocessor import (
+    chunk_point_id,
+    create_collection_if_missing,
+    sparse_text,
+    upload_embedded_batches,
+)
+from backend.vector_db.parsers import split_text_by_headers
+
+BENCHMARK_DIR = os.path.dirname(__file__)
+QUESTIONS_PATH = os.path.join(BENCHMARK_DIR, "handbook_questions.json")
+HANDBOOK_PATH = os.path.join(BENCHMARK_DIR, "../../data/docs/handbook.txt")
+DENSE_VECTOR_NAME = "mscac-dense-vector"
+
+
+def load_questions(path: str = QUESTIONS_PATH):
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def seed_handbook(client: QdrantClient, collection_name: str, model, handbook_path: str = HANDBOOK_PATH):
+    """Ingest the handbook into `client` the way DataPreprocessor does."""
+    with open(handbook_path, "r", encoding="utf-8") as file:
+        chunks = split_text_by_headers(file.read())
+    sparse = create_collection_if_missing(client, collection_name)
+    vectors = model.encode([chunk["content"] for chunk in chunks])
+    items = [
+        {
+            "id": chunk_point_id("handbook.txt", chunk),
+            "document_title": "handbook.txt",
+            "title": chunk["title"],
+            "content": chunk["content"],
+            "embedding": vector,
+        }
+        for chunk, vector in zip(chunks, vectors)
+    ]
+    # Local mode is not thread-safe, so upload sequentially.
+    return upload_embedded_batches(
+        client,
+        collection_name,
+        [items],
+        upload_workers=1,
+        sparse=sparse,
+        average_document_length=average_document_length(sparse_text(item) for item in items),
+    )
+
+
+def is_relevant(point, question) -> bool:
+    content = point.payload["content"]
+    return any(snippet in content for snippet in question["relevant"])
+
+
+def run_mode(client, collection_name, questions, query_vectors, make_request, ks, repeat):
+    latencies = []
+    hits = {k: 0 for k in ks}
+    for question, query_vector in zip(questions, query_vectors):
+        request = make_request(query_vector, question["question"], max(ks))
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.query_batch_points(collection_name=collection_name, requests=[request])[0]
+            latencies.append(time.perf_counter() - start)
+        for k in ks:
+            hits[k] += any(is_relevant(point, question) for point in response.points[:k])
+    return {k: hits[k] / len(questions) for k in ks}, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vector-db-url", default=None, help="Qdrant URL (default: in-memory, seeded from the handbook)")
+    parser.add_argument("--collection", default="csc2701")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--embedding-backend", default="torch")
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--prefetch-limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed searches per question")
+    args = parser.parse_args()
+
+    model = load_embedding_model(args.model, backend=args.embedding_backend)
+    if args.vector_db_url:
+        client = QdrantClient(args.vector_db_url)
+    else:
+        client = QdrantClient(":memory:")
+        seed_handbook(client, args.collection, model)
+
+    questions = load_questions(args.questions)
+    query_vectors = model.encode([question["question"] for question in questions])
+
+    modes = {
+        "dense": lambda vector, text, limit: models.QueryRequest(
+            query=vector.tolist(), using=DENSE_VECTOR_NAME, limit=limit, with_payload=True
+        ),
+        "hybrid": lambda vector, text, limit: hybrid_query_request(
+            vector, text, limit=limit, prefetch_limit=max(args.prefetch_limit, limit),
+            dense_vector_name=DENSE_VECTOR_NAME,
+        ),
+    }
+
+    print(f"{len(questions)} questions, {args.repeat} timed searches each")
+    for name, make_request in modes.items():
+        recall, latencies = run_mode(
+            client, args.collection, questions, query_vectors, make_request, args.k, args.repeat
+        )
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        recalls = " ".join(f"recall@{k}={recall[k]:.2f}" for k in args.k)
+        print(
+            f"{name:<7} {recalls} "
+            f"p50={statistics.median(latencies) * 1000:6.2f}ms p99={p99 * 1000:6.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
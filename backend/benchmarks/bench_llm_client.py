@@ -0,0 +1,89 @@
+"""
+Micro-benchmark: shared pooled Gemini client vs. a new client per call.
+
+Runs sequential generate calls against the local fake Gemini server and
+reports latency and how many TCP connections each strategy opened.
+
+    python -m backend.benchmarks.bench_llm_client --calls 200
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from google import genai
+from google.genai import types
+
+from backend.benchmarks.fake_gemini import FakeGeminiServer
+from backend.rag_architecture import llm
+
+
+def per_call_client(server_url: str):
+    # What ask_llm / augment_user_query did before: a new client per question.
+    return genai.Client(api_key="fake", http_options=types.HttpOptions(base_url=server_url))
+
+
+def run_sync(make_client, calls: int):
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        client = make_client()
+        client.models.generate_content(model="gemini-2.5-flash-lite", contents="hello")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def run_async(make_client, calls: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            client = make_client()
+            await client.aio.models.generate_content(model="gemini-2.5-flash-lite", contents="hello")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+    return latencies
+
+
+def report(name: str, latencies, connections: int):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{name:<28} mean={statistics.mean(latencies) * 1000:7.2f}ms "
+        f"p50={statistics.median(latencies) * 1000:7.2f}ms "
+        f"p99={p99 * 1000:7.2f}ms connections={connections}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    with FakeGeminiServer() as server:
+        llm.configure(base_url=server.url, api_key="fake")
+
+        for name, make_client in [
+            ("sync, client per call", lambda: per_call_client(server.url)),
+            ("sync, shared client", llm.get_client),
+        ]:
+            before = server.connections
+            latencies = run_sync(make_client, args.calls)
+            report(name, latencies, server.connections - before)
+
+        for name, make_client in [
+            ("async, client per call", lambda: per_call_client(server.url)),
+            ("async, shared client", llm.get_client),
+        ]:
+            before = server.connections
+            latencies = asyncio.run(run_async(make_client, args.calls, args.concurrency))
+            report(name, latencies, server.connections - before)
+
+
+if __name__ == "__main__":
+    main()
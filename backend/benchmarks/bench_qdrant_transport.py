@@ -0,0 +1,225 @@
+"""
+Benchmark: Qdrant over REST/JSON vs gRPC, and the cost of the returned payload.
+
+Serialization (offline): encode/decode time and size of
+- an upsert request of --upsert-batch-size handbook points (dense + sparse
+  vectors, as ingestion sends them)
+- a query_batch_points request of the RAG's dense retrieval
+- the response to it, returning the vectors and the whole payload vs only
+  the fields the RAG reads (RETRIEVED_PAYLOAD_FIELDS, without vectors)
+as JSON (the REST body) and as protobuf (the gRPC message).
+
+Against a Qdrant server (--vector-db-url, e.g. vector_db/docker-compose.yml,
+which also exposes gRPC on 6334), per transport:
+- rest:        QdrantClient(url) as constructed before; the client library
+               disables keep-alive for localhost, so every request opens a
+               new connection
+- rest-pooled: the keep-alive connection pool of qdrant_clients.py
+- grpc:        prefer_grpc, one multiplexed channel
+bulk upsert throughput (upload_embedded_batches of the handbook plus
+--copies noisy copies) and p50 / p99 retrieval latency with both payload
+selectors.
+
+    python -m backend.benchmarks.bench_qdrant_transport
+    python -m backend.benchmarks.bench_qdrant_transport --vector-db-url http://localhost:6333
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from qdrant_client import QdrantClient, grpc, models
+from qdrant_client.conversions.conversion import RestToGrpc
+from qdrant_client.http import models as rest_models
+
+from backend.benchmarks.bench_vector_storage import DENSE_VECTOR_NAME, corpus_items, query_vectors
+from backend.rag_architecture.embeddings import load_embedding_model
+from backend.rag_architecture.qdrant_clients import qdrant_client_options
+from backend.rag_architecture.rag import RETRIEVED_PAYLOAD_FIELDS
+from backend.vector_db.data_preprocessor import create_collection_if_missing, upload_embedded_batches, upsert_point_batches
+
+TRANSPORTS = ("rest", "rest-pooled", "grpc")
+
+# label -> (with_payload, with_vector) of the retrieval requests
+PAYLOAD_SELECTORS = {
+    "full": (True, True),
+    "fields": (RETRIEVED_PAYLOAD_FIELDS, False),
+}
+
+
+def timed(function, repeat: int) -> float:
+    """Median seconds of `repeat` calls of `function`."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def json_costs(model, repeat: int) -> dict:
+    encoded = json.dumps(model.model_dump(mode="json", exclude_none=True)).encode("utf-8")
+    return {
+        "bytes": len(encoded),
+        "encode_ms": timed(lambda: json.dumps(model.model_dump(mode="json", exclude_none=True)), repeat) * 1000,
+        "decode_ms": timed(lambda: type(model).model_validate(json.loads(encoded)), repeat) * 1000,
+    }
+
+
+def protobuf_costs(message, convert, repeat: int) -> dict:
+    """`convert` builds `message` from the REST models, as the gRPC client does for every call."""
+    encoded = message.SerializeToString()
+    return {
+        "bytes": len(encoded),
+        "encode_ms": timed(lambda: convert().SerializeToString(), repeat) * 1000,
+        "decode_ms": timed(lambda: type(message).FromString(encoded), repeat) * 1000,
+    }
+
+
+def serialization_results(items, vectors, top_k: int, upsert_batch_size: int, repeat: int) -> dict:
+    points = next(upsert_point_batches(items[:upsert_batch_size], upsert_batch_size, max_upsert_bytes=2 ** 62))
+    upsert = models.PointsList(points=points)
+
+    def upsert_message():
+        return grpc.UpsertPoints(
+            collection_name="bench", points=[RestToGrpc.convert_point_struct(point) for point in points]
+        )
+
+    requests = [
+        models.QueryRequest(
+            query=vector.tolist(),
+            using=DENSE_VECTOR_NAME,
+            limit=top_k,
+            with_payload=RETRIEVED_PAYLOAD_FIELDS,
+            with_vector=False,
+        )
+        for vector in vectors[:3]
+    ]
+    query = models.QueryRequestBatch(searches=requests)
+
+    def query_message():
+        return grpc.QueryBatchPoints(
+            collection_name="bench",
+            query_points=[RestToGrpc.convert_query_request(request, "bench") for request in requests],
+        )
+
+    results = {
+        "upsert": {"json": json_costs(upsert, repeat), "protobuf": protobuf_costs(upsert_message(), upsert_message, repeat)},
+        "query": {"json": json_costs(query, repeat), "protobuf": protobuf_costs(query_message(), query_message, repeat)},
+    }
+
+    for label, (with_payload, with_vector) in PAYLOAD_SELECTORS.items():
+        scored = []
+        for point in points[:top_k]:
+            payload = point.payload
+            if isinstance(with_payload, list):
+                payload = {key: value for key, value in payload.items() if key in with_payload}
+            scored.append(models.ScoredPoint(
+                id=point.id, version=0, score=1.0, payload=payload, vector=point.vector if with_vector else None,
+            ))
+        response = rest_models.QueryResponse(points=scored)
+
+        def response_message():
+            return grpc.QueryResponse(result=[RestToGrpc.convert_scored_point(point) for point in scored])
+
+        results[f"response ({label})"] = {
+            "json": json_costs(response, repeat),
+            "protobuf": protobuf_costs(response_message(), response_message, repeat),
+        }
+    return results
+
+
+def create_client(url: str, transport: str) -> QdrantClient:
+    if transport == "rest":
+        return QdrantClient(url, timeout=300)
+    return QdrantClient(**qdrant_client_options(url, prefer_grpc=transport == "grpc", timeout=300))
+
+
+def bulk_upsert(client, collection_name: str, items, encode_batch_size: int, upsert_batch_size: int) -> float:
+    """Points per second of a fresh upload of `items`, as ingestion sends them."""
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+    create_collection_if_missing(client, collection_name)
+    batches = (items[start:start + encode_batch_size] for start in range(0, len(items), encode_batch_size))
+    start = time.perf_counter()
+    upload_embedded_batches(client, collection_name, batches, upsert_batch_size=upsert_batch_size)
+    return len(items) / (time.perf_counter() - start)
+
+
+def search_latencies(client, collection_name: str, vectors, top_k: int, with_payload, with_vector) -> list:
+    """Sorted seconds of one query_batch_points call (3 queries, like an augmented question) per step."""
+    latencies = []
+    for start in range(0, len(vectors) - 2, 3):
+        requests = [
+            models.QueryRequest(
+                query=vector.tolist(), using=DENSE_VECTOR_NAME, limit=top_k,
+                with_payload=with_payload, with_vector=with_vector,
+            )
+            for vector in vectors[start:start + 3]
+        ]
+        began = time.perf_counter()
+        client.query_batch_points(collection_name=collection_name, requests=requests)
+        latencies.append(time.perf_counter() - began)
+    return sorted(latencies)
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vector-db-url", default=None, help="Qdrant server (default: serialization only)")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--embedding-backend", default="torch")
+    parser.add_argument("--collection-prefix", default="csc2701_transport")
+    parser.add_argument("--transports", nargs="+", choices=TRANSPORTS, default=list(TRANSPORTS))
+    parser.add_argument("--copies", type=int, default=50, help="Noisy copies of the handbook added to the corpus")
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--encode-batch-size", type=int, default=32)
+    parser.add_argument("--upsert-batch-size", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=50, help="Timed runs of each serialization")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch collections")
+    args = parser.parse_args()
+
+    model = load_embedding_model(args.model, backend=args.embedding_backend)
+    items = corpus_items(model, args.copies, args.noise)
+    vectors = query_vectors(model, items, args.queries, args.noise)
+
+    print(f"Serialization (median of {args.repeat})")
+    print(f"  {'message':<18} {'format':<9} {'bytes':>9} {'encode':>10} {'decode':>10}")
+    for message, formats in serialization_results(
+        items, vectors, args.top_k, args.upsert_batch_size, args.repeat
+    ).items():
+        for name, costs in formats.items():
+            print(f"  {message:<18} {name:<9} {costs['bytes']:9d} {costs['encode_ms']:8.3f}ms {costs['decode_ms']:8.3f}ms")
+
+    if not args.vector_db_url:
+        print("No --vector-db-url: skipping upsert and search")
+        return
+
+    print(f"{len(items)} points, {len(vectors) // 3} batched queries of 3, top_k={args.top_k}")
+    print(f"  {'transport':<12} {'upsert':>12} " + " ".join(
+        f"{label + ' p50':>12} {label + ' p99':>12}" for label in PAYLOAD_SELECTORS
+    ))
+    for transport in args.transports:
+        client = create_client(args.vector_db_url, transport)
+        collection_name = f"{args.collection_prefix}_{transport.replace('-', '_')}"
+        rate = bulk_upsert(client, collection_name, items, args.encode_batch_size, args.upsert_batch_size)
+        # Warm up the connection (and the server's caches) before timing.
+        search_latencies(client, collection_name, vectors[:30], args.top_k, True, False)
+        row = f"  {transport:<12} {rate:8.0f} pt/s"
+        for with_payload, with_vector in PAYLOAD_SELECTORS.values():
+            latencies = search_latencies(client, collection_name, vectors, args.top_k, with_payload, with_vector)
+            row += f" {statistics.median(latencies) * 1000:10.2f}ms {percentile(latencies, 0.99) * 1000:10.2f}ms"
+        print(row)
+        if not args.keep:
+            client.delete_collection(collection_name)
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
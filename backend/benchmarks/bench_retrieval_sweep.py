@@ -0,0 +1,285 @@
+"""
+Recall-vs-latency sweep over retrieval parameters.
+
+Every combination of
+- embedding backend used for the queries (--backends)
+- dense vector quantization of the collection (--quantization)
+- HNSW search `ef` (--hnsw-ef)
+- query augmentation on/off (--augmentation)
+- query routing to sections on/off (--routing; see router.py)
+- top_k (--top-k)
+is run over the labeled handbook questions through the same
+RAG.embed_user_queries / RAG.retrieve_top_k_relevant_chunks path the
+API uses, and scored against the expected section headers of each
+question (the `title`s split_text_by_headers gives the handbook chunks).
+By default the expected headers are those of the chunks containing a
+question's `relevant` snippets in handbook_questions.json; --labels reads a
+hand-made [{"question", "headers"}] file instead.
+
+Reported per configuration: recall@k (share of expected headers among the
+top_k chunks), precision (share of the retrieved chunks that come from an
+expected section; the rest are irrelevant chunks put in the prompt), MRR,
+and per-query retrieval latency (query embedding + routing + search, p50 /
+p95). With augmentation the median latency of the
+augmentation LLM call is added, since it runs before retrieval. The
+Pareto frontier (no other configuration is both faster and at least as
+accurate) is marked, and --recall-target picks the fastest configuration
+reaching it.
+
+The collections are encoded with the first backend in --backends. The
+in-memory client searches exhaustively and ignores quantization and
+`hnsw_ef`, so those two dimensions are only swept against a Qdrant server
+(--vector-db-url). Augmented queries come from Gemini and are cached in
+--augmentations so later sweeps are reproducible and offline.
+
+    python -m backend.benchmarks.bench_retrieval_sweep --vector-db-url http://localhost:6333 --recall-target 0.9
+"""
+
+import argparse
+import itertools
+import json
+import os
+import statistics
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+from backend.benchmarks.bench_hybrid_retrieval import BENCHMARK_DIR, HANDBOOK_PATH, load_questions, seed_handbook
+from backend.rag_architecture.embeddings import EMBEDDING_BACKENDS
+from backend.rag_architecture.qdrant_config import QUANTIZATION_TYPES, search_params
+from backend.rag_architecture.rag import RAG
+from backend.rag_architecture.router import QueryRouter, compute_header_centroids
+from backend.vector_db.data_preprocessor import create_collection_if_missing
+from backend.vector_db.parsers import split_text_by_headers
+
+AUGMENTATIONS_PATH = os.path.join(BENCHMARK_DIR, "handbook_augmentations.json")
+
+
+def header_labels(questions: list, chunks: list) -> list:
+    """Expected headers of each question: the chunks containing one of its relevant snippets."""
+    return [
+        {
+            "question": question["question"],
+            "headers": sorted({
+                chunk["title"] for chunk in chunks
+                if any(snippet in chunk["content"] for snippet in question["relevant"])
+            }),
+        }
+        for question in questions
+    ]
+
+
+def load_augmentations(path: str, questions: list, rag: RAG) -> dict:
+    """
+    Augmented queries of every question, generated with `rag` if not cached in `path`.
+
+    Returns:
+        Dict question -> {"queries": [question, generated...], "seconds": LLM call time},
+        or None if they could not be generated
+    """
+    cached = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as file:
+            cached = json.load(file)
+    missing = [question for question in questions if question not in cached]
+    if missing:
+        try:
+            for question in missing:
+                start = time.perf_counter()
+                queries = rag.augment_user_query(question)
+                cached[question] = {"queries": queries, "seconds": time.perf_counter() - start}
+        except Exception as e:
+            print(f"Cannot generate augmented queries ({e}); skipping augmentation")
+            return None
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(cached, file, indent=2)
+    return cached
+
+
+def build_collections(client, prefix: str, quantizations: list, model, fresh: bool) -> dict:
+    """One handbook collection per quantization type; returns quantization -> collection name."""
+    collections = {}
+    for quantization in quantizations:
+        name = f"{prefix}_{quantization}"
+        if fresh and client.collection_exists(name):
+            client.delete_collection(name)
+        if not client.collection_exists(name):
+            create_collection_if_missing(client, name, quantization=quantization)
+            seed_handbook(client, name, model)
+        collections[quantization] = name
+    return collections
+
+
+def evaluate(rag: RAG, labels: list, query_sets: list, top_k: int, repeat: int) -> dict:
+    """Recall@top_k, MRR and per-query latency of `rag`'s current retrieval settings."""
+    recalls, precisions, reciprocal_ranks, latencies = [], [], [], []
+    for label, queries in zip(labels, query_sets):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            query_vectors = rag.embed_user_queries(queries)
+            chunks = rag.retrieve_top_k_relevant_chunks(query_vectors, top_k, queries)
+            timings.append(time.perf_counter() - start)
+        latencies.append(statistics.median(timings))
+
+        expected = set(label["headers"])
+        headers = [chunk[0] for chunk in chunks]
+        if expected:
+            recalls.append(len(expected & set(headers)) / len(expected))
+            if headers:
+                precisions.append(sum(header in expected for header in headers) / len(headers))
+        rank = next((i + 1 for i, header in enumerate(headers) if header in expected), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "recall": statistics.mean(recalls) if recalls else 0.0,
+        "precision": statistics.mean(precisions) if precisions else 0.0,
+        "mrr": statistics.mean(reciprocal_ranks),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def pareto_frontier(results: list) -> list:
+    """Results not beaten by a faster (or equally fast) one with at least the same recall."""
+    frontier, best_recall = [], -1.0
+    for result in sorted(results, key=lambda result: (result["latency_ms"], -result["recall"])):
+        if result["recall"] > best_recall:
+            frontier.append(result)
+            best_recall = result["recall"]
+    return frontier
+
+
+def describe(config: dict) -> str:
+    ef = config["hnsw_ef"] or "default"
+    augmentation = "on" if config["augmentation"] else "off"
+    routing = "on" if config["routing"] else "off"
+    return (f"{config['backend']:<10} {config['quantization']:<7} ef={str(ef):<8} "
+            f"aug={augmentation:<4} route={routing:<4} k={config['top_k']:<3}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vector-db-url", default=None, help="Qdrant URL (default: in-memory)")
+    parser.add_argument("--collection-prefix", default="csc2701_sweep")
+    parser.add_argument("--fresh", action="store_true", help="Rebuild the sweep collections on the server")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backends", nargs="+", choices=EMBEDDING_BACKENDS, default=["torch"])
+    parser.add_argument("--quantization", nargs="+", choices=QUANTIZATION_TYPES, default=["none", "scalar"])
+    parser.add_argument("--hnsw-ef", type=int, nargs="+", default=[0, 16, 64, 128],
+                        help="Search ef values (0: collection default)")
+    parser.add_argument("--augmentation", choices=["on", "off", "both"], default="both")
+    parser.add_argument("--routing", choices=["on", "off", "both"], default="both")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--retrieval-mode", choices=["hybrid", "dense"], default="hybrid")
+    parser.add_argument("--labels", default=None, help="[{question, headers}] file (default: derived, see above)")
+    parser.add_argument("--write-labels", default=None, help="Write the derived labels here and exit")
+    parser.add_argument("--augmentations", default=AUGMENTATIONS_PATH)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per question (median is kept)")
+    parser.add_argument("--recall-target", type=float, default=None)
+    parser.add_argument("--output", default=None, help="Write all results as JSON")
+    args = parser.parse_args()
+
+    with open(HANDBOOK_PATH, "r", encoding="utf-8") as file:
+        chunks = split_text_by_headers(file.read())
+    if args.labels:
+        with open(args.labels, "r", encoding="utf-8") as file:
+            labels = json.load(file)
+    else:
+        labels = header_labels(load_questions(), chunks)
+    if args.write_labels:
+        with open(args.write_labels, "w", encoding="utf-8") as file:
+            json.dump(labels, file, indent=2)
+        return
+
+    rags = {
+        backend: RAG(
+            vector_db_url=args.vector_db_url or ":memory:",
+            embedding_model_name=args.model,
+            embedding_backend=backend,
+            embedding_cache_bytes=0,
+            answer_cache_size=0,
+            retrieval_mode=args.retrieval_mode,
+        )
+        for backend in args.backends
+    }
+    if args.vector_db_url:
+        client = QdrantClient(args.vector_db_url, timeout=300)
+        quantizations, ef_values = args.quantization, args.hnsw_ef
+    else:
+        client = QdrantClient(":memory:")
+        quantizations, ef_values = ["none"], [0]
+        print("In-memory client: exhaustive search, quantization and hnsw_ef are not swept")
+    collections = build_collections(
+        client, args.collection_prefix, quantizations, rags[args.backends[0]].embedding_model, args.fresh
+    )
+
+    questions = [label["question"] for label in labels]
+    augmentation_values = {"on": [True], "off": [False], "both": [False, True]}[args.augmentation]
+    augmentations = None
+    if True in augmentation_values:
+        augmentations = load_augmentations(args.augmentations, questions, rags[args.backends[0]])
+        if augmentations is None:
+            augmentation_values = [False]
+    query_sets = {
+        False: [[question] for question in questions],
+        True: [augmentations[question]["queries"] for question in questions] if augmentations else None,
+    }
+    llm_ms = {False: 0.0}
+    if augmentations:
+        llm_ms[True] = statistics.median(augmentations[question]["seconds"] for question in questions) * 1000
+
+    routers = {
+        quantization: QueryRouter(compute_header_centroids(client, name))
+        for quantization, name in collections.items()
+    }
+
+    results = []
+    routing_values = {"on": [True], "off": [False], "both": [False, True]}[args.routing]
+    grid = itertools.product(args.backends, quantizations, ef_values, augmentation_values, routing_values, args.top_k)
+    for backend, quantization, ef, augmentation, routing, top_k in grid:
+        rag = rags[backend]
+        rag.vector_db_client = client
+        rag.vector_db_collection = collections[quantization]
+        rag._hybrid_available = None
+        rag.search_params = search_params(hnsw_ef=ef or None)
+        rag.query_router = routers[quantization] if routing else None
+        metrics = evaluate(rag, labels, query_sets[augmentation], top_k, args.repeat)
+        results.append({
+            "backend": backend,
+            "quantization": quantization,
+            "hnsw_ef": ef or None,
+            "augmentation": augmentation,
+            "routing": routing,
+            "top_k": top_k,
+            **metrics,
+            "llm_ms": llm_ms[augmentation],
+            "latency_ms": metrics["p50_ms"] + llm_ms[augmentation],
+        })
+
+    frontier = pareto_frontier(results)
+    print(f"{len(labels)} questions, {len(results)} configurations (* = Pareto frontier)")
+    print(f"  {'configuration':<59} {'recall':>6} {'prec':>6} {'MRR':>6} {'p50':>9} {'p95':>9} {'+LLM':>8}")
+    for result in sorted(results, key=lambda result: result["latency_ms"]):
+        marker = "*" if any(result is point for point in frontier) else " "
+        print(
+            f"{marker} {describe(result):<59} {result['recall']:6.3f} {result['precision']:6.3f} {result['mrr']:6.3f} "
+            f"{result['p50_ms']:7.2f}ms {result['p95_ms']:7.2f}ms {result['llm_ms']:6.0f}ms"
+        )
+
+    if args.recall_target is not None:
+        meeting = [result for result in frontier if result["recall"] >= args.recall_target]
+        if meeting:
+            print(f"Fastest configuration with recall >= {args.recall_target}: {describe(meeting[0])}")
+        else:
+            print(f"No configuration reaches recall {args.recall_target}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"labels": labels, "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
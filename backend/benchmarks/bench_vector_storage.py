@@ -0,0 +1,170 @@
+"""
+Benchmark: quantized / on-disk dense vector storage vs. the current setup.
+
+Needs a running Qdrant server (the in-memory client has no HNSW index or
+quantization). For each storage config a scratch collection is filled with
+the handbook chunks plus `--copies` noisy copies of them, so the index is
+large enough to be built, and the same queries (labeled handbook questions
+plus perturbed chunk vectors) are searched with each set of search
+parameters.
+
+Reported per config:
+- estimated RAM of the dense vectors and HNSW links (Qdrant does not
+  report memory per collection, see qdrant_config.estimated_vector_memory)
+- p50 / p99 search latency
+- recall@k against an exact (brute-force) search of the float32 vectors
+
+    python -m backend.benchmarks.bench_vector_storage --vector-db-url http://localhost:6333
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from backend.benchmarks.bench_hybrid_retrieval import HANDBOOK_PATH, load_questions
+from backend.rag_architecture.embeddings import load_embedding_model
+from backend.rag_architecture.qdrant_config import estimated_vector_memory, search_params
+from backend.vector_db.data_preprocessor import create_collection_if_missing, upload_embedded_batches
+from backend.vector_db.parsers import split_text_by_headers
+
+DENSE_VECTOR_NAME = "mscac-dense-vector"
+
+# name -> collection storage options
+STORAGE_CONFIGS = {
+    "float32": {"quantization": None, "on_disk": False},
+    "int8": {"quantization": "scalar", "on_disk": True},
+    "binary": {"quantization": "binary", "on_disk": True},
+}
+
+# (label, storage config, search parameters); "float32 default" is the current setup.
+SEARCH_CONFIGS = [
+    ("float32 default", "float32", {}),
+    ("float32 hnsw_ef=32", "float32", {"hnsw_ef": 32}),
+    ("int8 no rescore", "int8", {"rescore": False}),
+    ("int8 rescore x2", "int8", {"rescore": True, "oversampling": 2.0}),
+    ("binary no rescore", "binary", {"rescore": False}),
+    ("binary rescore x3", "binary", {"rescore": True, "oversampling": 3.0}),
+]
+
+
+def corpus_items(model, copies: int, noise: float, seed: int = 0):
+    """Handbook chunks followed by `copies` copies with Gaussian noise added to their vectors."""
+    with open(HANDBOOK_PATH, "r", encoding="utf-8") as file:
+        chunks = split_text_by_headers(file.read())
+    vectors = np.asarray(model.encode([chunk["content"] for chunk in chunks]), dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    items = []
+    for copy in range(copies + 1):
+        copy_vectors = vectors if copy == 0 else vectors + rng.normal(0, noise, vectors.shape).astype(np.float32)
+        copy_vectors /= np.linalg.norm(copy_vectors, axis=1, keepdims=True)
+        items.extend(
+            {
+                "id": copy * len(chunks) + i,
+                "document_title": "handbook.txt",
+                "title": chunk["title"],
+                "content": chunk["content"],
+                "embedding": vector,
+            }
+            for i, (chunk, vector) in enumerate(zip(chunks, copy_vectors))
+        )
+    return items
+
+
+def query_vectors(model, items, count: int, noise: float, seed: int = 1):
+    questions = [question["question"] for question in load_questions()]
+    vectors = [np.asarray(model.encode(questions), dtype=np.float32)]
+    rng = np.random.default_rng(seed)
+    sampled = np.stack([items[i]["embedding"] for i in rng.choice(len(items), max(0, count - len(questions)))])
+    vectors.append(sampled + rng.normal(0, noise, sampled.shape).astype(np.float32))
+    return np.concatenate(vectors)
+
+
+def build_collection(client, collection_name, items, storage, hnsw_m, hnsw_ef_construct):
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+    create_collection_if_missing(
+        client, collection_name, hnsw_m=hnsw_m, hnsw_ef_construct=hnsw_ef_construct, **storage
+    )
+    # Index right away instead of after the default ~20MB of unindexed vectors.
+    client.update_collection(
+        collection_name=collection_name,
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=1000),
+    )
+    batches = (items[start:start + 256] for start in range(0, len(items), 256))
+    upload_embedded_batches(client, collection_name, batches, sparse=False)
+    while client.get_collection(collection_name).status != models.CollectionStatus.GREEN:
+        time.sleep(0.5)
+
+
+def search(client, collection_name, vectors, k, params):
+    latencies, results = [], []
+    for vector in vectors:
+        start = time.perf_counter()
+        response = client.query_points(
+            collection_name=collection_name,
+            query=vector.tolist(),
+            using=DENSE_VECTOR_NAME,
+            limit=k,
+            search_params=params,
+            with_payload=False,
+        )
+        latencies.append(time.perf_counter() - start)
+        results.append([point.id for point in response.points])
+    return sorted(latencies), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vector-db-url", required=True)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--embedding-backend", default="torch")
+    parser.add_argument("--collection-prefix", default="csc2701_bench")
+    parser.add_argument("--copies", type=int, default=400, help="Noisy copies of the handbook added to the corpus")
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--hnsw-m", type=int, default=None)
+    parser.add_argument("--hnsw-ef-construct", type=int, default=None)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch collections")
+    args = parser.parse_args()
+
+    model = load_embedding_model(args.model, backend=args.embedding_backend)
+    client = QdrantClient(args.vector_db_url, timeout=300)
+    items = corpus_items(model, args.copies, args.noise)
+    vectors = query_vectors(model, items, args.queries, args.noise)
+    print(f"{len(items)} points, {len(vectors)} queries, k={args.k}")
+
+    collections = {}
+    for name, storage in STORAGE_CONFIGS.items():
+        collections[name] = f"{args.collection_prefix}_{name}"
+        start = time.perf_counter()
+        build_collection(client, collections[name], items, storage, args.hnsw_m, args.hnsw_ef_construct)
+        print(f"built '{collections[name]}' in {time.perf_counter() - start:.1f}s")
+
+    _, exact = search(client, collections["float32"], vectors, args.k, search_params(exact=True))
+
+    m = args.hnsw_m or 16
+    print(f"{'config':<20} {'memory':>10} {'p50':>9} {'p99':>9} {'recall@' + str(args.k):>9}")
+    for label, name, params in SEARCH_CONFIGS:
+        latencies, results = search(client, collections[name], vectors, args.k, search_params(**params))
+        recall = statistics.mean(
+            len(set(found) & set(truth)) / len(truth) for found, truth in zip(results, exact) if truth
+        )
+        memory = estimated_vector_memory(len(items), quantization=STORAGE_CONFIGS[name]["quantization"],
+                                         on_disk=STORAGE_CONFIGS[name]["on_disk"], m=m)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(
+            f"{label:<20} {memory / 2 ** 20:8.1f}MB {statistics.median(latencies) * 1000:7.2f}ms "
+            f"{p99 * 1000:7.2f}ms {recall:9.3f}"
+        )
+
+    if not args.keep:
+        for collection_name in collections.values():
+            client.delete_collection(collection_name)
+
+
+if __name__ == "__main__":
+    main()
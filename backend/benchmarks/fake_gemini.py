@@ -0,0 +1,210 @@
+"""
+Local stand-in for the Gemini REST API, for benchmarks and offline runs.
+
+Serves `:generateContent` and `:streamGenerateContent` for any model with
+a configurable time-to-first-token and token rate (each drawn per request
+from a distribution), so the backend can be exercised without network access or API quota. Point the shared client at
+it with `llm.configure(base_url=server.url, api_key="fake")` or by setting
+GEMINI_BASE_URL.
+
+Prompts asking for a JSON array (the query augmentation prompt) get three
+canned questions back; every other prompt gets `response_tokens` words.
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_DISTRIBUTIONS = ("constant", "normal", "lognormal", "exponential")
+
+
+class FakeGeminiServer:
+    """
+    Threaded HTTP server imitating the Gemini generateContent endpoints.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+        latency: Mean seconds before the first token is sent
+        latency_jitter: Standard deviation of the first-token latency
+        tokens_per_second: Mean generation speed of responses (None = instant)
+        response_tokens: Number of words in a generated answer
+        latency_distribution: Distribution of the first-token latency:
+            'normal' (truncated at 0), 'lognormal' (long right tail, like
+            real API latencies), 'exponential' (ignores the jitter) or
+            'constant'
+        tokens_per_second_jitter: Standard deviation of the per-response
+            generation speed
+
+    Attributes:
+        url: Base URL to pass to the Gemini client
+        connections: Number of TCP connections accepted so far
+        requests: Number of requests served so far
+    """
+
+    def __init__(
+            self,
+            host: str = "127.0.0.1",
+            port: int = 0,
+            latency: float = 0.0,
+            latency_jitter: float = 0.0,
+            tokens_per_second: float = None,
+            response_tokens: int = 50,
+            latency_distribution: str = "normal",
+            tokens_per_second_jitter: float = 0.0
+        ):
+
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(
+                f"Unknown latency_distribution '{latency_distribution}', expected one of {LATENCY_DISTRIBUTIONS}"
+            )
+        self.latency_distribution = latency_distribution
+        self.tokens_per_second_jitter = tokens_per_second_jitter
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def first_token_delay(self) -> float:
+        if self.latency <= 0 or self.latency_distribution == "constant":
+            return max(0.0, self.latency)
+        if self.latency_distribution == "exponential":
+            return random.expovariate(1.0 / self.latency)
+        if self.latency_distribution == "lognormal":
+            # Parameters giving the requested mean and standard deviation.
+            sigma = math.sqrt(math.log(1 + (self.latency_jitter / self.latency) ** 2))
+            return random.lognormvariate(math.log(self.latency) - sigma ** 2 / 2, sigma)
+        return max(0.0, random.gauss(self.latency, self.latency_jitter))
+
+    def token_rate(self):
+        """Generation speed of one response, in tokens per second (None = instant)."""
+        if not self.tokens_per_second:
+            return None
+        return max(1.0, random.gauss(self.tokens_per_second, self.tokens_per_second_jitter))
+
+    def answer_tokens(self, prompt: str):
+        if "JSON array" in prompt:
+            return ['["What are the requirements?", ', '"When is the deadline?", ', '"Who should I contact?"]']
+        return [f"token{i} " for i in range(self.response_tokens)]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                with server._lock:
+                    server.requests += 1
+
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                prompt = "".join(
+                    part.get("text", "")
+                    for content in body.get("contents", [])
+                    for part in content.get("parts", [])
+                )
+                tokens = server.answer_tokens(prompt)
+                time.sleep(server.first_token_delay())
+
+                rate = server.token_rate()
+                if ":streamGenerateContent" in self.path:
+                    self._stream(tokens, rate)
+                else:
+                    self._respond(tokens, rate)
+
+            def _respond(self, tokens, rate):
+                if rate:
+                    time.sleep(len(tokens) / rate)
+                payload = json.dumps(_response_json("".join(tokens))).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, tokens, rate):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, token in enumerate(tokens):
+                    if i and rate:
+                        time.sleep(1.0 / rate)
+                    event = f"data: {json.dumps(_response_json(token))}\r\n\r\n".encode()
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(event), event))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+def _response_json(text: str) -> dict:
+    return {
+        "candidates": [
+            {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+        ],
+        "modelVersion": "fake",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Gemini API server.")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--latency-jitter", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    parser.add_argument("--response-tokens", type=int, default=50)
+    parser.add_argument("--latency-distribution", default="normal", choices=LATENCY_DISTRIBUTIONS)
+    parser.add_argument("--tokens-per-second-jitter", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(
+        port=args.port,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        latency_distribution=args.latency_distribution,
+        tokens_per_second_jitter=args.tokens_per_second_jitter,
+    )
+    print(f"Fake Gemini API listening on {server.url}")
+    server._httpd.serve_forever()
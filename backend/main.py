@@ -1,15 +1,111 @@
-from fastapi import FastAPI
+import asyncio
+import json
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict
-from backend.rag_architecture.rag import RAG
-
-app = FastAPI()
-rag = RAG(
-    embedding_model_name='all-MiniLM-L6-v2',
-    language_model_name='gemini-2.5-flash-lite'
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Dict, Optional
+from backend.rag_architecture.config import rag_settings_from_env
+from backend.rag_architecture.metrics import CONTENT_TYPE, REGISTRY, Timings, request_timings
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_seconds", "Time to the response headers of HTTP requests.", ["method", "path", "status"]
 )
 
+logger = logging.getLogger(__name__)
+
+# Seconds between warm-up attempts while the model or Qdrant is unavailable.
+WARM_UP_RETRY_SECONDS = (1, 2, 5, 10, 30)
+
+# Most questions accepted by one /chat/batch call.
+MAX_BATCH_MESSAGES = 1000
+
+# Built by the lifespan warm-up task; requests get a 503 until then.
+rag = None
+startup = {"state": "starting", "error": None, "started_at": time.monotonic(), "ready_after": None}
+
+
+def create_rag():
+    # Imported here so the server starts accepting connections (and answers
+    # /healthz) before the model stack is imported.
+    from backend.rag_architecture.rag import RAG
+
+    return RAG(**rag_settings_from_env())
+
+
+async def run_in_thread(function, on_abandoned=None):
+    """
+    Await `function()` run on the default thread pool.
+
+    A thread cannot be interrupted: if the caller is cancelled, the call
+    keeps running and `on_abandoned` is passed its result once it is done.
+    """
+    future = asyncio.get_running_loop().run_in_executor(None, function)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        if on_abandoned is not None:
+            future.add_done_callback(
+                lambda done: None if done.cancelled() or done.exception() else on_abandoned(done.result())
+            )
+        raise
+
+
+async def warm_up():
+    """
+    Build and warm the RAG instance off the event loop, retrying until it succeeds.
+
+    The instance (model, thread pool, clients) is built once; only its
+    warm-up, which fails while Qdrant is unreachable, is retried.
+    """
+    global rag
+    instance = None
+    attempt = 0
+    while rag is None:
+        try:
+            if instance is None:
+                instance = await run_in_thread(create_rag, on_abandoned=lambda built: built.close())
+            await run_in_thread(instance.warm_up)
+            rag = instance
+        except asyncio.CancelledError:
+            if instance is not None:
+                await instance.aclose()
+            raise
+        except Exception as e:
+            delay = WARM_UP_RETRY_SECONDS[min(attempt, len(WARM_UP_RETRY_SECONDS) - 1)]
+            logger.exception("RAG warm-up failed, retrying in %ss", delay)
+            startup.update(state="error", error=str(e))
+            attempt += 1
+            await asyncio.sleep(delay)
+    startup.update(state="ready", error=None, ready_after=time.monotonic() - startup["started_at"])
+    logger.info("RAG ready after %.1fs", startup["ready_after"])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    task = asyncio.create_task(warm_up())
+    yield
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    if rag is not None:
+        await rag.aclose()
+
+
+def require_rag():
+    if rag is None:
+        raise HTTPException(status_code=503, detail="Model is warming up", headers={"Retry-After": "5"})
+    return rag
+
+
+app = FastAPI(lifespan=lifespan)
+
 # Allow frontend access
 app.add_middleware(
     CORSMiddleware,
@@ -19,18 +115,219 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class ChatHistory(BaseModel):
-    messages: List[Dict[str, str]]
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """
+    Time the request and report its RAG stages in a Server-Timing header.
+
+    Stages run by the endpoint record themselves in the Timings installed
+    here. A streamed response sends its headers before generation starts,
+    so /chat/stream reports its stages in the final `done` event instead.
+    """
+    timings = Timings()
+    token = request_timings.set(timings)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+    seconds = time.perf_counter() - start
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(seconds, request.method, getattr(route, "path", "unmatched"), str(response.status_code))
+    response.headers["Server-Timing"] = timings.server_timing(total=seconds)
+    return response
+
+class ChatRequest(BaseModel):
+    """
+    One chat turn.
+
+    Clients send the new `message` and the `session_id` of the conversation
+    (a new one is created, and returned, if it is missing or unknown); the
+    server keeps the conversation. The whole history as `messages` is still
+    accepted, but only its last message is used and no session is kept.
+    """
+    session_id: Optional[str] = None
+    message: Optional[str] = None
+    messages: Optional[List[Dict[str, str]]] = None
+
+
+class ChatBatchRequest(BaseModel):
+    """
+    Independent questions answered by /chat/batch, without sessions.
+
+    `concurrency` limits the LLM calls in flight for this batch; it is
+    capped by the server's BATCH_CONCURRENCY.
+    """
+    messages: List[str]
+    top_k: int = Field(3, ge=1, le=50)
+    concurrency: Optional[int] = Field(None, ge=1)
+
+
+def chat_turn(chat_request: ChatRequest):
+    """(session id or None, new message) of a chat request."""
+    if chat_request.message is not None:
+        return chat_request.session_id or uuid.uuid4().hex, chat_request.message
+    if chat_request.messages:
+        return None, chat_request.messages[-1]["content"]
+    raise HTTPException(status_code=422, detail="Send a message (or a non-empty messages list)")
 
 @app.get("/")
 async def root():
     return {"message": "FastAPI is running"}
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving HTTP."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once the model is loaded and warm, 503 before."""
+    if rag is None:
+        return JSONResponse(status_code=503, content={"status": startup["state"], "error": startup["error"]})
+    return {"status": "ready", "ready_after": startup["ready_after"]}
+
+@app.get("/metrics")
+async def metrics():
+    """Stage and request latency histograms in the Prometheus text format."""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit rates of the query embedding cache and the semantic answer cache."""
+    rag = require_rag()
+    return {
+        "embedding_cache": rag.embedding_cache.stats() if rag.embedding_cache is not None else None,
+        "answer_cache": rag.answer_cache.stats() if rag.answer_cache is not None else None,
+    }
+
+@app.get("/embedding/stats")
+async def embedding_stats():
+    """Batch sizes and queue waits of the query embedding batcher."""
+    rag = require_rag()
+    return {
+        "batcher": rag.embedding_batcher.stats() if rag.embedding_batcher is not None else None,
+    }
+
+@app.get("/context/stats")
+async def context_stats():
+    """Prompt tokens of retrieved text before and after context packing."""
+    rag = require_rag()
+    return rag.context_packer.stats()
+
+@app.get("/router/stats")
+async def router_stats():
+    """Questions routed to a subset of the sections, searched unfiltered, and filter fallbacks."""
+    rag = require_rag()
+    return rag.query_router.stats() if rag.query_router is not None else None
+
+# Plain functions: FastAPI runs them on its thread pool, as the session store
+# may be a SQLite file.
+@app.get("/sessions/stats")
+def session_stats():
+    """Number of conversation sessions kept and session lookups."""
+    rag = require_rag()
+    return rag.session_store.stats()
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    """Forget a conversation."""
+    rag = require_rag()
+    if not rag.session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return {"deleted": session_id}
+
 @app.post("/chat")
-async def chat(history: ChatHistory):
+async def chat(chat_request: ChatRequest):
+    rag = require_rag()
+    session_id, message = chat_turn(chat_request)
     try:
-        latest_user_message = history.messages[-1]["content"]
-        response = rag(user_query=latest_user_message)
-        return {"response": response}
+        response = await rag.run_async(user_query=message, session_id=session_id)
+        return {"response": response, "session_id": session_id}
     except Exception as e:
-        return {"response": f"Error: {e}"}
+        return {"response": f"Error: {e}", "session_id": session_id}
+
+
+@app.post("/chat/batch")
+async def chat_batch(batch_request: ChatBatchRequest):
+    """
+    Answer many questions in one call, streamed back as NDJSON.
+
+    For evaluation runs and answer precomputation: the questions are
+    embedded and searched in batches and their LLM calls run concurrently
+    (see RAG.run_batch_async). One JSON line is sent per question as soon
+    as it is answered, in completion order:
+    {"index", "message", "response", "from_cache"}, or
+    {"index", "message", "error"} if that question failed, without
+    affecting the others. A final {"done": true, "answered", "errors",
+    "elapsed_ms", "stage_ms_summed"} line ends the stream: the wall time
+    since the request arrived, and the milliseconds spent in each stage
+    summed over the questions. The questions' stages overlap, so these sums
+    can exceed the wall time.
+    """
+    started_at = time.perf_counter()
+    rag = require_rag()
+    messages = batch_request.messages
+    if not messages or len(messages) > MAX_BATCH_MESSAGES:
+        raise HTTPException(status_code=422, detail=f"Send between 1 and {MAX_BATCH_MESSAGES} messages")
+    concurrency = min(batch_request.concurrency or rag.batch_concurrency, rag.batch_concurrency)
+    timings = request_timings.get()
+
+    async def lines():
+        errors = 0
+        async for index, request, error in rag.run_batch_async(
+            messages, top_k=batch_request.top_k, concurrency=concurrency
+        ):
+            item = {"index": index, "message": request.user_query}
+            if error is None:
+                item.update(response=request.response_to_user, from_cache=request.from_cache)
+            else:
+                errors += 1
+                item["error"] = str(error) or type(error).__name__
+            yield json.dumps(item) + "\n"
+        totals = timings.totals() if timings is not None else {}
+        yield json.dumps({
+            "done": True,
+            "answered": len(messages) - errors,
+            "errors": errors,
+            "elapsed_ms": round((time.perf_counter() - started_at) * 1000, 1),
+            "stage_ms_summed": {name: round(seconds * 1000, 1) for name, seconds in totals.items()},
+        }) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+
+def sse_event(data: dict, event: str = None) -> str:
+    """Format one Server-Sent Event carrying a JSON payload."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(chat_request: ChatRequest):
+    """
+    Stream the answer as Server-Sent Events.
+
+    Every generated text piece is sent as a `data: {"token": ...}` event as
+    soon as Gemini produces it, followed by a final `done` event carrying
+    the session id and the stage timings in milliseconds (or an `error`
+    event if the pipeline fails part-way). The session id is also sent in
+    the X-Session-Id header.
+    """
+    rag = require_rag()
+    session_id, message = chat_turn(chat_request)
+    timings = request_timings.get()
+
+    async def events():
+        try:
+            async for token in rag.stream_async(user_query=message, session_id=session_id):
+                yield sse_event({"token": token})
+            totals = timings.totals() if timings is not None else {}
+            server_timing = {name: round(seconds * 1000, 1) for name, seconds in totals.items()}
+            yield sse_event({"session_id": session_id, "server_timing": server_timing}, event="done")
+        except Exception as e:
+            yield sse_event({"error": str(e)}, event="error")
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if session_id:
+        headers["X-Session-Id"] = session_id
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
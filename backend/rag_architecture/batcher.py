@@ -0,0 +1,190 @@
+"""
+Dynamic micro-batching of query embeddings.
+
+Concurrent requests each need a handful of short texts embedded. Encoding
+them one request at a time leaves most of the model's batch parallelism
+unused, so requests instead submit their texts to an EmbeddingBatcher: a
+worker on the event loop gathers submissions until it has
+`max_batch_size` texts or the oldest has waited `max_wait_ms`, encodes them
+in one call on the embedding thread pool and hands every caller its rows.
+
+When no batch is being encoded the worker does not wait: an idle server
+encodes a lone query right away, and under load the queue fills while the
+previous batch runs.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+import numpy as np
+
+# Upper bounds of the batch-size histogram buckets.
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class EmbeddingBatcher:
+    """
+    Batches `encode` calls from concurrent coroutines.
+
+    Args:
+        encode: Function mapping a list of texts to an (n, dim) array; run
+            on `executor`
+        executor: Thread pool the encodes run on (None: the loop's default)
+        max_batch_size: Maximum number of texts per encode
+        max_wait_ms: Longest time a text waits for more texts to join its batch
+        concurrency: Number of batches encoded at the same time (at most the
+            executor's workers)
+        recent_samples: Number of recent queue waits kept for percentiles
+    """
+
+    def __init__(
+            self,
+            encode,
+            executor=None,
+            max_batch_size: int = 64,
+            max_wait_ms: float = 5,
+            concurrency: int = 1,
+            recent_samples: int = 1024
+        ):
+        self._encode = encode
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.concurrency = concurrency
+
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._batches = set()
+        self._slots = None
+        self._in_flight = 0
+
+        self.batches = 0
+        self.items = 0
+        self.deduplicated = 0
+        self.encode_seconds = 0.0
+        self.batch_size_histogram = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self.batch_size_histogram["inf"] = 0
+        self._recent_waits = deque(maxlen=recent_samples)
+        self._recent_batch_sizes = deque(maxlen=recent_samples)
+
+    async def encode(self, texts: list) -> np.ndarray:
+        """
+        Embed `texts` as part of the next batch.
+
+        Returns:
+            Array of shape (len(texts), embedding_dim)
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((list(texts), future, time.perf_counter()))
+        return await future
+
+    def _ensure_worker(self):
+        # The queue and worker belong to the running loop; a new loop (e.g.
+        # a second asyncio.run) gets its own.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._in_flight = 0
+            self._batches = set()
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            submissions = [await self._queue.get()]
+            size = len(submissions[0][0])
+            deadline = submissions[0][2] + (self.max_wait if self._in_flight else 0)
+            while size < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    submission = self._queue.get_nowait() if remaining <= 0 else await asyncio.wait_for(
+                        self._queue.get(), remaining
+                    )
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                submissions.append(submission)
+                size += len(submission[0])
+
+            # Gathering continues while this batch encodes, up to
+            # `concurrency` batches in flight.
+            await self._slots.acquire()
+            self._in_flight += 1
+            # The loop only keeps weak references to tasks.
+            task = self._loop.create_task(self._encode_batch(submissions))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    def close(self):
+        """Stop the worker and the batches being encoded; texts still queued are never encoded."""
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        for task in list(self._batches):
+            task.cancel()
+        self._batches.clear()
+
+    async def _encode_batch(self, submissions):
+        try:
+            started_at = time.perf_counter()
+            texts, positions = [], {}
+            for submission_texts, _, enqueued_at in submissions:
+                self._recent_waits.append(started_at - enqueued_at)
+                for text in submission_texts:
+                    if text not in positions:
+                        positions[text] = len(texts)
+                        texts.append(text)
+
+            try:
+                vectors = await self._loop.run_in_executor(self.executor, self._encode, texts)
+            except asyncio.CancelledError:
+                for _, future, _ in submissions:
+                    future.cancel()
+                raise
+            except Exception as error:
+                for _, future, _ in submissions:
+                    if not future.done():
+                        future.set_exception(error)
+                return
+
+            vectors = np.asarray(vectors)
+            for submission_texts, future, _ in submissions:
+                if not future.done():
+                    future.set_result(vectors[[positions[text] for text in submission_texts]])
+            self._record(sum(len(s[0]) for s in submissions), len(texts), time.perf_counter() - started_at)
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+    def _record(self, items: int, encoded: int, seconds: float):
+        self.batches += 1
+        self.items += items
+        self.deduplicated += items - encoded
+        self.encode_seconds += seconds
+        self._recent_batch_sizes.append(encoded)
+        bucket = next((bucket for bucket in BATCH_SIZE_BUCKETS if encoded <= bucket), "inf")
+        self.batch_size_histogram[bucket] += 1
+
+    def stats(self) -> dict:
+        """Batch-size and queue-wait metrics since startup (percentiles over recent batches)."""
+        waits = np.array(self._recent_waits) * 1000 if self._recent_waits else np.zeros(1)
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "deduplicated": self.deduplicated,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "recent_mean_batch_size": float(np.mean(self._recent_batch_sizes)) if self._recent_batch_sizes else 0.0,
+            "batch_size_histogram": {str(bucket): count for bucket, count in self.batch_size_histogram.items()},
+            "queue_wait_ms": {
+                "p50": float(np.percentile(waits, 50)),
+                "p95": float(np.percentile(waits, 95)),
+                "max": float(waits.max()),
+            },
+            "mean_encode_ms": self.encode_seconds / self.batches * 1000 if self.batches else 0.0,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
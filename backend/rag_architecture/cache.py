@@ -0,0 +1,233 @@
+"""
+In-process caches used by the RAG pipeline.
+
+This module provides:
+- EmbeddingCache: bounded LRU + TTL cache of query embeddings
+- SemanticCache: answer cache for near-duplicate questions
+"""
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Lower-case and collapse whitespace so trivial variations share a key."""
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU + TTL cache of embeddings keyed on (model name, normalized text).
+
+    Entries expire `ttl` seconds after they were stored; when the memory used
+    by the cached vectors and keys exceeds `max_bytes`, least recently used
+    entries are evicted first. Safe to share between threads.
+
+    Args:
+        max_bytes: Memory budget for cached vectors and keys
+        ttl: Seconds an entry stays valid (None = never expires)
+
+    Attributes:
+        hits: Number of lookups answered from the cache
+        misses: Number of lookups that had to be computed
+        evictions: Number of entries dropped for size or age
+    """
+
+    ENTRY_OVERHEAD_BYTES = 200
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl: float = 24 * 3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, model_name: str, text: str):
+        return (model_name, normalize_query(text))
+
+    def _entry_bytes(self, key, vector: np.ndarray) -> int:
+        return vector.nbytes + len(key[0]) + len(key[1]) + self.ENTRY_OVERHEAD_BYTES
+
+    def get(self, model_name: str, text: str):
+        """Return the cached embedding, or None on a miss or expired entry."""
+        key = self._key(model_name, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                self._remove(key)
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, model_name: str, text: str, vector: np.ndarray):
+        """Store an embedding, evicting least recently used entries if over budget."""
+        key = self._key(model_name, text)
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        entry_bytes = self._entry_bytes(key, vector)
+        if entry_bytes > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (vector, expires_at)
+            self.size_bytes += entry_bytes
+            while self.size_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        vector, _ = self._entries.pop(key)
+        self.size_bytes -= self._entry_bytes(key, vector)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size, e.g. for logging or metrics."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SemanticCache:
+    """
+    Answer cache matched on query meaning rather than exact text.
+
+    Query embeddings are kept in one pre-normalized float32 matrix, so a
+    lookup is a single matrix-vector product. A stored answer is returned
+    when the cosine similarity between the new query and a cached one is at
+    least `threshold`. Entries expire after `ttl` seconds; when the cache is
+    full the least recently used entry is replaced. All entries are dropped
+    when the corpus version changes (see `set_corpus_version`).
+
+    Args:
+        threshold: Minimum cosine similarity for a hit
+        max_entries: Maximum number of cached answers
+        ttl: Seconds a cached answer stays valid
+
+    Attributes:
+        hits: Number of lookups answered from the cache
+        misses: Number of lookups that fell through to the pipeline
+        saved_seconds: Pipeline time (LLM calls, retrieval) avoided by hits
+        corpus_version: Corpus version the cached answers were generated from
+    """
+
+    def __init__(self, threshold: float = 0.92, max_entries: int = 1024, ttl: float = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+        self.corpus_version = None
+        self._corpus_version_known = False
+        self._vectors = None
+        self._answers = [None] * max_entries
+        self._costs = np.zeros(max_entries)
+        self._expires_at = np.zeros(max_entries)
+        self._last_used = np.zeros(max_entries)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query_vector):
+        """Return the cached answer closest to `query_vector`, or None on a miss."""
+        query_vector = self._normalize(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is not None:
+                scores = self._vectors @ query_vector
+                scores[self._expires_at <= now] = -np.inf
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._last_used[best] = now
+                    self.hits += 1
+                    self.saved_seconds += float(self._costs[best])
+                    return self._answers[best]
+            self.misses += 1
+            return None
+
+    def store(self, query_vector, answer: str, cost_seconds: float = 0.0):
+        """
+        Cache `answer` for `query_vector`.
+
+        Args:
+            query_vector: Embedding of the query the answer was generated for
+            answer: Generated answer
+            cost_seconds: Time it took to produce the answer, credited to
+                `saved_seconds` on every later hit
+        """
+        query_vector = self._normalize(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, query_vector.shape[0]), dtype=np.float32)
+            free = np.flatnonzero(self._expires_at <= now)
+            slot = int(free[0]) if free.size else int(np.argmin(self._last_used))
+            self._vectors[slot] = query_vector
+            self._answers[slot] = answer
+            self._costs[slot] = cost_seconds
+            self._expires_at[slot] = now + self.ttl
+            self._last_used[slot] = now
+
+    def set_corpus_version(self, corpus_version):
+        """Record the current corpus version, dropping every entry if it changed."""
+        with self._lock:
+            if self._corpus_version_known and corpus_version == self.corpus_version:
+                return
+            if self._corpus_version_known:
+                self.invalidations += 1
+            self.corpus_version = corpus_version
+            self._corpus_version_known = True
+            self._answers = [None] * self.max_entries
+            self._expires_at[:] = 0.0
+
+    def __len__(self):
+        return int(np.count_nonzero(self._expires_at > time.monotonic()))
+
+    def stats(self) -> dict:
+        """Hit rate and saved pipeline time, e.g. for logging or metrics."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+            "invalidations": self.invalidations,
+            "corpus_version": self.corpus_version,
+        }
@@ -0,0 +1,283 @@
+"""
+Memory-mapped chunk store shared by ingestion and serving.
+
+With a chunk store, Qdrant points only carry their vectors and the small
+filterable fields (header, document_title); the chunk texts live here and
+retrieval fills them in for the top-k points it returns, without Qdrant
+serializing them into every search response or keeping them in its RAM.
+
+Store directory layout:
+- blob-<generation>.bin: UTF-8 header, document title and content of every
+  chunk, back to back
+- index-<generation>.bin: one fixed-size INDEX_DTYPE record per chunk
+  (point id, blob offset, byte lengths of the three fields)
+- manifest.json: generation, number of committed records and blob bytes,
+  and the corpus version of the collection the store matches
+
+Both data files are append-only. Readers memory-map only what the manifest
+covers, so a commit (new records written, then manifest.json replaced)
+never exposes a half-written chunk. Point ids are content hashes: an id is
+stored once and its text never changes. `compact` rewrites the live chunks
+into the next generation and switches the manifest to it.
+
+Ingestion writes chunks here before upserting their points, so every point
+a search can return is already in the store; the corpus version stamped by
+`commit` lets serving tell that the store matches the collection.
+"""
+
+import json
+import mmap
+import os
+import threading
+
+import numpy as np
+
+INDEX_DTYPE = np.dtype([
+    ("id", "S36"),
+    ("offset", "<u8"),
+    ("header_bytes", "<u4"),
+    ("title_bytes", "<u4"),
+    ("content_bytes", "<u4"),
+])
+FORMAT_VERSION = 1
+
+
+class ChunkStore:
+    """
+    Append-only, memory-mapped store of chunk texts keyed by point id.
+
+    Reads decode the fields straight from the mapped blob; they hold the
+    store's lock, so a reload cannot unmap the files under them. A single
+    process should write to a store at a time.
+
+    Args:
+        store_dir: Store directory
+        create: Create an empty store if `store_dir` has none
+
+    Attributes:
+        corpus_version: Corpus version of the collection the store was last
+            committed for
+    """
+
+    def __init__(self, store_dir: str, create: bool = False):
+        self.store_dir = store_dir
+        if not os.path.exists(self._path("manifest.json")):
+            if not create:
+                raise FileNotFoundError(f"No chunk store in '{store_dir}'")
+            os.makedirs(store_dir, exist_ok=True)
+            self._write_manifest({
+                "format": FORMAT_VERSION, "generation": 0, "records": 0, "blob_bytes": 0, "corpus_version": None,
+            })
+        self._pending = []
+        self._pending_ids = set()
+        self._lock = threading.Lock()
+        self._blob = None
+        self._view = None
+        self.load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.store_dir, name)
+
+    def _data_paths(self, generation: int):
+        return self._path(f"index-{generation}.bin"), self._path(f"blob-{generation}.bin")
+
+    def _read_manifest(self) -> dict:
+        with open(self._path("manifest.json"), encoding="utf-8") as file:
+            return json.load(file)
+
+    def _write_manifest(self, manifest: dict):
+        tmp_path = self._path(".manifest.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self._path("manifest.json"))
+
+    def load(self):
+        """Map the committed part of the current generation."""
+        manifest = self._read_manifest()
+        if manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported chunk store format {manifest.get('format')} in '{self.store_dir}'")
+        index_path, blob_path = self._data_paths(manifest["generation"])
+        blob = view = None
+        if manifest["records"]:
+            index = np.memmap(index_path, dtype=INDEX_DTYPE, mode="r", shape=(manifest["records"],))
+            with open(blob_path, "rb") as file:
+                blob = mmap.mmap(file.fileno(), manifest["blob_bytes"], access=mmap.ACCESS_READ)
+            view = memoryview(blob)
+        else:
+            index = np.zeros(0, dtype=INDEX_DTYPE)
+        # For a re-appended id (after a failed commit) the last record wins.
+        rows = {raw_id.decode("ascii"): row for row, raw_id in enumerate(index["id"])}
+        with self._lock:
+            self._close_maps()
+            self._index, self._blob, self._view, self._rows = index, blob, view, rows
+            self.manifest = manifest
+            self.corpus_version = manifest.get("corpus_version")
+
+    def _close_maps(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
+
+    def refresh(self):
+        """Reload the store if it was committed to since it was loaded; returns the corpus version."""
+        manifest = self._read_manifest()
+        if manifest != self.manifest:
+            self.load()
+        return self.corpus_version
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, point_id) -> bool:
+        return str(point_id) in self._rows
+
+    def get(self, point_ids) -> list:
+        """
+        Look up chunks by point id.
+
+        Returns:
+            One (header, document_title, content) tuple per id, or None
+            where the store does not hold it
+        """
+        chunks = []
+        with self._lock:
+            for point_id in point_ids:
+                row = self._rows.get(str(point_id))
+                if row is None:
+                    chunks.append(None)
+                    continue
+                record = self._index[row]
+                start = int(record["offset"])
+                fields = []
+                for length in (int(record["header_bytes"]), int(record["title_bytes"]), int(record["content_bytes"])):
+                    fields.append(str(self._view[start:start + length], "utf-8"))
+                    start += length
+                chunks.append(tuple(fields))
+        return chunks
+
+    def append(self, chunks) -> list:
+        """
+        Queue chunks for the next `commit`, skipping ids already stored or queued.
+
+        Args:
+            chunks: Iterable of (point_id, header, document_title, content)
+
+        Returns:
+            Ids of the chunks queued
+        """
+        appended = []
+        with self._lock:
+            for point_id, header, document_title, content in chunks:
+                point_id = str(point_id)
+                if point_id in self._rows or point_id in self._pending_ids:
+                    continue
+                if len(point_id) > INDEX_DTYPE["id"].itemsize:
+                    raise ValueError(f"Point id '{point_id}' is too long for the chunk store")
+                fields = [header.encode("utf-8"), document_title.encode("utf-8"), content.encode("utf-8")]
+                self._pending.append((point_id, fields))
+                self._pending_ids.add(point_id)
+                appended.append(point_id)
+        return appended
+
+    def commit(self, corpus_version: str = None, fsync: bool = True):
+        """
+        Write the queued chunks and publish them in a new manifest.
+
+        Args:
+            corpus_version: Corpus version to stamp (None: keep the current one)
+            fsync: Flush the data files to disk before publishing; without
+                it the chunks are visible to other processes but may not
+                survive a crash
+        """
+        with self._lock:
+            pending, self._pending, self._pending_ids = self._pending, [], set()
+            manifest = dict(self._read_manifest())
+            if not pending and (corpus_version is None or corpus_version == manifest["corpus_version"]):
+                return
+            index_path, blob_path = self._data_paths(manifest["generation"])
+            offset = manifest["blob_bytes"]
+            records = np.zeros(len(pending), dtype=INDEX_DTYPE)
+            with open(blob_path, "ab") as blob:
+                # Drop whatever an interrupted commit left past the committed bytes.
+                blob.truncate(manifest["blob_bytes"])
+                for record, (point_id, fields) in zip(records, pending):
+                    record["id"] = point_id.encode("ascii")
+                    record["offset"] = offset
+                    record["header_bytes"], record["title_bytes"], record["content_bytes"] = map(len, fields)
+                    for field in fields:
+                        blob.write(field)
+                        offset += len(field)
+                self._sync(blob, fsync)
+            with open(index_path, "ab") as index:
+                index.truncate(manifest["records"] * INDEX_DTYPE.itemsize)
+                index.write(records.tobytes())
+                self._sync(index, fsync)
+            manifest["records"] += len(pending)
+            manifest["blob_bytes"] = offset
+            if corpus_version is not None:
+                manifest["corpus_version"] = corpus_version
+            self._write_manifest(manifest)
+        self.load()
+
+    @staticmethod
+    def _sync(file, fsync: bool):
+        file.flush()
+        if fsync:
+            os.fsync(file.fileno())
+
+    def compact(self, keep_ids, corpus_version: str = None):
+        """
+        Rewrite the store with only the chunks in `keep_ids`.
+
+        The chunks are copied into the next generation's files, the manifest
+        is switched to them, and the old files are removed (readers that
+        still map them keep working until they refresh).
+        """
+        self.commit()
+        keep_ids = {str(point_id) for point_id in keep_ids}
+        with self._lock:
+            manifest = dict(self._read_manifest())
+            live = [point_id for point_id in self._rows if point_id in keep_ids]
+            old_paths = self._data_paths(manifest["generation"])
+            generation = manifest["generation"] + 1
+            index_path, blob_path = self._data_paths(generation)
+            records = np.zeros(len(live), dtype=INDEX_DTYPE)
+            offset = 0
+            with open(blob_path, "wb") as blob:
+                for record, point_id in zip(records, live):
+                    source = self._index[self._rows[point_id]]
+                    start = int(source["offset"])
+                    length = int(source["header_bytes"]) + int(source["title_bytes"]) + int(source["content_bytes"])
+                    blob.write(self._view[start:start + length])
+                    record["id"] = source["id"]
+                    record["offset"] = offset
+                    record["header_bytes"] = source["header_bytes"]
+                    record["title_bytes"] = source["title_bytes"]
+                    record["content_bytes"] = source["content_bytes"]
+                    offset += length
+                self._sync(blob, True)
+            with open(index_path, "wb") as index:
+                index.write(records.tobytes())
+                self._sync(index, True)
+            manifest.update(generation=generation, records=len(live), blob_bytes=offset)
+            if corpus_version is not None:
+                manifest["corpus_version"] = corpus_version
+            self._write_manifest(manifest)
+        self.load()
+        for path in old_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def stats(self) -> dict:
+        return {
+            "chunks": len(self._rows),
+            "records": self.manifest["records"],
+            "blob_bytes": self.manifest["blob_bytes"],
+            "generation": self.manifest["generation"],
+            "corpus_version": self.corpus_version,
+        }
@@ -0,0 +1,131 @@
+"""
+RAG settings read from the environment (and a .env file).
+
+Every variable is optional; unset ones keep the RAG default.
+
+    QDRANT_URL              Qdrant server URL
+    QDRANT_COLLECTION       Collection holding the chunks
+    VECTOR_DB_BACKEND       'qdrant' or 'local'
+    LOCAL_INDEX_DIR         Index directory of the 'local' backend
+    LOCAL_INDEX_METRIC      Similarity metric of the 'local' backend
+    RETRIEVAL_MODE          'hybrid' or 'dense'
+    RETRIEVAL_FUSION        'rrf' or 'max': how the rankings of generated questions are merged
+    RRF_K                   Rank offset of reciprocal rank fusion
+    HYBRID_PREFETCH_LIMIT   Candidates of each of the dense and sparse searches
+    SEARCH_HNSW_EF          HNSW candidate list size of a search
+    SEARCH_OVERSAMPLING     Quantized candidates fetched per result before rescoring
+    SEARCH_RESCORE          'true' to rescore quantized candidates with the original vectors
+    EMBEDDING_MODEL         SentenceTransformer model name
+    EMBEDDING_BACKEND       'torch', 'onnx' or 'onnx-int8'
+    EMBEDDING_THREADS       onnxruntime threads per encode
+    EMBEDDING_WORKERS       Threads running query encoding
+    EMBEDDING_BATCH_SIZE    Most query texts encoded together (1: no batching)
+    EMBEDDING_BATCH_WAIT_MS Longest wait for a query batch to fill
+    EMBEDDING_STORE_PATH    SQLite embedding store shared with ingestion
+    EMBEDDING_CACHE_BYTES   Memory budget of the query embedding cache (0 disables it)
+    EMBEDDING_CACHE_TTL     Seconds a cached query embedding stays valid
+    CHUNK_STORE_DIR         Chunk store written by ingestion (texts not in Qdrant)
+    LANGUAGE_MODEL          Gemini model name
+    ANSWER_CACHE_SIZE       Semantic answer cache entries (0 disables it)
+    ANSWER_CACHE_THRESHOLD  Question similarity needed to reuse an answer
+    ANSWER_CACHE_TTL        Seconds a cached answer stays valid
+    CORPUS_VERSION_CHECK_INTERVAL
+                            Seconds between checks of the collection's corpus version
+    CONTEXT_TOKEN_BUDGET    Estimated prompt tokens of retrieved text
+    SESSION_STORE_PATH      SQLite file of conversation sessions (default: in memory)
+    MAX_SESSIONS            Most conversation sessions kept
+    SESSION_TTL             Seconds a session is kept after its last turn
+    SESSION_REUSE_THRESHOLD Follow-up similarity needed to reuse earlier chunks
+    QUERY_ROUTING           'true' to search only the sections a question is routed to
+    ROUTING_MIN_SIMILARITY  Centroid similarity needed to route a question
+    ROUTING_MARGIN          Similarity margin of the other sections searched
+    ROUTING_RULES_PATH      JSON file of extra query routing keyword rules
+    BATCH_CONCURRENCY       Most concurrent LLM calls of a /chat/batch call
+    BATCH_CHUNK_SIZE        Questions of a batch embedded and searched together
+
+The Qdrant transport (QDRANT_PREFER_GRPC, connection pool sizes) is read by
+qdrant_clients.py.
+
+The module only depends on python-dotenv, so the API process can read its
+configuration before importing the model stack.
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def boolean(value: str) -> bool:
+    value = value.strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(value)
+
+
+# RAG keyword argument -> (environment variable, type)
+ENV_SETTINGS = {
+    "vector_db_url": ("QDRANT_URL", str),
+    "vector_db_collection": ("QDRANT_COLLECTION", str),
+    "vector_db_backend": ("VECTOR_DB_BACKEND", str),
+    "local_index_dir": ("LOCAL_INDEX_DIR", str),
+    "local_index_metric": ("LOCAL_INDEX_METRIC", str),
+    "retrieval_mode": ("RETRIEVAL_MODE", str),
+    "retrieval_fusion": ("RETRIEVAL_FUSION", str),
+    "rrf_k": ("RRF_K", int),
+    "hybrid_prefetch_limit": ("HYBRID_PREFETCH_LIMIT", int),
+    "search_hnsw_ef": ("SEARCH_HNSW_EF", int),
+    "search_oversampling": ("SEARCH_OVERSAMPLING", float),
+    "search_rescore": ("SEARCH_RESCORE", boolean),
+    "embedding_model_name": ("EMBEDDING_MODEL", str),
+    "embedding_backend": ("EMBEDDING_BACKEND", str),
+    "embedding_threads": ("EMBEDDING_THREADS", int),
+    "embedding_workers": ("EMBEDDING_WORKERS", int),
+    "embedding_batch_size": ("EMBEDDING_BATCH_SIZE", int),
+    "embedding_batch_wait_ms": ("EMBEDDING_BATCH_WAIT_MS", float),
+    "embedding_store_path": ("EMBEDDING_STORE_PATH", str),
+    "embedding_cache_bytes": ("EMBEDDING_CACHE_BYTES", int),
+    "embedding_cache_ttl": ("EMBEDDING_CACHE_TTL", float),
+    "chunk_store_dir": ("CHUNK_STORE_DIR", str),
+    "language_model_name": ("LANGUAGE_MODEL", str),
+    "answer_cache_size": ("ANSWER_CACHE_SIZE", int),
+    "answer_cache_threshold": ("ANSWER_CACHE_THRESHOLD", float),
+    "answer_cache_ttl": ("ANSWER_CACHE_TTL", float),
+    "corpus_version_check_interval": ("CORPUS_VERSION_CHECK_INTERVAL", float),
+    "context_token_budget": ("CONTEXT_TOKEN_BUDGET", int),
+    "session_store_path": ("SESSION_STORE_PATH", str),
+    "max_sessions": ("MAX_SESSIONS", int),
+    "session_ttl": ("SESSION_TTL", float),
+    "session_reuse_threshold": ("SESSION_REUSE_THRESHOLD", float),
+    "query_routing": ("QUERY_ROUTING", boolean),
+    "routing_min_similarity": ("ROUTING_MIN_SIMILARITY", float),
+    "routing_margin": ("ROUTING_MARGIN", float),
+    "routing_rules_path": ("ROUTING_RULES_PATH", str),
+    "batch_concurrency": ("BATCH_CONCURRENCY", int),
+    "batch_chunk_size": ("BATCH_CHUNK_SIZE", int),
+}
+
+
+def rag_settings_from_env(environ=None) -> dict:
+    """
+    RAG keyword arguments for every setting present in the environment.
+
+    Args:
+        environ: Mapping to read instead of os.environ
+
+    Returns:
+        Dict to pass as RAG(**settings)
+    """
+    environ = os.environ if environ is None else environ
+    settings = {}
+    for argument, (variable, cast) in ENV_SETTINGS.items():
+        value = environ.get(variable)
+        if value not in (None, ""):
+            try:
+                settings[argument] = cast(value)
+            except ValueError:
+                raise ValueError(f"{variable}={value!r} is not a valid {cast.__name__}") from None
+    return settings
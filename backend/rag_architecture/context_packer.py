@@ -0,0 +1,231 @@
+"""
+Token-budgeted packing of retrieved chunks into the prompt context.
+
+Retrieved chunks vary from a few lines to multi-page sections (the
+important dates table, the contacts list), and overlapping chunks repeat
+text. The ContextPacker splits the chunks into sentences (table rows and
+list items count as sentences), drops repeated ones and, if the rest does
+not fit in the token budget, keeps the sentences most similar to the query.
+Kept sentences are emitted in their original order under a short label
+built from the chunk's section header.
+"""
+
+import re
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+from .cache import normalize_query
+
+# Sentence ends within a line.
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"(\[])')
+
+# Periods that do not end a sentence.
+ABBREVIATIONS = ("dr.", "mr.", "mrs.", "ms.", "prof.", "st.", "e.g.", "i.e.", "etc.", "vs.", "no.")
+
+MAX_LABEL_CHARS = 80
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate LLM token count (about 4 characters per token for English)."""
+    return (len(text) + 3) // 4
+
+
+def split_sentences(text: str) -> list:
+    """
+    Split a chunk into sentences.
+
+    Lines are units of their own (table rows, list items, headers) unless
+    they continue a hard-wrapped sentence: a line starting in lower case,
+    or following one that ends with a comma, is joined to the previous one.
+    """
+    lines = []
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if not line:
+            continue
+        if lines and (line[0].islower() or lines[-1].endswith(",")):
+            lines[-1] += " " + line
+        else:
+            lines.append(line)
+
+    sentences = []
+    for line in lines:
+        pieces = SENTENCE_END.split(line)
+        sentences.append(pieces[0])
+        for piece in pieces[1:]:
+            if sentences[-1].lower().endswith(ABBREVIATIONS):
+                sentences[-1] += " " + piece
+            else:
+                sentences.append(piece)
+    return sentences
+
+
+@dataclass
+class Sentence:
+    chunk: int
+    text: str
+    tokens: int
+
+
+@dataclass
+class PackedContext:
+    """
+    Result of packing a request's chunks.
+
+    Attributes:
+        text: Context section of the prompt
+        tokens: Estimated tokens of `text`
+        original_tokens: Estimated tokens of the chunks pasted verbatim
+        sentences: Sentences kept
+        dropped_duplicates: Sentences dropped as repeats
+        dropped_for_budget: Sentences dropped to fit the budget
+    """
+    text: str
+    tokens: int
+    original_tokens: int
+    sentences: int = 0
+    dropped_duplicates: int = 0
+    dropped_for_budget: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.original_tokens - self.tokens)
+
+
+class ContextPacker:
+    """
+    Builds the prompt context from retrieved chunks within a token budget.
+
+    Sentences are only embedded when the deduplicated text exceeds the
+    budget; `embed` is whatever the caller embeds queries with, so sentence
+    embeddings share its caches (and, in `pack_async`, its batcher).
+
+    Args:
+        token_budget: Estimated tokens the context may use (None: no limit,
+            only deduplication and labels)
+
+    Attributes:
+        requests: Number of contexts packed
+        compressed_requests: Number of contexts that had to drop sentences
+        original_tokens: Total estimated tokens of the verbatim chunks
+        packed_tokens: Total estimated tokens of the packed contexts
+    """
+
+    def __init__(self, token_budget: int = 800):
+        self.token_budget = token_budget
+        self.requests = 0
+        self.compressed_requests = 0
+        self.original_tokens = 0
+        self.packed_tokens = 0
+        self._lock = threading.Lock()
+
+    def pack(self, chunks: list, query_vector=None, embed=None) -> PackedContext:
+        """
+        Pack retrieved chunks into a prompt context.
+
+        Args:
+            chunks: (header, document_title, content, score) tuples, best first
+            query_vector: Embedding of the user's question
+            embed: Function mapping a list of sentences to their embeddings;
+                used with `query_vector` to rank sentences when over budget
+                (without them, earlier chunks are kept first)
+
+        Returns:
+            PackedContext
+        """
+        sentences, duplicates = self._candidates(chunks)
+        sentence_vectors = None
+        if self._over_budget(sentences) and embed is not None and query_vector is not None:
+            sentence_vectors = embed([sentence.text for sentence in sentences])
+        return self._assemble(chunks, sentences, duplicates, query_vector, sentence_vectors)
+
+    async def pack_async(self, chunks: list, query_vector=None, embed=None) -> PackedContext:
+        """Async version of `pack`; `embed` is a coroutine function."""
+        sentences, duplicates = self._candidates(chunks)
+        sentence_vectors = None
+        if self._over_budget(sentences) and embed is not None and query_vector is not None:
+            sentence_vectors = await embed([sentence.text for sentence in sentences])
+        return self._assemble(chunks, sentences, duplicates, query_vector, sentence_vectors)
+
+    def _candidates(self, chunks: list):
+        # Overlapping chunks repeat whole sentences; keep the first copy.
+        sentences, seen, duplicates = [], set(), 0
+        for i, chunk in enumerate(chunks):
+            for text in split_sentences(chunk[2]):
+                key = re.sub(r'[^\w ]', '', normalize_query(text))
+                if key in seen:
+                    duplicates += 1
+                    continue
+                seen.add(key)
+                sentences.append(Sentence(i, text, estimate_tokens(text)))
+        return sentences, duplicates
+
+    def _over_budget(self, sentences) -> bool:
+        return self.token_budget is not None and sum(sentence.tokens for sentence in sentences) > self.token_budget
+
+    def _assemble(self, chunks, sentences, duplicates, query_vector, sentence_vectors) -> PackedContext:
+        kept = self._select(sentences, query_vector, sentence_vectors)
+
+        documents = {chunk[1] for chunk in chunks}
+        sections = []
+        for i, chunk in enumerate(chunks):
+            texts = [sentence.text for sentence in kept if sentence.chunk == i]
+            if texts:
+                sections.append(f"[{len(sections) + 1}] {self._label(chunk, len(documents) > 1)}\n" + "\n".join(texts))
+        text = "\n\n".join(sections)
+
+        packed = PackedContext(
+            text=text,
+            tokens=estimate_tokens(text),
+            original_tokens=sum(estimate_tokens(chunk[2]) for chunk in chunks),
+            sentences=len(kept),
+            dropped_duplicates=duplicates,
+            dropped_for_budget=len(sentences) - len(kept),
+        )
+        with self._lock:
+            self.requests += 1
+            self.original_tokens += packed.original_tokens
+            self.packed_tokens += packed.tokens
+            self.compressed_requests += packed.dropped_for_budget > 0
+        return packed
+
+    def _select(self, sentences, query_vector, sentence_vectors):
+        if not self._over_budget(sentences):
+            return sentences
+        if query_vector is None or sentence_vectors is None:
+            # Nothing to score with: keep sentences in retrieval order.
+            scores = -np.arange(len(sentences), dtype=np.float32)
+        else:
+            vectors = np.asarray(sentence_vectors, dtype=np.float32)
+            query = np.asarray(query_vector, dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+            scores = vectors @ query / np.clip(norms, 1e-12, None)
+
+        kept, used = set(), 0
+        for i in np.argsort(-scores, kind="stable"):
+            if used + sentences[i].tokens <= self.token_budget:
+                kept.add(int(i))
+                used += sentences[i].tokens
+        return [sentence for i, sentence in enumerate(sentences) if i in kept]
+
+    @staticmethod
+    def _label(chunk, with_document: bool) -> str:
+        header, document_title = chunk[0], chunk[1]
+        label = " ".join((header or "").split()) or "Untitled section"
+        if len(label) > MAX_LABEL_CHARS:
+            label = label[:MAX_LABEL_CHARS - 3].rstrip() + "..."
+        return f"{label} ({document_title})" if with_document and document_title else label
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "compressed_requests": self.compressed_requests,
+                "token_budget": self.token_budget,
+                "original_tokens": self.original_tokens,
+                "packed_tokens": self.packed_tokens,
+                "tokens_saved": self.original_tokens - self.packed_tokens,
+                "mean_tokens_saved": (self.original_tokens - self.packed_tokens) / self.requests if self.requests else 0.0,
+            }
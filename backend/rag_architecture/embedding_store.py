@@ -0,0 +1,175 @@
+"""
+Persistent embedding store shared by ingestion and serving.
+
+Embeddings are stored in SQLite keyed by (model name, SHA-256 of the text),
+so a text encoded once -- during ingestion, in a notebook, or at backend
+startup -- is never encoded again by any process pointed at the same file.
+The database runs in WAL mode so many readers can use it while one process
+writes.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    SQLite-backed embedding cache with bulk get/put and a size cap.
+
+    Each thread gets its own connection. When the number of stored
+    embeddings exceeds `max_entries`, the least recently used tenth is
+    evicted. The count is only read from the table at open and when an
+    in-memory upper bound of it (every row written counts as new) crosses
+    `max_entries`, not on every write.
+
+    Args:
+        path: SQLite database file (created if missing)
+        max_entries: Maximum number of stored embeddings
+        touch_interval: Minimum seconds between last-access updates of an
+            entry, so hot reads do not turn into constant writes
+    """
+
+    def __init__(self, path: str, max_entries: int = 500_000, touch_interval: float = 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._count_lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash BLOB NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                ) WITHOUT ROWID"""
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)"
+            )
+        self._estimated_count = len(self)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def text_hash(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, model_name: str, texts: list) -> list:
+        """
+        Look up the embeddings of several texts at once.
+
+        Returns:
+            One float32 vector per text, or None where it is not stored
+        """
+        if not texts:
+            return []
+        hashes = [self.text_hash(text) for text in texts]
+        connection = self._connection()
+        found = {}
+        # Stay well below SQLite's bound-parameter limit.
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = connection.execute(
+                f"SELECT text_hash, vector, last_access FROM embeddings "
+                f"WHERE model = ? AND text_hash IN ({placeholders})",
+                [model_name, *chunk],
+            ).fetchall()
+            for text_hash, vector, last_access in rows:
+                found[text_hash] = (np.frombuffer(vector, dtype=np.float32), last_access)
+
+        now = time.time()
+        stale = [(now, model_name, h) for h, (_, last_access) in found.items() if now - last_access > self.touch_interval]
+        if stale:
+            with connection:
+                connection.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?", stale
+                )
+
+        return [found[h][0] if h in found else None for h in hashes]
+
+    def put_many(self, model_name: str, texts: list, vectors):
+        """Store the embeddings of several texts in one transaction."""
+        if not len(texts):
+            return
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            vector = np.asarray(vector, dtype=np.float32)
+            rows.append((model_name, self.text_hash(text), vector.shape[0], vector.tobytes(), now))
+
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        with self._count_lock:
+            # Replaced rows are counted too, so this never underestimates
+            # this process's writes.
+            self._estimated_count += len(rows)
+            over_limit = self._estimated_count > self.max_entries
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        """Drop the least recently used entries once `max_entries` is exceeded."""
+        connection = self._connection()
+        count = len(self)
+        if count > self.max_entries:
+            excess = count - self.max_entries + self.max_entries // 10
+            with connection:
+                connection.execute(
+                    "DELETE FROM embeddings WHERE (model, text_hash) IN ("
+                    "SELECT model, text_hash FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (excess,),
+                )
+            count -= excess
+        with self._count_lock:
+            self._estimated_count = count
+
+    def __len__(self):
+        (count,) = self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+    def encode(self, model, model_name: str, texts: list, batch_size: int = 32) -> np.ndarray:
+        """
+        Embed texts, encoding only those not already in the store.
+
+        Args:
+            model: Embedding model with an `encode(list_of_texts)` method
+            model_name: Name the embeddings are stored under
+            texts: Texts to embed
+            batch_size: Batch size passed to `model.encode`
+
+        Returns:
+            Array of shape (len(texts), embedding_dim)
+        """
+        vectors = self.get_many(model_name, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            encoded = model.encode([texts[i] for i in missing], batch_size=batch_size)
+            self.put_many(model_name, [texts[i] for i in missing], encoded)
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+        return np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
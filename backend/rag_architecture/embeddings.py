@@ -0,0 +1,247 @@
+"""
+Embedding model backends.
+
+- 'torch': sentence-transformers on PyTorch (the reference implementation)
+- 'onnx': the same network exported to ONNX and run with onnxruntime
+- 'onnx-int8': the ONNX export with its weights dynamically quantized to int8
+
+The ONNX backends only need onnxruntime, tokenizers and huggingface_hub, so
+a serving image built with requirements_onnx.txt instead of
+requirements_h.txt does not ship PyTorch. 'onnx' matches 'torch' to float
+precision; 'onnx-int8' differs slightly (see
+backend/benchmarks/bench_embedding_backends.py for the tolerance check), so
+its embeddings are cached under their own key.
+
+Exported models are kept in EMBEDDING_MODEL_DIR (default
+~/.cache/csc2701/embeddings) and created on first use, or ahead of time:
+
+    python -m backend.rag_architecture.embeddings all-MiniLM-L6-v2 --quantize
+"""
+
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+DEFAULT_MODEL_DIR = os.path.join(os.path.expanduser("~"), ".cache", "csc2701", "embeddings")
+
+# Hub files copied next to the ONNX model; only tokenizer.json is required.
+MODEL_CONFIG_FILES = {
+    "tokenizer.json": "tokenizer.json",
+    "sentence_bert_config.json": "sentence_bert_config.json",
+    "modules.json": "modules.json",
+    "1_Pooling/config.json": "pooling_config.json",
+}
+
+
+def embedding_model_key(model_name: str, backend: str = "torch") -> str:
+    """
+    Name embeddings of `model_name` are cached and stored under.
+
+    'onnx' reproduces the torch embeddings, so both share a key; int8
+    embeddings are kept apart.
+    """
+    return f"{model_name}@{backend}" if backend == "onnx-int8" else model_name
+
+
+def onnx_model_dir(model_name: str) -> str:
+    base_dir = os.getenv("EMBEDDING_MODEL_DIR", DEFAULT_MODEL_DIR)
+    return os.path.join(base_dir, model_name.replace("/", "__") + "-onnx")
+
+
+def export_onnx_model(model_name: str, output_dir: str = None, quantize: bool = False) -> str:
+    """
+    Write the ONNX export of a sentence-transformers model to `output_dir`.
+
+    The export published on the Hugging Face Hub (onnx/model.onnx) is used
+    when there is one; otherwise the model is exported locally, which needs
+    sentence-transformers[onnx] (and PyTorch) on the exporting machine.
+    An existing export is reused as is.
+
+    Args:
+        model_name: Model name or Hub repo id ('all-MiniLM-L6-v2')
+        output_dir: Target directory (default: `onnx_model_dir(model_name)`)
+        quantize: Also write model_int8.onnx with dynamically quantized weights
+
+    Returns:
+        The model directory
+    """
+    from huggingface_hub import hf_hub_download
+    from huggingface_hub.errors import EntryNotFoundError
+
+    output_dir = output_dir or onnx_model_dir(model_name)
+    repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    os.makedirs(output_dir, exist_ok=True)
+
+    model_path = os.path.join(output_dir, "model.onnx")
+    if not os.path.exists(model_path):
+        for hub_file, local_file in MODEL_CONFIG_FILES.items():
+            try:
+                shutil.copyfile(hf_hub_download(repo_id, hub_file), os.path.join(output_dir, local_file))
+            except EntryNotFoundError:
+                if hub_file == "tokenizer.json":
+                    raise
+        try:
+            shutil.copyfile(hf_hub_download(repo_id, "onnx/model.onnx"), model_path)
+        except EntryNotFoundError:
+            from sentence_transformers import SentenceTransformer
+
+            export_dir = os.path.join(output_dir, "export")
+            SentenceTransformer(model_name, backend="onnx").save_pretrained(export_dir)
+            shutil.copyfile(os.path.join(export_dir, "onnx", "model.onnx"), model_path)
+
+    quantized_path = os.path.join(output_dir, "model_int8.onnx")
+    if quantize and not os.path.exists(quantized_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        # Weights are stored as int8, activations are quantized per batch
+        # at run time, so no calibration data is needed.
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+
+    return output_dir
+
+
+class OnnxEmbeddingModel:
+    """
+    Sentence embedding model running an ONNX export with onnxruntime.
+
+    Mirrors the parts of SentenceTransformer this project uses: `encode`
+    tokenizes (truncating to `max_seq_length`), runs the transformer, pools
+    the token embeddings as configured (mean or CLS) and L2-normalizes them
+    if the model does.
+
+    Args:
+        model_dir: Directory written by `export_onnx_model`
+        quantized: Run model_int8.onnx instead of model.onnx
+        threads: onnxruntime intra-op threads per encode call (None: one per
+            physical core). Keep threads * concurrent encodes <= cores.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = False, threads: int = None):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.model_dir = model_dir
+        config = self._read_json("sentence_bert_config.json")
+        pooling = self._read_json("pooling_config.json")
+        modules = self._read_json("modules.json") or []
+
+        self.max_seq_length = config.get("max_seq_length", 512)
+        if pooling.get("pooling_mode_cls_token"):
+            self.pooling = "cls"
+        elif pooling.get("pooling_mode_mean_tokens", True):
+            self.pooling = "mean"
+        else:
+            raise ValueError(f"Unsupported pooling in {model_dir}: {pooling}")
+        self.normalize = any(module.get("type", "").endswith(".Normalize") for module in modules)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token=self.tokenizer.id_to_token(pad_id) or "[PAD]")
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads or 0
+        options.inter_op_num_threads = 1
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_file = "model_int8.onnx" if quantized else "model.onnx"
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        output_names = [output.name for output in self.session.get_outputs()]
+        self.output_name = "last_hidden_state" if "last_hidden_state" in output_names else output_names[0]
+
+    def _read_json(self, name: str):
+        path = os.path.join(self.model_dir, name)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.session.get_outputs()[0].shape[-1]
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs) -> np.ndarray:
+        """
+        Embed one text or a list of texts.
+
+        Texts are sorted by length so each batch pads to similar lengths.
+        Other SentenceTransformer.encode arguments are accepted and ignored.
+
+        Returns:
+            float32 array of shape (embedding_dim,) for a single text, else
+            (len(sentences), embedding_dim)
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        embeddings = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            for i, embedding in zip(batch, self._encode_batch([texts[i] for i in batch])):
+                embeddings[i] = embedding
+        if not embeddings:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        embeddings = np.stack(embeddings)
+        return embeddings[0] if single else embeddings
+
+    def _encode_batch(self, texts: list) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        token_embeddings = self.session.run(
+            [self.output_name], {name: value for name, value in inputs.items() if name in self.input_names}
+        )[0]
+
+        if self.pooling == "cls":
+            embeddings = token_embeddings[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(token_embeddings.dtype)
+            embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype(np.float32)
+
+
+def load_embedding_model(model_name: str, backend: str = "torch", threads: int = None, model_dir: str = None):
+    """
+    Load an embedding model with the given backend.
+
+    Args:
+        model_name: sentence-transformers model name
+        backend: One of EMBEDDING_BACKENDS
+        threads: onnxruntime threads per encode call (ONNX backends only)
+        model_dir: Directory of the ONNX export (default: `onnx_model_dir`);
+            exported there if missing
+
+    Returns:
+        A model with a SentenceTransformer-compatible `encode`
+    """
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(model_name)
+    if backend in ("onnx", "onnx-int8"):
+        quantized = backend == "onnx-int8"
+        model_dir = export_onnx_model(model_name, model_dir, quantize=quantized)
+        return OnnxEmbeddingModel(model_dir, quantized=quantized, threads=threads)
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a sentence-transformers model to ONNX.")
+    parser.add_argument("model", nargs="?", default="all-MiniLM-L6-v2")
+    parser.add_argument("--output-dir", default=None)
+    parser.add_argument("--quantize", action="store_true", help="Also write the int8 quantized model")
+    args = parser.parse_args()
+    print(export_onnx_model(args.model, args.output_dir, quantize=args.quantize))
@@ -0,0 +1,234 @@
+"""
+Shared access to the Gemini API.
+
+All Gemini calls in the backend go through the client returned by
+`get_client`. It is created lazily, once per process, and its sync and
+async HTTP connection pools keep connections alive between calls, so a
+question no longer pays connection (and TLS) setup for every LLM call.
+
+The pool is configured from the environment:
+- GEMINI_API_KEY (falls back to ADI_GOOGLE_AI_STUDIO_API_KEY)
+- GEMINI_BASE_URL: point the client at another server, e.g. a local fake
+- GEMINI_MAX_CONNECTIONS, GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+  GEMINI_KEEPALIVE_EXPIRY: connection-pool sizing
+
+Tests and benchmarks can call `configure` to swap in a different base URL
+or an httpx transport. The async pool is tied to the event loop that first
+uses it, so code that runs several event loops must call `configure` (which
+drops the client) before switching loops.
+"""
+
+import os
+import threading
+import httpx
+from dotenv import load_dotenv
+from google import genai
+from google.genai import types
+
+load_dotenv()
+
+_client = None
+_client_lock = threading.Lock()
+_client_options = {}
+
+
+def configure(
+    api_key: str = None,
+    base_url: str = None,
+    transport: httpx.BaseTransport = None,
+    async_transport: httpx.AsyncBaseTransport = None,
+    max_connections: int = None,
+    max_keepalive_connections: int = None,
+    keepalive_expiry: float = None,
+    ):
+    """
+        Set the options of the shared client and drop the current one.
+
+        The next `get_client` call builds a new client with these options;
+        options left as None fall back to the environment.
+
+        Args:
+            api_key: Gemini API key
+            base_url: base URL of the Gemini API (or of a fake server)
+            transport: httpx transport used by the sync client
+            async_transport: httpx transport used by the async client
+            max_connections: maximum number of open connections per pool
+            max_keepalive_connections: maximum number of idle connections kept alive
+            keepalive_expiry: seconds an idle connection is kept alive
+    """
+    global _client, _client_options
+
+    with _client_lock:
+        _client_options = {
+            "api_key": api_key,
+            "base_url": base_url,
+            "transport": transport,
+            "async_transport": async_transport,
+            "max_connections": max_connections,
+            "max_keepalive_connections": max_keepalive_connections,
+            "keepalive_expiry": keepalive_expiry,
+        }
+        _client = None
+
+
+def get_client() -> genai.Client:
+    """Return the process-wide Gemini client, creating it on first use."""
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_client(**_client_options)
+    return _client
+
+
+def _build_client(
+    api_key: str = None,
+    base_url: str = None,
+    transport: httpx.BaseTransport = None,
+    async_transport: httpx.AsyncBaseTransport = None,
+    max_connections: int = None,
+    max_keepalive_connections: int = None,
+    keepalive_expiry: float = None,
+    ) -> genai.Client:
+    limits = httpx.Limits(
+        max_connections=max_connections or int(os.environ.get("GEMINI_MAX_CONNECTIONS", 20)),
+        max_keepalive_connections=max_keepalive_connections or int(os.environ.get("GEMINI_MAX_KEEPALIVE_CONNECTIONS", 10)),
+        keepalive_expiry=keepalive_expiry or float(os.environ.get("GEMINI_KEEPALIVE_EXPIRY", 60)),
+    )
+
+    client_args = {"limits": limits}
+    async_client_args = {"limits": limits}
+    if transport is not None:
+        client_args["transport"] = transport
+    if async_transport is not None:
+        async_client_args["transport"] = async_transport
+
+    return genai.Client(
+        api_key=api_key or os.environ.get("GEMINI_API_KEY") or os.environ.get("ADI_GOOGLE_AI_STUDIO_API_KEY"),
+        http_options=types.HttpOptions(
+            base_url=base_url or os.environ.get("GEMINI_BASE_URL"),
+            client_args=client_args,
+            async_client_args=async_client_args,
+        ),
+    )
+
+
+def _llm_request(user_prompt: str, temperature: float):
+    contents = [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(text=user_prompt),
+            ],
+        ),
+    ]
+    generate_content_config = types.GenerateContentConfig(
+        temperature=temperature,
+        thinking_config = types.ThinkingConfig(
+            thinking_budget=0,
+        ),
+    )
+    return contents, generate_content_config
+
+
+def stream_llm(
+    user_prompt: str,
+    model: str = "gemini-2.5-flash-lite",
+    temperature: float = 0.5,
+    ):
+    """
+        Stream a response from the Gemini model as it is generated.
+
+        Args:
+            user_prompt: the prompt to generate a response from the Gemini model.
+            temperature: the temperature setting passed to the Gemini API
+
+        Yields:
+            Text pieces of the response, in order, as soon as Gemini produces them.
+    """
+
+    client = get_client()
+    contents, generate_content_config = _llm_request(user_prompt, temperature)
+
+    for chunk in client.models.generate_content_stream(
+        model=model,
+        contents=contents,
+        config=generate_content_config,
+    ):
+        if chunk.text:
+            yield chunk.text
+
+
+async def stream_llm_async(
+    user_prompt: str,
+    model: str = "gemini-2.5-flash-lite",
+    temperature: float = 0.5,
+    ):
+    """
+        Async version of `stream_llm` that does not block the event loop.
+
+        Args:
+            user_prompt: the prompt to generate a response from the Gemini model.
+            temperature: the temperature setting passed to the Gemini API
+
+        Yields:
+            Text pieces of the response, in order, as soon as Gemini produces them.
+    """
+
+    client = get_client()
+    contents, generate_content_config = _llm_request(user_prompt, temperature)
+
+    async for chunk in await client.aio.models.generate_content_stream(
+        model=model,
+        contents=contents,
+        config=generate_content_config,
+    ):
+        if chunk.text:
+            yield chunk.text
+
+
+def ask_llm(
+    user_prompt: str,
+    model: str = "gemini-2.5-flash-lite",
+    temperature: float = 0.5,
+    ):
+    """
+        Generate a response from the Gemini model.
+
+        Args:
+            user_prompt: the prompt to generate a response from the Gemini model.
+            temperature: the temperature setting passed to the Gemini API
+
+        Returns:
+            The response from the Gemini model.
+    """
+
+    return "".join(stream_llm(user_prompt, model=model, temperature=temperature))
+
+
+async def ask_llm_async(
+    user_prompt: str,
+    model: str = "gemini-2.5-flash-lite",
+    temperature: float = 0.5,
+    ):
+    """
+        Async version of `ask_llm` that does not block the event loop.
+
+        Args:
+            user_prompt: the prompt to generate a response from the Gemini model.
+            temperature: the temperature setting passed to the Gemini API
+
+        Returns:
+            The response from the Gemini model.
+    """
+
+    response = ""
+    async for text in stream_llm_async(user_prompt, model=model, temperature=temperature):
+        response += text
+
+    return response
+
+
+if __name__ == "__main__":
+    print(ask_llm(user_prompt="What is the capital of France?"))
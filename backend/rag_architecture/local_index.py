@@ -0,0 +1,229 @@
+"""
+In-process vector index, an alternative retrieval backend to Qdrant.
+
+For a corpus the size of the handbook, a network round-trip to Qdrant costs
+more than the search itself. LocalVectorIndex keeps every chunk embedding in
+one contiguous, pre-normalized matrix saved as a `.npy` file that is
+memory-mapped on load, and scores all chunks against all query vectors with
+a single matrix product.
+
+Index directory layout:
+- CURRENT: name of the build being served, replaced atomically by `build`
+- builds/<name>/vectors.npy: (n, d) unit-length embeddings, float32 or float16
+- builds/<name>/norms.npy: (n,) original embedding norms, for dot product / euclidean
+- builds/<name>/meta.json: point ids, payloads, dtype and corpus version
+
+A build is written in full under a new name before CURRENT points to it, so
+a reader always loads the three files of one build. The previous build is
+kept for readers that resolved CURRENT just before the switch.
+"""
+
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import QueryResponse, ScoredPoint
+
+METRICS = ("cosine_similarity", "dot_product", "euclidean_distance")
+CURRENT_FILE = "CURRENT"
+BUILDS_DIR = "builds"
+
+
+def has_index(index_dir: str) -> bool:
+    """Whether `index_dir` holds a build written by `LocalVectorIndex.build`."""
+    return os.path.exists(os.path.join(index_dir, CURRENT_FILE))
+
+
+def current_build(index_dir: str) -> str:
+    """Name of the build CURRENT points to."""
+    with open(os.path.join(index_dir, CURRENT_FILE), encoding="utf-8") as file:
+        return file.read().strip()
+
+
+class LocalVectorIndex:
+    """
+    Memory-mapped embedding matrix with vectorized top-k search.
+
+    Supports the same metrics as SimilarityMeasure. Vectors are stored
+    normalized, so cosine similarity is a plain matrix product; dot product
+    and euclidean distance are recovered from the stored norms.
+
+    Args:
+        index_dir: Directory written by `build`
+        metric: 'cosine_similarity', 'dot_product' or 'euclidean_distance'
+        mmap: Memory-map the matrix instead of reading it into RAM
+
+    Attributes:
+        corpus_version: Corpus version the index was built from
+        build_name: Name of the loaded build
+    """
+
+    def __init__(self, index_dir: str, metric: str = "cosine_similarity", mmap: bool = True):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+        self.index_dir = index_dir
+        self.metric = metric
+        self.mmap = mmap
+        self.load()
+
+    def load(self):
+        build_name = current_build(self.index_dir)
+        build_dir = os.path.join(self.index_dir, BUILDS_DIR, build_name)
+        with open(os.path.join(build_dir, "meta.json"), encoding="utf-8") as file:
+            meta = json.load(file)
+        mmap_mode = "r" if self.mmap else None
+        self.vectors = np.load(os.path.join(build_dir, "vectors.npy"), mmap_mode=mmap_mode)
+        self.norms = np.load(os.path.join(build_dir, "norms.npy"))
+        self.ids = meta["ids"]
+        self.payloads = meta["payloads"]
+        self.corpus_version = meta.get("corpus_version")
+        self.build_name = build_name
+
+    def refresh(self):
+        """Reload the index if it was rebuilt on disk; returns the corpus version."""
+        if current_build(self.index_dir) != self.build_name:
+            self.load()
+        return self.corpus_version
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(
+            cls,
+            index_dir: str,
+            ids: list,
+            embeddings,
+            payloads: list,
+            dtype: str = "float32",
+            corpus_version: str = None
+        ):
+        """
+        Write a new build of an index directory and switch CURRENT to it.
+
+        Builds older than the one being replaced are deleted.
+
+        Args:
+            index_dir: Directory to write to (created if missing)
+            ids: Point id of each embedding
+            embeddings: (n, d) array of chunk embeddings
+            payloads: Payload dict of each embedding
+            dtype: 'float32' or 'float16' storage for the matrix
+            corpus_version: Version stamp stored with the index
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1)
+        vectors = embeddings / np.where(norms == 0, 1.0, norms)[:, None]
+
+        build_name = uuid.uuid4().hex
+        build_dir = os.path.join(index_dir, BUILDS_DIR, build_name)
+        os.makedirs(build_dir)
+        np.save(os.path.join(build_dir, "vectors.npy"), np.ascontiguousarray(vectors, dtype=dtype))
+        np.save(os.path.join(build_dir, "norms.npy"), norms.astype(np.float32))
+        meta = {
+            "ids": list(ids),
+            "payloads": list(payloads),
+            "dtype": dtype,
+            "corpus_version": corpus_version or uuid.uuid4().hex,
+        }
+        with open(os.path.join(build_dir, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+
+        previous = current_build(index_dir) if has_index(index_dir) else None
+        tmp_path = os.path.join(index_dir, f".{CURRENT_FILE}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(build_name)
+        os.replace(tmp_path, os.path.join(index_dir, CURRENT_FILE))
+
+        for name in os.listdir(os.path.join(index_dir, BUILDS_DIR)):
+            if name not in (build_name, previous):
+                shutil.rmtree(os.path.join(index_dir, BUILDS_DIR, name), ignore_errors=True)
+
+    @classmethod
+    def export_from_qdrant(
+            cls,
+            client: QdrantClient,
+            collection_name: str,
+            index_dir: str,
+            vector_name: str = "mscac-dense-vector",
+            dtype: str = "float32",
+            corpus_version: str = None
+        ):
+        """Build an index from the points of an existing Qdrant collection."""
+        ids, embeddings, payloads = [], [], []
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=256,
+                offset=offset,
+                with_payload=True,
+                with_vectors=[vector_name],
+            )
+            for point in points:
+                ids.append(point.id)
+                embeddings.append(point.vector[vector_name])
+                payloads.append(point.payload)
+            if offset is None:
+                break
+        cls.build(index_dir, ids, embeddings, payloads, dtype=dtype, corpus_version=corpus_version)
+
+    def scores(self, query_vectors) -> np.ndarray:
+        """
+        Score every indexed vector against every query vector.
+
+        Returns:
+            (num_queries, num_points) array, higher = more similar
+        """
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        query_norms = np.linalg.norm(query_vectors, axis=1)
+        unit_queries = query_vectors / np.where(query_norms == 0, 1.0, query_norms)[:, None]
+
+        # (q, d) @ (d, n): one product for all queries and all chunks. The
+        # (small) queries are cast to the matrix dtype so a float16 matrix is
+        # read straight from the mmap, never converted as a whole.
+        cosine = (unit_queries.astype(self.vectors.dtype, copy=False) @ self.vectors.T).astype(np.float32)
+        if self.metric == "cosine_similarity":
+            return cosine
+
+        dot = cosine * self.norms[None, :] * query_norms[:, None]
+        if self.metric == "dot_product":
+            return dot
+
+        squared = query_norms[:, None] ** 2 + self.norms[None, :] ** 2 - 2 * dot
+        return -np.sqrt(np.maximum(squared, 0.0))
+
+    def search(self, query_vectors, top_k: int = 3):
+        """
+        Find the top-k points for each query vector.
+
+        Args:
+            query_vectors: (d,) or (num_queries, d) query embeddings
+            top_k: Number of points per query
+
+        Returns:
+            One QueryResponse per query vector, best match first, in the same
+            shape as Qdrant's query_batch_points
+        """
+        scores = self.scores(query_vectors)
+        top_k = min(top_k, scores.shape[1])
+        if top_k == 0:
+            return [QueryResponse(points=[]) for _ in scores]
+
+        candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        responses = []
+        for row, row_candidates in zip(scores, candidates):
+            order = row_candidates[np.argsort(-row[row_candidates])]
+            responses.append(QueryResponse(points=[
+                ScoredPoint(
+                    id=self.ids[i],
+                    version=0,
+                    score=float(row[i]),
+                    payload=self.payloads[i],
+                )
+                for i in order
+            ]))
+        return responses
@@ -0,0 +1,139 @@
+"""
+Corpus version manifest shared by ingestion and serving.
+
+Every (re-)ingestion of a collection stamps a fresh corpus version into a
+small sidecar collection named `<collection>_meta`. Serving reads it to
+notice that the indexed documents changed, e.g. to invalidate answers that
+were cached against the previous corpus. The manifest also records whether
+the points carry their chunk text, or left it to a ChunkStore, and the
+average chunk length the BM25 sparse vectors were computed with.
+"""
+
+import time
+import uuid
+
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+META_COLLECTION_SUFFIX = "_meta"
+META_VECTOR_NAME = "mscac-dense-vector"
+MANIFEST_POINT_ID = str(uuid.uuid5(uuid.NAMESPACE_URL, "csc2701/manifest"))
+
+
+def meta_collection_name(collection_name: str) -> str:
+    return f"{collection_name}{META_COLLECTION_SUFFIX}"
+
+
+def ensure_meta_collection(client: QdrantClient, collection_name: str, vector_size: int = 384):
+    """Create the sidecar collection of `collection_name` if it does not exist yet."""
+    meta_collection = meta_collection_name(collection_name)
+    if not client.collection_exists(meta_collection):
+        # DOT on pre-normalized vectors; the manifest point itself has a zero vector.
+        client.create_collection(
+            collection_name=meta_collection,
+            vectors_config={
+                META_VECTOR_NAME: VectorParams(size=vector_size, distance=Distance.DOT),
+            },
+        )
+    return meta_collection
+
+
+def bump_corpus_version(
+        client: QdrantClient,
+        collection_name: str,
+        vector_size: int = 384,
+        payload_content: bool = True
+    ) -> str:
+    """
+    Record that `collection_name` was (re-)ingested.
+
+    Args:
+        client: Qdrant client connected to the instance holding the collection
+        collection_name: Name of the ingested collection
+        vector_size: Dimension of the collection's dense vectors
+        payload_content: Whether the points' payloads hold the chunk text
+            (False when it was written to a ChunkStore instead)
+
+    Returns:
+        The new corpus version
+    """
+    corpus_version = uuid.uuid4().hex
+    _update_manifest(
+        client,
+        collection_name,
+        {"corpus_version": corpus_version, "payload_content": payload_content, "updated_at": time.time()},
+        vector_size,
+    )
+    return corpus_version
+
+
+def record_average_document_length(
+        client: QdrantClient,
+        collection_name: str,
+        average_length: float,
+        vector_size: int = 384
+    ) -> float:
+    """
+    Store the average chunk length the collection's BM25 sparse vectors use.
+
+    Recorded by the first ingestion of a collection, before its points are
+    uploaded; later ingestions read it back (`read_average_document_length`)
+    so every sparse vector of the collection is normalized the same way.
+
+    Returns:
+        `average_length`
+    """
+    _update_manifest(client, collection_name, {"average_document_length": average_length}, vector_size)
+    return average_length
+
+
+def _update_manifest(client: QdrantClient, collection_name: str, fields: dict, vector_size: int):
+    # Fields not in `fields` keep their value.
+    meta_collection = ensure_meta_collection(client, collection_name, vector_size)
+    if client.retrieve(meta_collection, ids=[MANIFEST_POINT_ID], with_payload=False):
+        client.set_payload(meta_collection, payload=fields, points=[MANIFEST_POINT_ID], wait=True)
+        return
+    client.upsert(
+        collection_name=meta_collection,
+        points=[
+            PointStruct(
+                id=MANIFEST_POINT_ID,
+                vector={META_VECTOR_NAME: [0.0] * vector_size},
+                payload={"kind": "manifest", "collection": collection_name, **fields},
+            )
+        ],
+        wait=True,
+    )
+
+
+def read_manifest_field(client: QdrantClient, collection_name: str, key: str, default=None):
+    """Return one field of the manifest of `collection_name`, or `default` if it was never set."""
+    meta_collection = meta_collection_name(collection_name)
+    if not client.collection_exists(meta_collection):
+        return default
+    points = client.retrieve(meta_collection, ids=[MANIFEST_POINT_ID], with_payload=[key])
+    return points[0].payload.get(key, default) if points else default
+
+
+def read_corpus_version(client: QdrantClient, collection_name: str):
+    """Return the current corpus version of `collection_name`, or None if never stamped."""
+    return read_manifest_field(client, collection_name, "corpus_version")
+
+
+async def read_corpus_version_async(client: AsyncQdrantClient, collection_name: str):
+    """Async version of `read_corpus_version`."""
+    meta_collection = meta_collection_name(collection_name)
+    if not await client.collection_exists(meta_collection):
+        return None
+    points = await client.retrieve(meta_collection, ids=[MANIFEST_POINT_ID], with_payload=["corpus_version"])
+    return points[0].payload.get("corpus_version") if points else None
+
+
+def read_payload_content(client: QdrantClient, collection_name: str) -> bool:
+    """Whether the points of `collection_name` hold their chunk text (True if the manifest does not say)."""
+    return read_manifest_field(client, collection_name, "payload_content", True)
+
+
+def read_average_document_length(client: QdrantClient, collection_name: str):
+    """Average chunk length of the collection's sparse vectors, or None if none was recorded."""
+    return read_manifest_field(client, collection_name, "average_document_length")
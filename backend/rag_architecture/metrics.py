@@ -0,0 +1,160 @@
+"""
+Latency metrics: Prometheus histograms and per-request timing spans.
+
+Stages are timed with `span`, which observes a histogram in the process-wide
+REGISTRY (served in the Prometheus text format on the API's /metrics) and,
+if the caller has installed a Timings in `request_timings`, records the
+span there too so it can be returned in a `Server-Timing` header.
+
+The module only uses the standard library, so ingestion scripts can record
+their stages without the API's dependencies.
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds in seconds; LLM calls sit in the upper half, local stages in the lower.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+INGEST_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """
+    Prometheus histogram with optional labels.
+
+    Args:
+        name: Metric name
+        documentation: HELP text
+        labelnames: Names of the labels passed to `observe`, in order
+        buckets: Upper bounds of the buckets, in seconds
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., +Inf count], sum
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labelvalues}")
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labelvalues, counts, total in series:
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labelvalues)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                bucket_labels = ",".join(labels + [f'le="{_format_value(bound)}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = "{" + ",".join(labels) + "}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {_format_value(total)}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Set of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        """Return the histogram called `name`, creating it on first use."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, documentation, labelnames, buckets)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+    def write(self, path: str):
+        """Write the metrics to a file, e.g. for node_exporter's textfile collector."""
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.render())
+
+
+REGISTRY = Registry()
+
+RAG_STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "Duration of the stages of a RAG request.", ["stage"]
+)
+INGEST_STAGE_SECONDS = REGISTRY.histogram(
+    "ingest_stage_seconds", "Duration of ingestion stages (per file for parse, per batch for embed).", ["stage"],
+    buckets=INGEST_BUCKETS,
+)
+
+
+class Timings:
+    """Spans recorded while serving one request, in the order they finished."""
+
+    def __init__(self):
+        self.spans = []
+
+    def add(self, name: str, seconds: float):
+        self.spans.append((name, seconds))
+
+    def totals(self) -> dict:
+        """Seconds per span name, summed over repeated spans, in first-seen order."""
+        totals = {}
+        for name, seconds in self.spans:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def server_timing(self, total: float = None) -> str:
+        """Value of a Server-Timing header (durations in milliseconds), optionally with a `total` entry."""
+        totals = self.totals()
+        if total is not None:
+            totals["total"] = total
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+
+# Timings of the request being served in the current context, if any.
+request_timings = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def span(stage: str, histogram: Histogram = RAG_STAGE_SECONDS):
+    """Time the block as `stage`, in `histogram` and in the current request's Timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        histogram.observe(seconds, stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.add(stage, seconds)
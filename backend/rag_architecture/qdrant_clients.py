@@ -0,0 +1,105 @@
+"""
+Shared Qdrant clients.
+
+Serving and ingestion get their clients from here instead of constructing
+`QdrantClient(url)` each time. Sync clients are created once per URL and
+transport and shared by everything in the process; their REST connection
+pool keeps connections alive between requests (the client library turns
+keep-alive off for localhost by default), and with `prefer_grpc` the data
+plane (search, upsert, scroll) uses one multiplexed gRPC channel instead of
+REST/JSON.
+
+Options left as None fall back to the environment:
+- QDRANT_PREFER_GRPC: 'true' to use gRPC
+- QDRANT_GRPC_PORT: gRPC port (default 6334, as in vector_db/docker-compose.yml)
+- QDRANT_TIMEOUT: request timeout in seconds
+- QDRANT_MAX_CONNECTIONS, QDRANT_MAX_KEEPALIVE_CONNECTIONS,
+  QDRANT_KEEPALIVE_EXPIRY: REST connection-pool sizing
+
+':memory:' clients are never shared, since each one holds its own data.
+Async clients are not cached either: a gRPC channel belongs to the event
+loop it was first used on, so every RAG instance creates its own.
+"""
+
+import os
+import threading
+
+import httpx
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Larger than the gRPC default (4 MB) so upsert batches of max_upsert_bytes fit.
+GRPC_MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def qdrant_client_options(
+    url: str,
+    prefer_grpc: bool = None,
+    grpc_port: int = None,
+    timeout: int = None,
+    ) -> dict:
+    """
+        Keyword arguments of QdrantClient / AsyncQdrantClient for `url`.
+
+        Args:
+            url: Qdrant URL (REST port)
+            prefer_grpc: Use gRPC for data-plane calls
+            grpc_port: gRPC port of the server
+            timeout: Request timeout in seconds
+
+        Returns:
+            Dict of client keyword arguments
+    """
+    if prefer_grpc is None:
+        prefer_grpc = env_flag("QDRANT_PREFER_GRPC")
+    options = {
+        "url": url,
+        "prefer_grpc": prefer_grpc,
+        "grpc_port": grpc_port or int(os.environ.get("QDRANT_GRPC_PORT", 6334)),
+        "timeout": timeout or int(os.environ.get("QDRANT_TIMEOUT", 30)),
+        "limits": httpx.Limits(
+            max_connections=int(os.environ.get("QDRANT_MAX_CONNECTIONS", 32)),
+            max_keepalive_connections=int(os.environ.get("QDRANT_MAX_KEEPALIVE_CONNECTIONS", 16)),
+            keepalive_expiry=float(os.environ.get("QDRANT_KEEPALIVE_EXPIRY", 60)),
+        ),
+    }
+    if prefer_grpc:
+        options["grpc_options"] = {
+            "grpc.keepalive_time_ms": 30000,
+            "grpc.max_send_message_length": GRPC_MAX_MESSAGE_BYTES,
+            "grpc.max_receive_message_length": GRPC_MAX_MESSAGE_BYTES,
+        }
+    return options
+
+
+def get_qdrant_client(url: str, prefer_grpc: bool = None, grpc_port: int = None, timeout: int = None) -> QdrantClient:
+    """Return the process-wide client for `url` with these options, creating it on first use."""
+    if url == ":memory:":
+        return QdrantClient(":memory:")
+    options = qdrant_client_options(url, prefer_grpc, grpc_port, timeout)
+    key = (url, options["prefer_grpc"], options["grpc_port"], options["timeout"])
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = QdrantClient(**options)
+        return _clients[key]
+
+
+def create_async_qdrant_client(
+    url: str,
+    prefer_grpc: bool = None,
+    grpc_port: int = None,
+    timeout: int = None,
+    ) -> AsyncQdrantClient:
+    """New AsyncQdrantClient for `url`, configured like `get_qdrant_client`."""
+    if url == ":memory:":
+        return AsyncQdrantClient(":memory:")
+    return AsyncQdrantClient(**qdrant_client_options(url, prefer_grpc, grpc_port, timeout))
@@ -0,0 +1,101 @@
+"""
+Storage and search settings of the dense vector in Qdrant.
+
+Ingestion uses `quantization_config` / `hnsw_config` when it creates (or
+updates) the collection, and serving uses `search_params` on every dense
+search, so both sides agree on what the options mean.
+
+Quantization keeps a compressed copy of every vector in RAM for the HNSW
+traversal: 'scalar' stores int8 (4x smaller than float32), 'binary' stores
+one bit per dimension (32x smaller). With `on_disk` the float32 originals
+are memory-mapped instead of held in RAM and are only read to rescore the
+oversampled candidates.
+"""
+
+from qdrant_client import models
+
+QUANTIZATION_TYPES = ("none", "scalar", "binary")
+
+
+def quantization_config(quantization: str = None):
+    """
+    Quantization config for a dense vector.
+
+    Args:
+        quantization: 'scalar' (int8), 'binary' (1 bit per dimension) or
+            'none'/None
+
+    Returns:
+        ScalarQuantization, BinaryQuantization, or None for no quantization
+    """
+    if quantization in (None, "none"):
+        return None
+    if quantization == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                # Clip the outer 1% of values so they do not stretch the int8 range.
+                quantile=0.99,
+                always_ram=True,
+            )
+        )
+    if quantization == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATION_TYPES}")
+
+
+def hnsw_config(m: int = None, ef_construct: int = None):
+    """HNSW graph settings, or None to keep Qdrant's defaults (m=16, ef_construct=100)."""
+    if m is None and ef_construct is None:
+        return None
+    return models.HnswConfigDiff(m=m, ef_construct=ef_construct)
+
+
+def search_params(hnsw_ef: int = None, oversampling: float = None, rescore: bool = None, exact: bool = False):
+    """
+    Search-time parameters of a dense search.
+
+    Args:
+        hnsw_ef: Size of the HNSW candidate list (higher: better recall, slower)
+        oversampling: Fetch `oversampling * limit` candidates with the
+            quantized vectors before rescoring
+        rescore: Re-rank the candidates with the original vectors
+        exact: Skip the index and compare against every vector (ground truth)
+
+    Returns:
+        SearchParams, or None when every option is left at Qdrant's default
+    """
+    quantization = None
+    if oversampling is not None or rescore is not None:
+        quantization = models.QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+    if hnsw_ef is None and quantization is None and not exact:
+        return None
+    return models.SearchParams(hnsw_ef=hnsw_ef, exact=exact, quantization=quantization)
+
+
+def estimated_vector_memory(
+        points: int,
+        dimensions: int = 384,
+        quantization: str = None,
+        on_disk: bool = False,
+        m: int = 16
+    ) -> int:
+    """
+    Rough RAM footprint in bytes of a dense vector's storage and index.
+
+    Counts the float32 originals (unless on disk), the quantized copy and
+    the HNSW level-0 links (2 * m links of 4 bytes per point). Qdrant does
+    not report memory per collection, so benchmarks compare configs with
+    this estimate.
+    """
+    originals = 0 if on_disk else points * dimensions * 4
+    if quantization == "scalar":
+        quantized = points * dimensions
+    elif quantization == "binary":
+        quantized = points * ((dimensions + 7) // 8)
+    else:
+        quantized = 0
+    links = points * 2 * m * 4
+    return originals + quantized + links
@@ -3,20 +3,45 @@ RAG (Retrieval-Augmented Generation) implementation for MScAC handbook Q&A.
 
 This module provides classes for:
 - Similarity measurement between embeddings
+- Per-request state for a single pass through the pipeline
 - RAG pipeline for question answering over document chunks
 """
 
-import torch
+import asyncio
+import logging
+import os
+import time
 import numpy as np
 import re
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient, models
-from .utils import TEMP_CHUNKS, ask_llm, genai, types, load_dotenv, os, base64
+from concurrent.futures import ThreadPoolExecutor
+from qdrant_client import models
+from .llm import ask_llm, ask_llm_async, stream_llm_async, get_client, types
 from .prompts import RETRIEVAL_PROMPT
+from .cache import EmbeddingCache, SemanticCache
+from .manifest import read_corpus_version, read_corpus_version_async, read_payload_content
+from .local_index import LocalVectorIndex
+from .embedding_store import EmbeddingStore
+from .chunk_store import ChunkStore
+from .embeddings import embedding_model_key, load_embedding_model
+from .sparse import SPARSE_VECTOR_NAME, hybrid_query_request
+from .qdrant_config import search_params
+from .qdrant_clients import create_async_qdrant_client, get_qdrant_client
+from .batcher import EmbeddingBatcher
+from .context_packer import ContextPacker
+from .sessions import Session, create_session_store
+from .router import QueryRouter, read_header_centroids, read_header_centroids_async
+from .metrics import span
 from dotenv import load_dotenv
 import json
+
+logger = logging.getLogger(__name__)
 load_dotenv()
 
+# Payload fields read from retrieved points (see _to_chunk_tuples); the
+# rest of the payload and the vectors are not transferred. With a chunk
+# store, "content" comes from the store instead.
+RETRIEVED_PAYLOAD_FIELDS = ["header", "document_title", "content"]
+
 
 class SimilarityMeasure:
     """
@@ -33,8 +58,8 @@ class SimilarityMeasure:
 
     def __init__(
             self,
-            X: torch.Tensor,
-            Y: torch.Tensor,
+            X: np.ndarray,
+            Y: np.ndarray,
             metric_type: str = 'cosine_similarity'
         ):
 
@@ -64,6 +89,59 @@ class SimilarityMeasure:
         return -np.linalg.norm(self.X - self.Y)
 
 
+class RAGRequest:
+    """
+    State of a single question as it moves through the RAG pipeline.
+
+    The RAG instance is shared by every request the server handles, so
+    anything that is specific to one question lives here instead of on it.
+
+    Args:
+        user_query: The question as asked by the user
+        top_k: Number of chunks to retrieve
+        session: Session of the conversation the question belongs to, if any
+
+    Attributes:
+        augmented_queries: User query followed by related generated questions
+        query_vectors: One embedding per augmented query (2-D array)
+        top_k_chunks: Retrieved (header, document_title, content, score) tuples
+        top_k_chunk_ids: Point ids of `top_k_chunks`
+        reused_session_context: Whether the chunks were taken from the
+            session instead of being retrieved
+        packed_context: PackedContext built from the chunks (token counts,
+            tokens saved)
+        retrieval_prompt: Final prompt sent to the language model
+        response_to_user: Generated answer
+        cache_vector: Embedding of the original question, used by the answer cache
+        from_cache: Whether the answer came from the semantic answer cache
+    """
+
+    def __init__(self, user_query: str, top_k: int = 3, session: Session = None):
+        self.user_query = user_query
+        self.top_k = top_k
+        self.session = session
+        self.started_at = time.perf_counter()
+        self.cache_vector = None
+        self.from_cache = False
+        self.augmented_queries = []
+        self.query_vectors = None
+        self.top_k_chunks = []
+        self.top_k_chunk_ids = []
+        self.reused_session_context = False
+        self.packed_context = None
+        self.retrieval_prompt = None
+        self.response_to_user = None
+
+    @property
+    def follow_up(self) -> bool:
+        """Whether earlier turns of the conversation are known."""
+        return bool(self.session)
+
+    @property
+    def conversation(self):
+        return self.session.conversation_text() if self.follow_up else None
+
+
 class RAG:
     """
     Retrieval-Augmented Generation pipeline for question answering.
@@ -74,51 +152,330 @@ class RAG:
     3. Prepare prompt with retrieved context
     4. Generate response using language model
 
+    The instance only holds shared resources (models, clients, executor,
+    caches); per-question state is kept in a RAGRequest, so the same
+    instance can serve concurrent requests through `run_async`.
+
     Args:
-        vector_db_url: URL of the vector database (currently unused, placeholder)
+        vector_db_url: URL of the vector database
+        vector_db_prefer_grpc: Talk to Qdrant over gRPC instead of REST
+            (None: QDRANT_PREFER_GRPC, see qdrant_clients.py)
+        vector_db_collection: Name of the Qdrant collection holding the chunks
         embedding_model_name: Name of the SentenceTransformer model
+        embedding_backend: 'torch', 'onnx' or 'onnx-int8' (see embeddings.py)
+        embedding_threads: onnxruntime threads per encode (default: CPU
+            cores divided among the embedding workers)
         language_model_name: Name of the language model for generation
+        embedding_workers: Size of the thread pool that runs query encoding
+            off the event loop
+        embedding_batch_size: Maximum number of texts the async path encodes
+            in one call, gathered across concurrent requests (1 disables
+            micro-batching)
+        embedding_batch_wait_ms: Longest time a query waits for others to
+            join its batch
+        embedding_cache_bytes: Memory budget of the query embedding cache
+            (0 disables it)
+        embedding_cache_ttl: Seconds a cached query embedding stays valid
+        answer_cache_size: Maximum number of answers kept by the semantic
+            answer cache (0 disables it)
+        answer_cache_threshold: Minimum cosine similarity between two
+            questions for the cached answer to be reused
+        answer_cache_ttl: Seconds a cached answer stays valid
+        corpus_version_check_interval: Seconds between checks of the corpus
+            version; when it changes, cached answers are dropped and the
+            local index and the query router are reloaded
+        retrieval_fusion: How the rankings of the user query and its
+            generated questions are merged: 'rrf' (reciprocal rank fusion)
+            or 'max' (best similarity score per chunk)
+        rrf_k: Rank offset used by reciprocal rank fusion
+        vector_db_backend: 'qdrant' to search the Qdrant collection, or
+            'local' to search an in-process LocalVectorIndex instead
+        local_index_dir: Index directory used by the 'local' backend
+        local_index_metric: Similarity metric of the 'local' backend (see
+            SimilarityMeasure)
+        embedding_store_path: SQLite file of a persistent EmbeddingStore
+            shared with ingestion; consulted before running the model
+        chunk_store_dir: ChunkStore written by ingestion; the texts of the
+            retrieved chunks are read from it instead of the point payloads
+        retrieval_mode: 'hybrid' to fuse dense and BM25 sparse search inside
+            Qdrant (falls back to dense if the collection has no sparse
+            vector), or 'dense'. The local backend is always dense.
+        hybrid_prefetch_limit: Candidates fetched by each of the dense and
+            sparse searches before fusion
+        search_hnsw_ef: HNSW candidate list size of dense searches (None:
+            collection default)
+        search_oversampling: With a quantized collection, candidates fetched
+            per requested point before rescoring
+        search_rescore: With a quantized collection, re-rank the candidates
+            with the original vectors (None: Qdrant default)
+        context_token_budget: Estimated tokens of retrieved text put in the
+            prompt; past it, the sentences least similar to the question
+            are dropped (None: no limit)
+        session_store_path: SQLite file keeping conversation sessions (None:
+            in memory, see sessions.py)
+        max_sessions: Most conversation sessions kept
+        session_ttl: Seconds a session is kept after its last turn
+        session_reuse_threshold: Minimum cosine similarity between a
+            follow-up and a recent question of the session for it to be
+            answered from the chunks already retrieved for that question
+        query_routing: Restrict the Qdrant search of a question to the
+            sections (document, header) a QueryRouter picks for it, from
+            the section centroids stored at ingestion (see router.py);
+            questions it is not confident about search the whole collection.
+            Off by default: compare recall with it on and off first
+            (bench_retrieval_sweep --routing both)
+        routing_min_similarity: Similarity to the closest section centroid
+            needed to route a question no keyword rule matched
+        routing_margin: Sections this close to the best similarity are
+            searched too
+        routing_rules_path: JSON file of extra keyword rules,
+            [{"pattern", "headers", "documents"}]
+        batch_concurrency: Default limit of concurrent LLM calls of
+            `run_batch_async`
+        batch_chunk_size: Questions `run_batch_async` embeds and retrieves
+            together
     """
 
     def __init__(
             self,
             vector_db_url: str = 'http://172.31.41.249:6333',
+            vector_db_prefer_grpc: bool = None,
             vector_db_collection: str= "csc2701",
             embedding_model_name: str = 'all-MiniLM-L6-v2',
-            language_model_name: str = 'gemini-2.5-flash-lite'
+            embedding_backend: str = "torch",
+            embedding_threads: int = None,
+            language_model_name: str = 'gemini-2.5-flash-lite',
+            embedding_workers: int = 2,
+            embedding_batch_size: int = 64,
+            embedding_batch_wait_ms: float = 2,
+            embedding_cache_bytes: int = 32 * 1024 * 1024,
+            embedding_cache_ttl: float = 24 * 3600,
+            answer_cache_size: int = 1024,
+            answer_cache_threshold: float = 0.92,
+            answer_cache_ttl: float = 3600,
+            corpus_version_check_interval: float = 30,
+            retrieval_fusion: str = "rrf",
+            rrf_k: int = 60,
+            vector_db_backend: str = "qdrant",
+            local_index_dir: str = None,
+            local_index_metric: str = "cosine_similarity",
+            embedding_store_path: str = None,
+            chunk_store_dir: str = None,
+            retrieval_mode: str = "hybrid",
+            hybrid_prefetch_limit: int = 20,
+            search_hnsw_ef: int = None,
+            search_oversampling: float = None,
+            search_rescore: bool = None,
+            context_token_budget: int = 800,
+            session_store_path: str = None,
+            max_sessions: int = 10000,
+            session_ttl: float = 3600,
+            session_reuse_threshold: float = 0.8,
+            query_routing: bool = False,
+            routing_min_similarity: float = 0.45,
+            routing_margin: float = 0.05,
+            routing_rules_path: str = None,
+            batch_concurrency: int = 8,
+            batch_chunk_size: int = 32
         ):
 
-        self.embedding_model = SentenceTransformer(embedding_model_name)
+        self.embedding_model_name = embedding_model_name
+        self.embedding_backend = embedding_backend
+        # Cache/store key; differs from the model name for int8 embeddings.
+        self.embedding_model_key = embedding_model_key(embedding_model_name, embedding_backend)
+        self.embedding_model = load_embedding_model(
+            embedding_model_name,
+            backend=embedding_backend,
+            threads=embedding_threads or max(1, (os.cpu_count() or 1) // embedding_workers),
+        )
+        self.embedding_store = EmbeddingStore(embedding_store_path) if embedding_store_path else None
+        self.chunk_store = ChunkStore(chunk_store_dir) if chunk_store_dir else None
+        self.retrieved_payload_fields = (
+            [field for field in RETRIEVED_PAYLOAD_FIELDS if field != "content"]
+            if self.chunk_store is not None else RETRIEVED_PAYLOAD_FIELDS
+        )
+        self.embedding_cache = (
+            EmbeddingCache(max_bytes=embedding_cache_bytes, ttl=embedding_cache_ttl)
+            if embedding_cache_bytes else None
+        )
+        self.answer_cache = (
+            SemanticCache(threshold=answer_cache_threshold, max_entries=answer_cache_size, ttl=answer_cache_ttl)
+            if answer_cache_size else None
+        )
+        self.corpus_version_check_interval = corpus_version_check_interval
+        self._corpus_version_checked_at = float("-inf")
+        self._chunk_store_refreshed_at = float("-inf")
+        self.embedding_executor = ThreadPoolExecutor(
+            max_workers=embedding_workers,
+            thread_name_prefix="rag-embed"
+        )
+        self.embedding_batcher = (
+            EmbeddingBatcher(
+                self.encode,
+                executor=self.embedding_executor,
+                max_batch_size=embedding_batch_size,
+                max_wait_ms=embedding_batch_wait_ms,
+                concurrency=embedding_workers,
+            )
+            if embedding_batch_size > 1 else None
+        )
         self.vector_db_url = vector_db_url
         self.vector_db_collection = vector_db_collection
-        self.vector_db_client = QdrantClient(self.vector_db_url)
-        self.chunks = self.load_chunks_from_vector_db(self.vector_db_url)
+        if retrieval_fusion not in ("rrf", "max"):
+            raise ValueError(f"Unknown retrieval_fusion '{retrieval_fusion}', expected 'rrf' or 'max'")
+        self.retrieval_fusion = retrieval_fusion
+        self.rrf_k = rrf_k
+        if retrieval_mode not in ("hybrid", "dense"):
+            raise ValueError(f"Unknown retrieval_mode '{retrieval_mode}', expected 'hybrid' or 'dense'")
+        self.retrieval_mode = retrieval_mode
+        self.hybrid_prefetch_limit = hybrid_prefetch_limit
+        self.search_params = search_params(
+            hnsw_ef=search_hnsw_ef, oversampling=search_oversampling, rescore=search_rescore
+        )
+        self.context_packer = ContextPacker(token_budget=context_token_budget)
+        self.session_store = create_session_store(session_store_path, max_sessions=max_sessions, ttl=session_ttl)
+        self.session_reuse_threshold = session_reuse_threshold
+        self.query_routing = query_routing
+        self.routing_min_similarity = routing_min_similarity
+        self.routing_margin = routing_margin
+        self.routing_rules = []
+        if routing_rules_path:
+            with open(routing_rules_path, "r", encoding="utf-8") as file:
+                self.routing_rules = json.load(file)
+        self.batch_concurrency = batch_concurrency
+        self.batch_chunk_size = batch_chunk_size
+        # Loaded by warm_up and reloaded when the corpus version changes.
+        self.query_router = None
+        self._router_corpus_version = None
+        # Whether the collection has the sparse vector; looked up on first search.
+        self._hybrid_available = None
+        self.vector_db_backend = vector_db_backend
+        if vector_db_backend == "local":
+            self.local_index = LocalVectorIndex(local_index_dir, metric=local_index_metric)
+            self.vector_db_client = None
+            self.async_vector_db_client = None
+        elif vector_db_backend == "qdrant":
+            self.local_index = None
+            self.vector_db_client = get_qdrant_client(self.vector_db_url, prefer_grpc=vector_db_prefer_grpc)
+            self.async_vector_db_client = create_async_qdrant_client(
+                self.vector_db_url, prefer_grpc=vector_db_prefer_grpc
+            )
+        else:
+            raise ValueError(f"Unknown vector_db_backend '{vector_db_backend}', expected 'qdrant' or 'local'")
         self.language_model = language_model_name 
 
-    def load_chunks_from_vector_db(self, vector_db_url: str):
-        """
-        Load and embed document chunks from vector database.
+    def close(self):
+        """Stop the embedding batcher and the embedding thread pool."""
+        if self.embedding_batcher is not None:
+            self.embedding_batcher.close()
+        self.embedding_executor.shutdown(wait=False)
 
-        Currently uses TEMP_CHUNKS from utils as a placeholder.
+    async def aclose(self):
+        """`close`, and close the async Qdrant client (the sync one is shared, see qdrant_clients.py)."""
+        self.close()
+        if self.async_vector_db_client is not None:
+            await self.async_vector_db_client.close()
 
-        Returns:
-            List of tuples (chunk_text, chunk_embedding)
+    def warm_up(self):
         """
-        chunks = []
-        for chunk_text in TEMP_CHUNKS:
-            chunk_embedding = self.embedding_model.encode(chunk_text)
-            chunks.append((chunk_text, chunk_embedding))
+        Prepare the instance for its first request.
+
+        Runs one encode (the first call of a model allocates its buffers and
+        thread pool) and, with the Qdrant backend, checks that the collection
+        is reachable and whether it supports hybrid retrieval. Raises if
+        either fails, or if the collection's points were ingested without
+        their text and no chunk store is configured. Warns if the chunk
+        store was not committed for the collection's current corpus version.
+        Loads the query router.
+        """
+        self.embedding_model.encode(["warm up"])
+        if self.vector_db_client is not None:
+            self._hybrid_available = self._has_sparse_vector(
+                self.vector_db_client.get_collection(self.vector_db_collection)
+            )
+            if self.chunk_store is None and not read_payload_content(self.vector_db_client, self.vector_db_collection):
+                raise RuntimeError(
+                    f"The points of '{self.vector_db_collection}' do not hold their chunk text; "
+                    "set CHUNK_STORE_DIR to the chunk store written by ingestion"
+                )
+            if self._routes_queries:
+                self.load_query_router(read_corpus_version(self.vector_db_client, self.vector_db_collection))
+        if self.chunk_store is not None:
+            if self.local_index is not None:
+                corpus_version = self.local_index.corpus_version
+            else:
+                corpus_version = read_corpus_version(self.vector_db_client, self.vector_db_collection)
+            if self.chunk_store.refresh() != corpus_version:
+                logger.warning(
+                    "Chunk store is at corpus version %s, '%s' at %s; chunks it lacks are read from Qdrant",
+                    self.chunk_store.corpus_version, self.vector_db_collection, corpus_version,
+                )
+
+    def load_query_router(self, corpus_version: str = None):
+        """(Re)load the query router from the section centroids stored for the collection."""
+        self._set_query_router(read_header_centroids(self.vector_db_client, self.vector_db_collection), corpus_version)
 
-        return chunks
-    def augment_user_query(self, user_query: str, num_questions: int = 3) -> str:
+    async def load_query_router_async(self, corpus_version: str = None):
+        """Async version of `load_query_router`."""
+        self._set_query_router(
+            await read_header_centroids_async(self.async_vector_db_client, self.vector_db_collection), corpus_version
+        )
+
+    @property
+    def _routes_queries(self) -> bool:
+        return self.query_routing and self.local_index is None
+
+    def _set_query_router(self, centroids: list, corpus_version: str):
+        self._router_corpus_version = corpus_version
+        if not centroids:
+            logger.warning(
+                "No section centroids stored for '%s'; searching the whole collection", self.vector_db_collection
+            )
+            self.query_router = None
+            return
+        self.query_router = QueryRouter(
+            centroids,
+            rules=self.routing_rules,
+            min_similarity=self.routing_min_similarity,
+            margin=self.routing_margin,
+            corpus_version=corpus_version,
+        )
+
+    def augment_user_query(self, user_query: str, num_questions: int = 3, conversation: str = None) -> list:
         """
         Augment the user's query by generating related questions
         using the Gemini API. These related questions help provide
         richer context for retrieval.
+
+        With the `conversation` so far, the generated questions spell out
+        what a follow-up refers to, so they can be searched on their own.
+
+        Returns:
+            List with the user query first, followed by the generated questions
         """
-        client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-        model = self.language_model
+        client = get_client()
+
+        response = client.models.generate_content(
+            model=self.language_model,
+            contents=self._augmentation_contents(user_query, num_questions, conversation),
+            config=self._augmentation_config(),
+        )
+
+        return self._parse_augmented_queries(user_query, response.text)
+
+    async def augment_user_query_async(self, user_query: str, num_questions: int = 3, conversation: str = None) -> list:
+        """Async version of `augment_user_query`; does not block the event loop."""
+        client = get_client()
 
+        response = await client.aio.models.generate_content(
+            model=self.language_model,
+            contents=self._augmentation_contents(user_query, num_questions, conversation),
+            config=self._augmentation_config(),
+        )
+
+        return self._parse_augmented_queries(user_query, response.text)
+
+    def _augmentation_contents(self, user_query: str, num_questions: int, conversation: str = None):
         prompt = f'''Given this user query: "{user_query}"
 
         Generate exactly {num_questions} related questions that someone asking this might also want to know.
@@ -132,26 +489,28 @@ class RAG:
         
         Example format: ["question1?", "question2?", "question3?"]
         '''
+        if conversation:
+            prompt += f'''
+        The query continues this conversation:
+        {conversation}
+        It may refer to earlier turns: make every question self-contained, naming what it is about.
+        '''
 
-        contents = [
+        return [
             types.Content(
                 role="user",
                 parts=[types.Part.from_text(text=prompt)],
             ),
         ]
 
-        generate_content_config = types.GenerateContentConfig(
+    def _augmentation_config(self):
+        return types.GenerateContentConfig(
             thinking_config=types.ThinkingConfig(thinking_budget=0),
             temperature=0.7,
         )
 
-        response = client.models.generate_content(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        )
-
-        response_text = response.text.strip()
+    def _parse_augmented_queries(self, user_query: str, response_text: str) -> list:
+        response_text = response_text.strip()
 
         if "```json" in response_text:
             response_text = response_text.split("```json")[1].split("```")[0].strip()
@@ -159,40 +518,380 @@ class RAG:
             response_text = response_text.split("```")[1].split("```")[0].strip()
 
         questions = json.loads(response_text)
-        questions_str = " ".join(questions)
-        augmented_query = f"{user_query} {questions_str}"
 
-        return augmented_query
+        return [user_query] + [question for question in questions if question]
 
-    def embed_user_query(self):
-        """Embed the user query using the sentence transformer model."""
-        return self.embedding_model.encode(self.user_query)
+    def encode(self, texts: list) -> np.ndarray:
+        """
+        Encode texts in one batch, reusing the persistent embedding store.
 
-    def retrieve_top_k_relevant_chunks(self, top_k: int = 3):
+        Texts already in the store are not passed to the model.
+        """
+        if self.embedding_store is not None:
+            return self.embedding_store.encode(self.embedding_model, self.embedding_model_key, texts)
+        return self.embedding_model.encode(texts)
+
+    def embed_user_query(self, user_query: str):
+        """
+        Embed the user query using the sentence transformer model.
+
+        Repeated queries (after whitespace/case normalization) are served
+        from the embedding cache instead of running the model again.
+        """
+        return self.embed_user_queries([user_query])[0]
+
+    async def embed_user_query_async(self, user_query: str):
+        """
+        Embed the user query on the embedding thread pool.
+
+        Encoding is CPU-bound, so it is kept off the event loop; the pool
+        size bounds how many encodes run at once. Cache hits return without
+        touching the pool.
+        """
+        return (await self.embed_user_queries_async([user_query]))[0]
+
+    def embed_user_queries(self, queries: list) -> np.ndarray:
+        """
+        Embed several queries with a single batched `encode` call.
+
+        Queries found in the embedding cache are not re-encoded.
+
+        Returns:
+            Array of shape (len(queries), embedding_dim)
+        """
+        query_vectors, missing = self._cached_query_vectors(queries)
+        if missing:
+            encoded = self.encode([queries[i] for i in missing])
+            self._fill_query_vectors(queries, query_vectors, missing, encoded)
+        return np.stack(query_vectors)
+
+    async def embed_user_queries_async(self, queries: list) -> np.ndarray:
+        """
+        Async version of `embed_user_queries`; encodes on the embedding thread pool.
+
+        Cache misses go through the embedding batcher, so the queries of
+        concurrent requests share one `encode` call.
+        """
+        query_vectors, missing = self._cached_query_vectors(queries)
+        if missing:
+            texts = [queries[i] for i in missing]
+            if self.embedding_batcher is not None:
+                encoded = await self.embedding_batcher.encode(texts)
+            else:
+                loop = asyncio.get_running_loop()
+                encoded = await loop.run_in_executor(self.embedding_executor, self.encode, texts)
+            self._fill_query_vectors(queries, query_vectors, missing, encoded)
+        return np.stack(query_vectors)
+
+    def _cached_query_vectors(self, queries: list):
+        if self.embedding_cache is None:
+            return [None] * len(queries), list(range(len(queries)))
+        query_vectors = [self.embedding_cache.get(self.embedding_model_key, query) for query in queries]
+        missing = [i for i, query_vector in enumerate(query_vectors) if query_vector is None]
+        return query_vectors, missing
+
+    def _fill_query_vectors(self, queries: list, query_vectors: list, missing: list, encoded):
+        for i, query_vector in zip(missing, encoded):
+            query_vectors[i] = query_vector
+            if self.embedding_cache is not None:
+                self.embedding_cache.put(self.embedding_model_key, queries[i], query_vector)
+
+    def retrieve_top_k_relevant_chunks(self, query_vectors, top_k: int = 3, queries: list = None):
         """
         Retrieve top-k most similar chunks to the query.
 
+        Every query is searched in one batched Qdrant request and the
+        per-query rankings are fused (see `fuse_search_results`). In hybrid
+        mode each query's dense and sparse (BM25) searches are themselves
+        fused by Qdrant within that same request.
+
         Args:
+            query_vectors: Embedding(s) of the user query and its augmentations
             top_k: Number of chunks to retrieve
+            queries: Texts of the queries, needed for the sparse search;
+                without them the search is dense only
 
         Returns:
-            List of tuples (chunk_text, similarity_score) sorted by similarity
+            List of tuples (header, document_title, content, score) sorted by fused score
         """
-        similarities = []
-        
-        search_results = self.vector_db_client.search(
-            collection_name=self.vector_db_collection,
-            query_vector= models.NamedVector(name= "mscac-dense-vector", vector= self.query_vector),
-            limit=top_k,
+        return self._to_chunk_tuples(self.retrieve_top_k_points(query_vectors, top_k, queries))
+
+    async def retrieve_top_k_relevant_chunks_async(self, query_vectors, top_k: int = 3, queries: list = None):
+        """Async version of `retrieve_top_k_relevant_chunks` using the AsyncQdrantClient."""
+        return self._to_chunk_tuples(await self.retrieve_top_k_points_async(query_vectors, top_k, queries))
+
+    def retrieve_top_k_points(self, query_vectors, top_k: int = 3, queries: list = None):
+        """Like `retrieve_top_k_relevant_chunks`, but returns the fused ScoredPoints (with their ids)."""
+        if self.local_index is not None:
+            search_results = self.local_index.search(query_vectors, top_k)
+        else:
+            hybrid = queries is not None and self.retrieval_mode == "hybrid"
+            if hybrid and self._hybrid_available is None:
+                self._hybrid_available = self._has_sparse_vector(
+                    self.vector_db_client.get_collection(self.vector_db_collection)
+                )
+            route = self.route_query(query_vectors, top_k, queries)
+            search_results = self.vector_db_client.query_batch_points(
+                collection_name=self.vector_db_collection,
+                requests=self._query_requests(query_vectors, top_k, queries if hybrid else None, route),
+            )
+            if route is not None and self._too_few_points(search_results, top_k):
+                self.query_router.record_fallback()
+                search_results = self.vector_db_client.query_batch_points(
+                    collection_name=self.vector_db_collection,
+                    requests=self._query_requests(query_vectors, top_k, queries if hybrid else None),
+                )
+        points = self.fuse_search_results(search_results, top_k)
+        missing = self._fill_from_chunk_store(points)
+        if missing and self.vector_db_client is not None:
+            records = self.vector_db_client.retrieve(
+                self.vector_db_collection, ids=[point.id for point in missing], with_payload=["content"]
+            )
+            self._fill_from_records(missing, records)
+        return self._with_content(points)
+
+    async def retrieve_top_k_points_async(self, query_vectors, top_k: int = 3, queries: list = None):
+        """Async version of `retrieve_top_k_points`."""
+        return (await self.retrieve_top_k_points_batch_async([query_vectors], top_k, [queries]))[0]
+
+    async def retrieve_top_k_points_batch_async(self, query_vector_sets: list, top_k: int = 3, query_sets: list = None):
+        """
+        Retrieve the top-k points of several questions with one batched Qdrant request.
+
+        The searches of every question (and of its generated questions) go
+        out in a single `query_batch_points` call, and the chunk texts of all
+        the results are filled in together; rankings are fused per question.
+
+        Args:
+            query_vector_sets: Per question, the embeddings of it and its augmentations
+            top_k: Number of chunks to retrieve per question
+            query_sets: Per question, the texts of its queries (or None for a
+                dense-only search)
+
+        Returns:
+            One list of fused ScoredPoints per question
+        """
+        query_sets = query_sets or [None] * len(query_vector_sets)
+        if self.local_index is not None:
+            # A single matrix product over the handbook takes well under a
+            # millisecond, less than handing it to a thread would.
+            result_sets = [self.local_index.search(query_vectors, top_k) for query_vectors in query_vector_sets]
+        else:
+            hybrid = self.retrieval_mode == "hybrid"
+            if hybrid and self._hybrid_available is None and any(queries is not None for queries in query_sets):
+                self._hybrid_available = self._has_sparse_vector(
+                    await self.async_vector_db_client.get_collection(self.vector_db_collection)
+                )
+            searches = [
+                (query_vectors, queries if hybrid else None, self.route_query(query_vectors, top_k, queries))
+                for query_vectors, queries in zip(query_vector_sets, query_sets)
+            ]
+            result_sets = await self._query_batch_async(searches, top_k)
+            retry = [
+                i for i, (_, _, route) in enumerate(searches)
+                if route is not None and self._too_few_points(result_sets[i], top_k)
+            ]
+            if retry:
+                for _ in retry:
+                    self.query_router.record_fallback()
+                retried = await self._query_batch_async(
+                    [(searches[i][0], searches[i][1], None) for i in retry], top_k
+                )
+                for i, results in zip(retry, retried):
+                    result_sets[i] = results
+        point_sets = [self.fuse_search_results(results, top_k) for results in result_sets]
+        points = [point for point_set in point_sets for point in point_set]
+        missing = await self._fill_from_chunk_store_async(points)
+        if missing and self.async_vector_db_client is not None:
+            records = await self.async_vector_db_client.retrieve(
+                self.vector_db_collection, ids=list({point.id: None for point in missing}), with_payload=["content"]
+            )
+            self._fill_from_records(missing, records)
+        return [self._with_content(point_set) for point_set in point_sets]
+
+    async def _query_batch_async(self, searches: list, top_k: int) -> list:
+        """
+        Run the searches of several questions in one `query_batch_points` call.
+
+        Args:
+            searches: (query_vectors, queries, route) per question
+            top_k: Number of points per search
+
+        Returns:
+            The QueryResponses of each question
+        """
+        requests, counts = [], []
+        for query_vectors, queries, route in searches:
+            question_requests = self._query_requests(query_vectors, top_k, queries, route)
+            requests.extend(question_requests)
+            counts.append(len(question_requests))
+        responses = await self.async_vector_db_client.query_batch_points(
+            collection_name=self.vector_db_collection, requests=requests
         )
-        print(search_results)
+        result_sets, start = [], 0
+        for count in counts:
+            result_sets.append(responses[start:start + count])
+            start += count
+        return result_sets
+
+    def _fill_from_chunk_store(self, points) -> list:
+        """
+        Set the content of the points from the chunk store.
+
+        A point the store lacks makes it reload, at most once every
+        `corpus_version_check_interval`.
+
+        Returns:
+            The points the store does not hold (not yet reloaded after an
+            ingestion, or a store older than the collection)
+        """
+        if self.chunk_store is None:
+            return []
+        missing = self._fill_chunks(points)
+        if missing and self._chunk_store_refresh_due():
+            self.chunk_store.refresh()
+            missing = self._fill_chunks(missing)
+        return missing
+
+    async def _fill_from_chunk_store_async(self, points) -> list:
+        """Async version of `_fill_from_chunk_store`."""
+        if self.chunk_store is None:
+            return []
+        missing = self._fill_chunks(points)
+        if missing and self._chunk_store_refresh_due():
+            # Reads manifest.json and may remap the store's files.
+            await asyncio.to_thread(self.chunk_store.refresh)
+            missing = self._fill_chunks(missing)
+        return missing
+
+    def _chunk_store_refresh_due(self) -> bool:
+        if time.monotonic() < self._chunk_store_refreshed_at + self.corpus_version_check_interval:
+            return False
+        self._chunk_store_refreshed_at = time.monotonic()
+        return True
+
+    def _fill_chunks(self, points) -> list:
+        chunks = self.chunk_store.get([point.id for point in points])
+        missing = []
+        for point, chunk in zip(points, chunks):
+            if chunk is None:
+                missing.append(point)
+            else:
+                # Payload dicts can be shared with the local index; never modified in place.
+                point.payload = {**(point.payload or {}), "content": chunk[2]}
+        return missing
+
+    def _fill_from_records(self, points, records):
+        contents = {str(record.id): (record.payload or {}).get("content") for record in records}
+        for point in points:
+            if contents.get(str(point.id)) is not None:
+                point.payload = {**(point.payload or {}), "content": contents[str(point.id)]}
+
+    def _with_content(self, points) -> list:
+        hydrated = [point for point in points if "content" in (point.payload or {})]
+        if len(hydrated) < len(points):
+            logger.warning("%d retrieved chunks have no text in the chunk store or payload", len(points) - len(hydrated))
+        return hydrated
+
+    def route_query(self, query_vectors, top_k: int, queries: list = None):
+        """
+        Sections to restrict the search of a question to.
+
+        Returns:
+            Route (see router.py), or None to search the whole collection
+            (no router loaded, or not confident enough)
+        """
+        router = self.query_router
+        if router is None:
+            return None
+        with span("route"):
+            return router.route(queries or [], query_vectors, min_chunks=top_k)
+
+    @staticmethod
+    def _too_few_points(search_results, top_k: int) -> bool:
+        """Whether a filtered search could not fill top_k, even counting every query's results."""
+        return len({point.id for response in search_results for point in response.points}) < top_k
+
+    def _has_sparse_vector(self, collection_info) -> bool:
+        sparse_vectors = collection_info.config.params.sparse_vectors or {}
+        if SPARSE_VECTOR_NAME not in sparse_vectors:
+            logger.warning(
+                "Collection '%s' has no '%s'; using dense retrieval", self.vector_db_collection, SPARSE_VECTOR_NAME
+            )
+            return False
+        return True
+
+    def _query_requests(self, query_vectors, top_k: int, queries: list = None, route=None):
+        query_vectors = np.atleast_2d(query_vectors)
+        query_filter = route.query_filter() if route is not None else None
+        if queries is not None and self._hybrid_available:
+            return [
+                hybrid_query_request(
+                    query_vector,
+                    query,
+                    limit=top_k,
+                    prefetch_limit=max(self.hybrid_prefetch_limit, top_k),
+                    dense_vector_name="mscac-dense-vector",
+                    search_params=self.search_params,
+                    with_payload=self.retrieved_payload_fields,
+                    query_filter=query_filter,
+                )
+                for query_vector, query in zip(query_vectors, queries)
+            ]
+        return [
+            models.QueryRequest(
+                query=query_vector.tolist(),
+                using="mscac-dense-vector",
+                limit=top_k,
+                filter=query_filter,
+                params=self.search_params,
+                with_payload=self.retrieved_payload_fields,
+                with_vector=False,
+            )
+            for query_vector in query_vectors
+        ]
+
+    def fuse_search_results(self, search_results, top_k: int):
+        """
+        Merge the rankings returned for each query vector into one.
+
+        Points are deduplicated by id. With `retrieval_fusion="rrf"` a point
+        scores sum(1 / (rrf_k + rank)) over the rankings it appears in; with
+        `"max"` it keeps its best similarity score.
+
+        Args:
+            search_results: One QueryResponse per query vector
+            top_k: Number of points to keep
+
+        Returns:
+            Top-k ScoredPoints, carrying their fused score
+        """
+        fused = {}
+        for response in search_results:
+            for rank, point in enumerate(response.points):
+                if self.retrieval_fusion == "rrf":
+                    score = 1.0 / (self.rrf_k + rank + 1)
+                else:
+                    score = point.score
+                best = fused.get(point.id)
+                if best is None:
+                    fused[point.id] = point.model_copy(update={"score": score})
+                elif self.retrieval_fusion == "rrf":
+                    best.score += score
+                elif score > best.score:
+                    best.score = score
+
+        return sorted(fused.values(), key=lambda point: point.score, reverse=True)[:top_k]
+
+    def _to_chunk_tuples(self, search_results):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Retrieved %s",
+                [(result.id, round(result.score, 4), result.payload["header"]) for result in search_results],
+            )
+        similarities = []
         for result in search_results:
-            similarities.append((result.payload["header"], result.payload["document_title"], result.payload["content"], result.score)) 
-            #print(result.payload["header"], result.score)
-                
-        #for chunk, chunk_embedding in self.chunks:
-        #    similarity = SimilarityMeasure(self.query_vector, chunk_embedding).similarity
-        #    similarities.append((chunk, similarity))
+            similarities.append((result.payload["header"], result.payload["document_title"], result.payload["content"], result.score))
 
         similarities.sort(key=lambda x: x[3], reverse=True)
         return similarities
@@ -227,19 +926,37 @@ class RAG:
 
         return chunk
     
-    def rag_prompt(self) -> str:
-        context_section = ""
-        for i, chunk_tuple in enumerate(self.top_k_chunks):
-            chunk_text = chunk_tuple[2]  # NOT USING TEXT DOCUMENT OR TITLE YET
-            context_section += f"[Chunk {i}]\n{chunk_text}\n\n"
+    def pack_context(self, request: RAGRequest):
+        """
+        Deduplicate and trim the request's chunks to the context token budget.
+
+        Sentences are ranked against the original question's embedding.
+        """
+        request.packed_context = self.context_packer.pack(
+            request.top_k_chunks, request.query_vectors[0], embed=self.embed_user_queries
+        )
+        return request.packed_context
+
+    async def pack_context_async(self, request: RAGRequest):
+        """Async version of `pack_context`; sentence embeddings go through the batcher."""
+        request.packed_context = await self.context_packer.pack_async(
+            request.top_k_chunks, request.query_vectors[0], embed=self.embed_user_queries_async
+        )
+        return request.packed_context
+
+    def rag_prompt(self, user_query: str, context_section: str, conversation: str = None) -> str:
+        conversation_section = f"""
+        CONVERSATION SO FAR:
+        {conversation}
+        """ if conversation else ""
 
         prompt = f"""You are a helpful assistant answering questions based on the provided context.
         
         CONTEXT:
         {context_section}
-        
+        {conversation_section}
         USER QUESTION:
-        {self.user_query}
+        {user_query}
         
         INSTRUCTIONS:
         - Answer the question using ONLY the information provided in the context above
@@ -322,21 +1039,457 @@ class RAG:
         )
     '''
 
-    def __call__(self, user_query: str, top_k: int = 3):
+    def _lookup_answer(self, request: RAGRequest):
+        """
+        Return a cached answer to a near-duplicate of the request's question.
+
+        Also embeds the original question into `request.cache_vector` so the
+        answer can be stored under it once generated.
+        """
+        if self.answer_cache is None:
+            return None
+        request.cache_vector = self.embed_user_query(request.user_query)
+        return self._cached_answer(request)
+
+    async def _lookup_answer_async(self, request: RAGRequest):
+        """Async version of `_lookup_answer`."""
+        if self.answer_cache is None:
+            return None
+        request.cache_vector = await self.embed_user_query_async(request.user_query)
+        return self._cached_answer(request)
+
+    def _check_corpus_version(self):
+        """
+        Every `corpus_version_check_interval`, pick up a new corpus version.
+
+        Runs at the start of every request, whether or not the answer cache
+        and query routing are on: the local index reloads here too.
+        """
+        if not self._corpus_version_check_due():
+            return
+        if self.local_index is not None:
+            corpus_version = self.local_index.refresh()
+        else:
+            corpus_version = read_corpus_version(self.vector_db_client, self.vector_db_collection)
+        if self._apply_corpus_version(corpus_version):
+            self.load_query_router(corpus_version)
+
+    async def _check_corpus_version_async(self):
+        """Async version of `_check_corpus_version`."""
+        if not self._corpus_version_check_due():
+            return
+        if self.local_index is not None:
+            corpus_version = self.local_index.refresh()
+        else:
+            corpus_version = await read_corpus_version_async(self.async_vector_db_client, self.vector_db_collection)
+        if self._apply_corpus_version(corpus_version):
+            await self.load_query_router_async(corpus_version)
+
+    def _corpus_version_check_due(self) -> bool:
+        if self.answer_cache is None and not self._routes_queries and self.local_index is None:
+            return False
+        if time.monotonic() < self._corpus_version_checked_at + self.corpus_version_check_interval:
+            return False
+        # Set before the check so concurrent requests do not all run it.
+        self._corpus_version_checked_at = time.monotonic()
+        return True
+
+    def _apply_corpus_version(self, corpus_version) -> bool:
+        """Drop cached answers of an older corpus version; True if the query router must be reloaded."""
+        if self.answer_cache is not None:
+            self.answer_cache.set_corpus_version(corpus_version)
+        return self._routes_queries and corpus_version != self._router_corpus_version
+
+    def _cached_answer(self, request: RAGRequest):
+        answer = self.answer_cache.lookup(request.cache_vector)
+        if answer is not None:
+            request.from_cache = True
+            request.response_to_user = answer
+        return answer
+
+    def _store_answer(self, request: RAGRequest):
+        # A follow-up's answer depends on the conversation, not just the question.
+        if self.answer_cache is not None and request.response_to_user and not request.follow_up:
+            self.answer_cache.store(
+                request.cache_vector,
+                request.response_to_user,
+                cost_seconds=time.perf_counter() - request.started_at,
+            )
+
+    def load_session(self, session_id: str) -> Session:
+        """Return the stored session, or a new empty one if it is unknown or expired."""
+        return self.session_store.get(session_id) or Session(session_id)
+
+    async def load_session_async(self, session_id: str) -> Session:
+        """Async version of `load_session`."""
+        return await self._call_session_store(self.session_store.get, session_id) or Session(session_id)
+
+    async def _call_session_store(self, method, *args):
+        # A SQLite store reads and writes a file: keep that off the event loop.
+        if self.session_store.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    def _reuse_session_context(self, request: RAGRequest) -> bool:
+        """
+        Answer a follow-up from the chunks already retrieved in its session.
+
+        Used when the follow-up is close enough to a recent question of the
+        session (see `session_reuse_threshold`) that retrieving again would
+        bring back the same chunks; augmentation and retrieval are skipped.
+        `request.cache_vector` must hold the follow-up's embedding.
+        """
+        if request.session.similarity(request.cache_vector) < self.session_reuse_threshold:
+            return False
+        request.top_k_chunk_ids, request.top_k_chunks = request.session.recent_chunks()
+        if not request.top_k_chunks:
+            return False
+        request.augmented_queries = [request.user_query]
+        request.query_vectors = np.atleast_2d(request.cache_vector)
+        request.reused_session_context = True
+        return True
+
+    def _set_retrieved_points(self, request: RAGRequest, points):
+        request.top_k_chunk_ids = [point.id for point in points]
+        request.top_k_chunks = self._to_chunk_tuples(points)
+        if request.follow_up:
+            # Keep what the conversation was about available to the packer,
+            # which trims the merged chunks to the context budget.
+            retrieved = {str(chunk_id) for chunk_id in request.top_k_chunk_ids}
+            for chunk_id, chunk in zip(*request.session.recent_chunks()):
+                if chunk_id not in retrieved:
+                    request.top_k_chunk_ids.append(chunk_id)
+                    request.top_k_chunks.append(chunk)
+
+    def _prompt(self, request: RAGRequest) -> str:
+        return self.rag_prompt(
+            " ".join(request.augmented_queries), request.packed_context.text, conversation=request.conversation
+        )
+
+    def _record_turn(self, request: RAGRequest) -> bool:
+        """Add the answered question to its session; False if there is none to store."""
+        if request.session is None or not request.response_to_user:
+            return False
+        query_vector = request.cache_vector if request.query_vectors is None else request.query_vectors[0]
+        request.session.record_turn(
+            request.user_query,
+            request.response_to_user,
+            query_vector=query_vector,
+            chunk_ids=request.top_k_chunk_ids,
+            chunks=request.top_k_chunks,
+        )
+        return True
+
+    def _finish_turn(self, request: RAGRequest):
+        """Record the answered question in its session, if any."""
+        if self._record_turn(request):
+            self.session_store.put(request.session)
+
+    async def _finish_turn_async(self, request: RAGRequest):
+        """Async version of `_finish_turn`."""
+        if self._record_turn(request):
+            await self._call_session_store(self.session_store.put, request.session)
+
+    def __call__(self, user_query: str, top_k: int = 3, session_id: str = None):
         """
         Execute the RAG pipeline.
 
         Args:
             user_query: User's question
             top_k: Number of chunks to retrieve
+            session_id: Conversation the question belongs to; its earlier
+                turns are taken into account and this one is added to it
 
         Returns:
             Generated answer from the language model
         """
-        self.user_query = self.augment_user_query(user_query)
-        self.query_vector = self.embed_user_query()
-        self.top_k_chunks = self.retrieve_top_k_relevant_chunks(top_k)
-        self.retrieval_prompt = self.rag_prompt()
-        self.response_to_user = ask_llm(user_prompt=self.retrieval_prompt,model=self.language_model)
-        
-        return self.response_to_user
+        request = RAGRequest(user_query, top_k, self.load_session(session_id) if session_id else None)
+        self._check_corpus_version()
+        if not request.follow_up:
+            with span("answer_cache"):
+                cached = self._lookup_answer(request)
+            if cached is not None:
+                self._finish_turn(request)
+                return request.response_to_user
+
+        reused = False
+        if request.follow_up:
+            with span("session"):
+                if request.cache_vector is None:
+                    request.cache_vector = self.embed_user_query(request.user_query)
+                reused = self._reuse_session_context(request)
+        if not reused:
+            with span("augment"):
+                request.augmented_queries = self.augment_user_query(
+                    request.user_query, conversation=request.conversation
+                )
+            with span("embed"):
+                request.query_vectors = self.embed_user_queries(request.augmented_queries)
+            with span("retrieve"):
+                points = self.retrieve_top_k_points(request.query_vectors, request.top_k, request.augmented_queries)
+                self._set_retrieved_points(request, points)
+        with span("pack"):
+            self.pack_context(request)
+        request.retrieval_prompt = self._prompt(request)
+        with span("generate"):
+            request.response_to_user = ask_llm(user_prompt=request.retrieval_prompt, model=self.language_model)
+        self._store_answer(request)
+        self._finish_turn(request)
+
+        return request.response_to_user
+
+    async def run_async(self, user_query: str, top_k: int = 3, session_id: str = None):
+        """
+        Execute the RAG pipeline without blocking the event loop.
+
+        Network calls go through the async Gemini and Qdrant clients and
+        query encoding runs on the embedding thread pool, so many requests
+        can be in flight on the same RAG instance at once.
+
+        Args:
+            user_query: User's question
+            top_k: Number of chunks to retrieve
+            session_id: Conversation the question belongs to (see `__call__`)
+
+        Returns:
+            Generated answer from the language model
+        """
+        request = await self._start_request_async(user_query, top_k, session_id)
+        if request.from_cache:
+            return request.response_to_user
+
+        await self.prepare_async(request)
+        with span("generate"):
+            request.response_to_user = await ask_llm_async(
+                user_prompt=request.retrieval_prompt, model=self.language_model
+            )
+        self._store_answer(request)
+        await self._finish_turn_async(request)
+
+        return request.response_to_user
+
+    async def _start_request_async(self, user_query: str, top_k: int, session_id: str = None) -> RAGRequest:
+        """New RAGRequest, answered from the answer cache if possible (first turns only)."""
+        session = await self.load_session_async(session_id) if session_id else None
+        request = RAGRequest(user_query, top_k, session)
+        await self._check_corpus_version_async()
+        if not request.follow_up:
+            with span("answer_cache"):
+                cached = await self._lookup_answer_async(request)
+            if cached is not None:
+                await self._finish_turn_async(request)
+        return request
+
+    async def prepare_async(self, request: RAGRequest) -> RAGRequest:
+        """
+        Run every stage of the pipeline up to (not including) generation.
+
+        A follow-up close to a recent question of its session reuses that
+        question's chunks; otherwise the conversation is passed to query
+        augmentation so the generated questions are self-contained.
+
+        Args:
+            request: Request holding the user's question and top_k
+
+        Returns:
+            The same RAGRequest with the retrieval prompt filled in
+        """
+        reused = False
+        if request.follow_up:
+            with span("session"):
+                if request.cache_vector is None:
+                    request.cache_vector = await self.embed_user_query_async(request.user_query)
+                reused = self._reuse_session_context(request)
+        if not reused:
+            with span("augment"):
+                request.augmented_queries = await self.augment_user_query_async(
+                    request.user_query, conversation=request.conversation
+                )
+            with span("embed"):
+                request.query_vectors = await self.embed_user_queries_async(request.augmented_queries)
+            with span("retrieve"):
+                points = await self.retrieve_top_k_points_async(
+                    request.query_vectors, request.top_k, request.augmented_queries
+                )
+                self._set_retrieved_points(request, points)
+        with span("pack"):
+            await self.pack_context_async(request)
+        request.retrieval_prompt = self._prompt(request)
+        return request
+
+    async def stream_async(self, user_query: str, top_k: int = 3, session_id: str = None):
+        """
+        Execute the RAG pipeline and stream the answer as it is generated.
+
+        Retrieval still has to finish before the first token, but the answer
+        itself is forwarded piece by piece instead of after generation ends.
+        A cached answer is sent as a single piece.
+
+        Args:
+            user_query: User's question
+            top_k: Number of chunks to retrieve
+            session_id: Conversation the question belongs to (see `__call__`);
+                the turn is recorded once the whole answer has been sent
+
+        Yields:
+            Text pieces of the generated answer
+        """
+        request = await self._start_request_async(user_query, top_k, session_id)
+        if request.from_cache:
+            yield request.response_to_user
+            return
+
+        await self.prepare_async(request)
+        request.response_to_user = ""
+        # Covers the whole generation, including time the client takes to
+        # consume the pieces.
+        with span("generate"):
+            async for text in stream_llm_async(user_prompt=request.retrieval_prompt, model=self.language_model):
+                request.response_to_user += text
+                yield text
+        self._store_answer(request)
+        await self._finish_turn_async(request)
+
+    async def run_batch_async(self, questions: list, top_k: int = 3, concurrency: int = None):
+        """
+        Answer many independent questions, yielding each one as soon as it is answered.
+
+        Meant for offline evaluation and answer precomputation. Questions are
+        taken `batch_chunk_size` at a time, and for each chunk:
+        1. the questions are embedded in one encode and looked up in the
+           answer cache
+        2. the others are augmented, by concurrent LLM calls
+        3. all their augmented queries are embedded in one encode
+        4. all their searches are sent to Qdrant in one batched request
+        5. the answers are generated concurrently
+        The next chunk is prepared while the answers of the previous one are
+        generated. At most `concurrency` LLM calls (augmentation and
+        generation) are in flight at once.
+
+        A question that fails, e.g. on an LLM error, is yielded with its
+        error; the others carry on. Questions are answered without a session.
+
+        Args:
+            questions: Questions to answer
+            top_k: Number of chunks to retrieve per question
+            concurrency: Most concurrent LLM calls (default: `batch_concurrency`)
+
+        Yields:
+            (index in `questions`, RAGRequest, exception or None), in the
+            order the questions finish
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.batch_concurrency)
+        finished = asyncio.Queue()
+        generations = set()
+
+        def report(index: int, request: RAGRequest, error: Exception = None):
+            finished.put_nowait((index, request, error))
+
+        async def produce():
+            for start in range(0, len(questions), self.batch_chunk_size):
+                # Keep at most one chunk waiting for generation.
+                while len(generations) >= self.batch_chunk_size:
+                    await asyncio.wait(set(generations), return_when=asyncio.FIRST_COMPLETED)
+                end = min(start + self.batch_chunk_size, len(questions))
+                requests = {index: RAGRequest(questions[index], top_k) for index in range(start, end)}
+                prepared = await self._prepare_batch_async(requests, top_k, semaphore, report)
+                for index, request in prepared.items():
+                    task = asyncio.create_task(self._generate_batch_item(index, request, semaphore, report))
+                    generations.add(task)
+                    task.add_done_callback(generations.discard)
+
+        producer = asyncio.create_task(produce())
+        try:
+            for _ in range(len(questions)):
+                yield await finished.get()
+        finally:
+            # The consumer may stop early (e.g. a disconnected client).
+            producer.cancel()
+            for task in list(generations):
+                task.cancel()
+
+    async def _prepare_batch_async(self, requests: dict, top_k: int, semaphore: asyncio.Semaphore, report) -> dict:
+        """
+        Stages 1-4 of `run_batch_async` for one chunk of questions.
+
+        Questions answered from the cache, or that fail, are passed to
+        `report`; if a shared stage (encode, search) fails, every question
+        still pending fails with it.
+
+        Returns:
+            The requests left to generate, by question index
+        """
+        pending = dict(requests)
+        try:
+            await self._check_corpus_version_async()
+            if self.answer_cache is not None:
+                with span("answer_cache"):
+                    cache_vectors = await self.embed_user_queries_async(
+                        [request.user_query for request in pending.values()]
+                    )
+                    for (index, request), cache_vector in zip(list(pending.items()), cache_vectors):
+                        request.cache_vector = cache_vector
+                        if self._cached_answer(request) is not None:
+                            report(index, pending.pop(index))
+
+            async def augment(request: RAGRequest):
+                async with semaphore:
+                    with span("augment"):
+                        request.augmented_queries = await self.augment_user_query_async(request.user_query)
+
+            outcomes = await asyncio.gather(*(augment(request) for request in pending.values()), return_exceptions=True)
+            for index, outcome in zip(list(pending), outcomes):
+                if isinstance(outcome, BaseException):
+                    report(index, pending.pop(index), outcome)
+            if not pending:
+                return pending
+
+            # A question embedded for the cache lookup is not encoded again.
+            reused = {
+                index: request.cache_vector is not None and request.augmented_queries[:1] == [request.user_query]
+                for index, request in pending.items()
+            }
+            texts = [
+                query for index, request in pending.items() for query in request.augmented_queries[int(reused[index]):]
+            ]
+            with span("embed"):
+                query_vectors = await self.embed_user_queries_async(texts) if texts else None
+            start = 0
+            for index, request in pending.items():
+                vectors = [request.cache_vector] if reused[index] else []
+                count = len(request.augmented_queries) - len(vectors)
+                if count:
+                    vectors.extend(query_vectors[start:start + count])
+                request.query_vectors = np.stack(vectors)
+                start += count
+
+            with span("retrieve"):
+                point_sets = await self.retrieve_top_k_points_batch_async(
+                    [request.query_vectors for request in pending.values()],
+                    top_k,
+                    [request.augmented_queries for request in pending.values()],
+                )
+            for request, points in zip(pending.values(), point_sets):
+                self._set_retrieved_points(request, points)
+        except Exception as error:
+            logger.exception("Batch of %d questions failed", len(pending))
+            for index in list(pending):
+                report(index, pending.pop(index), error)
+        return pending
+
+    async def _generate_batch_item(self, index: int, request: RAGRequest, semaphore: asyncio.Semaphore, report):
+        """Stage 5 of `run_batch_async` for one question."""
+        try:
+            with span("pack"):
+                await self.pack_context_async(request)
+            request.retrieval_prompt = self._prompt(request)
+            async with semaphore:
+                with span("generate"):
+                    request.response_to_user = await ask_llm_async(
+                        user_prompt=request.retrieval_prompt, model=self.language_model
+                    )
+            self._store_answer(request)
+        except Exception as error:
+            report(index, request, error)
+            return
+        report(index, request)
@@ -0,0 +1,355 @@
+"""
+Query routing to handbook sections, pushed down as Qdrant payload filters.
+
+Ingestion computes one centroid per section, i.e. per (document_title,
+header) pair: the normalized mean of the dense vectors of its chunks. They
+are stored in the `<collection>_meta` sidecar collection next to the corpus
+version manifest, so every serving process loads the same ones.
+
+At query time QueryRouter picks the sections a question is likely about:
+- keyword rules: a section whose header words all appear in the query
+  (headers that are only numbers, such as page numbers, have no rule), plus
+  optional regex rules naming headers or documents
+- the centroid classifier: sections whose centroid is within `margin` of
+  the best cosine similarity to the query, widened until they hold enough
+  chunks to fill top_k
+Retrieval then only searches those sections, through a `header` /
+`document_title` filter that Qdrant answers from the keyword payload
+indexes ingestion creates. A question that matches no rule and is not
+similar enough to any centroid (`min_similarity`) is not routed: it is
+searched over the whole collection, as is a routed one whose filter returns
+fewer than top_k points.
+"""
+
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient, models
+
+from .manifest import META_VECTOR_NAME, ensure_meta_collection, meta_collection_name
+from .sparse import tokenize
+
+CENTROID_KIND = "centroid"
+CENTROID_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "csc2701/centroids")
+DENSE_VECTOR_NAME = "mscac-dense-vector"
+# Header words shorter than this do not make a keyword rule on their own.
+MIN_KEYWORD_LENGTH = 3
+
+CENTROID_FILTER = models.Filter(
+    must=[models.FieldCondition(key="kind", match=models.MatchValue(value=CENTROID_KIND))]
+)
+
+
+def compute_header_centroids(client: QdrantClient, collection_name: str, vector_name: str = DENSE_VECTOR_NAME) -> list:
+    """
+    Centroids of every section of the collection.
+
+    Args:
+        client: Qdrant client connected to the instance holding the collection
+        collection_name: Collection of chunk points
+        vector_name: Name of the collection's dense vector
+
+    Returns:
+        List of {"document_title", "header", "chunks", "vector"} dicts; the
+        vector is the normalized mean of the section's chunk vectors
+    """
+    sums, counts = {}, defaultdict(int)
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=1000,
+            offset=offset,
+            with_payload=["header", "document_title"],
+            with_vectors=[vector_name],
+        )
+        for point in points:
+            payload = point.payload or {}
+            vector = point.vector.get(vector_name) if isinstance(point.vector, dict) else point.vector
+            if vector is None or "header" not in payload:
+                continue
+            section = (payload.get("document_title", ""), payload["header"])
+            vector = np.asarray(vector, dtype=np.float32)
+            sums[section] = sums[section] + vector if section in sums else vector.copy()
+            counts[section] += 1
+        if offset is None:
+            break
+    return [
+        {"document_title": section[0], "header": section[1], "chunks": counts[section], "vector": normalize(total)}
+        for section, total in sums.items()
+    ]
+
+
+def normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def centroid_point_id(document_title: str, header: str) -> str:
+    return str(uuid.uuid5(CENTROID_ID_NAMESPACE, f"{document_title}\x1f{header}"))
+
+
+def write_header_centroids(client: QdrantClient, collection_name: str, centroids: list, vector_size: int = 384):
+    """Replace the centroids stored in the sidecar collection of `collection_name`."""
+    meta_collection = ensure_meta_collection(client, collection_name, vector_size)
+    client.delete(
+        collection_name=meta_collection,
+        points_selector=models.FilterSelector(filter=CENTROID_FILTER),
+        wait=True,
+    )
+    if not centroids:
+        return
+    client.upsert(
+        collection_name=meta_collection,
+        points=[
+            models.PointStruct(
+                id=centroid_point_id(centroid["document_title"], centroid["header"]),
+                vector={META_VECTOR_NAME: np.asarray(centroid["vector"], dtype=np.float32).tolist()},
+                payload={
+                    "kind": CENTROID_KIND,
+                    "document_title": centroid["document_title"],
+                    "header": centroid["header"],
+                    "chunks": centroid["chunks"],
+                    "updated_at": time.time(),
+                },
+            )
+            for centroid in centroids
+        ],
+        wait=True,
+    )
+
+
+def update_header_centroids(client: QdrantClient, collection_name: str, vector_size: int = 384) -> int:
+    """
+    Recompute and store the centroids of `collection_name` after an ingestion.
+
+    Returns:
+        Number of sections
+    """
+    centroids = compute_header_centroids(client, collection_name)
+    write_header_centroids(client, collection_name, centroids, vector_size)
+    return len(centroids)
+
+
+def has_header_centroids(client: QdrantClient, collection_name: str) -> bool:
+    meta_collection = meta_collection_name(collection_name)
+    if not client.collection_exists(meta_collection):
+        return False
+    return client.count(meta_collection, count_filter=CENTROID_FILTER, exact=True).count > 0
+
+
+def _centroids_from_points(points) -> list:
+    return [
+        {
+            "document_title": point.payload.get("document_title", ""),
+            "header": point.payload["header"],
+            "chunks": point.payload.get("chunks", 1),
+            "vector": np.asarray(point.vector[META_VECTOR_NAME], dtype=np.float32),
+        }
+        for point in points
+    ]
+
+
+def read_header_centroids(client: QdrantClient, collection_name: str) -> list:
+    """Return the stored centroids of `collection_name` (empty if never computed)."""
+    meta_collection = meta_collection_name(collection_name)
+    if not client.collection_exists(meta_collection):
+        return []
+    centroids, offset = [], None
+    while True:
+        points, offset = client.scroll(
+            meta_collection, scroll_filter=CENTROID_FILTER, limit=1000, offset=offset, with_vectors=True
+        )
+        centroids.extend(_centroids_from_points(points))
+        if offset is None:
+            return centroids
+
+
+async def read_header_centroids_async(client: AsyncQdrantClient, collection_name: str) -> list:
+    """Async version of `read_header_centroids`."""
+    meta_collection = meta_collection_name(collection_name)
+    if not await client.collection_exists(meta_collection):
+        return []
+    centroids, offset = [], None
+    while True:
+        points, offset = await client.scroll(
+            meta_collection, scroll_filter=CENTROID_FILTER, limit=1000, offset=offset, with_vectors=True
+        )
+        centroids.extend(_centroids_from_points(points))
+        if offset is None:
+            return centroids
+
+
+def _keyword_forms(token: str) -> set:
+    # Enough stemming for "fee" to match "FEES" and "internships" "INTERNSHIP".
+    return {token, token[:-1]} if token.endswith("s") and len(token) > MIN_KEYWORD_LENGTH else {token}
+
+
+class Route:
+    """
+    Sections a query was routed to.
+
+    Args:
+        sections: (document_title, header) pairs to search
+        similarity: Cosine similarity of the query to the best centroid
+        keyword: Whether a keyword rule matched
+    """
+
+    def __init__(self, sections: list, similarity: float, keyword: bool = False):
+        self.sections = sections
+        self.similarity = similarity
+        self.keyword = keyword
+
+    def query_filter(self) -> models.Filter:
+        """Payload filter restricting a search to the route's sections."""
+        headers_by_document = defaultdict(list)
+        for document_title, header in self.sections:
+            headers_by_document[document_title].append(header)
+        return models.Filter(
+            should=[
+                models.Filter(must=[
+                    models.FieldCondition(key="document_title", match=models.MatchValue(value=document_title)),
+                    models.FieldCondition(key="header", match=models.MatchAny(any=headers)),
+                ])
+                for document_title, headers in headers_by_document.items()
+            ]
+        )
+
+
+class QueryRouter:
+    """
+    Maps queries to the sections they are likely about.
+
+    Args:
+        centroids: Section centroids (see `compute_header_centroids`)
+        rules: Extra keyword rules, [{"pattern": regex, "headers": [...],
+            "documents": [...]}]; a query matching `pattern` (case
+            insensitive) is routed to the listed headers (in any document)
+            and to every section of the listed documents
+        min_similarity: Cosine similarity to the best centroid below which a
+            query no keyword rule matched is not routed
+        margin: Sections whose similarity is within this of the best one
+            are searched too
+        max_sections: Most sections chosen by similarity alone
+        corpus_version: Corpus version the centroids were computed for
+
+    Attributes:
+        routed, keyword_routed, unrouted, fallbacks: Counters of queries
+            routed, routed thanks to a keyword rule, searched unfiltered for
+            lack of confidence, and searched again unfiltered because their
+            filter returned too few points
+    """
+
+    def __init__(
+            self,
+            centroids: list,
+            rules: list = None,
+            min_similarity: float = 0.45,
+            margin: float = 0.05,
+            max_sections: int = 4,
+            corpus_version: str = None
+        ):
+        if not centroids:
+            raise ValueError("QueryRouter needs at least one section centroid")
+        self.sections = [(centroid["document_title"], centroid["header"]) for centroid in centroids]
+        self.chunk_counts = np.array([centroid["chunks"] for centroid in centroids])
+        self.matrix = np.stack([normalize(centroid["vector"]) for centroid in centroids])
+        self.min_similarity = min_similarity
+        self.margin = margin
+        self.max_sections = max_sections
+        self.corpus_version = corpus_version
+        self.header_keywords = [
+            [_keyword_forms(token) for token in tokenize(header) if len(token) >= MIN_KEYWORD_LENGTH and token.isalpha()]
+            for _, header in self.sections
+        ]
+        self.rules = []
+        for rule in rules or []:
+            headers, documents = set(rule.get("headers", [])), set(rule.get("documents", []))
+            self.rules.append((
+                re.compile(rule["pattern"], re.IGNORECASE),
+                [i for i, (document_title, header) in enumerate(self.sections)
+                 if header in headers or document_title in documents],
+            ))
+        self.routed = 0
+        self.keyword_routed = 0
+        self.unrouted = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def keyword_sections(self, queries: list) -> list:
+        """Indexes of the sections a keyword rule matches in any of `queries`."""
+        text = " ".join(queries)
+        tokens = set()
+        for token in tokenize(text):
+            tokens |= _keyword_forms(token)
+        matched = {
+            i for i, keywords in enumerate(self.header_keywords)
+            if keywords and all(forms & tokens for forms in keywords)
+        }
+        for pattern, sections in self.rules:
+            if pattern.search(text):
+                matched.update(sections)
+        return sorted(matched)
+
+    def route(self, queries: list, query_vectors, min_chunks: int = 1):
+        """
+        Sections to search for a question.
+
+        Args:
+            queries: The question and its generated questions (keyword rules)
+            query_vectors: Their embeddings; classified by their mean
+            min_chunks: Fewest chunks the sections must hold together
+                (top_k), so a filtered search can fill the result
+
+        Returns:
+            Route, or None to search the whole collection
+        """
+        query_vector = normalize(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)).mean(axis=0))
+        similarities = self.matrix @ query_vector
+        order = np.argsort(-similarities)
+        best = float(similarities[order[0]])
+        chosen = self.keyword_sections(queries or [])
+        keyword = bool(chosen)
+        if not keyword and best < self.min_similarity:
+            with self._lock:
+                self.unrouted += 1
+            return None
+
+        chosen = set(chosen)
+        by_similarity = 0
+        for i in order:
+            close = similarities[i] >= best - self.margin and by_similarity < self.max_sections
+            if not close and self.chunk_counts[list(chosen)].sum() >= min_chunks:
+                break
+            if i not in chosen:
+                chosen.add(i)
+                by_similarity += 1
+        if len(chosen) == len(self.sections):
+            with self._lock:
+                self.unrouted += 1
+            return None
+        with self._lock:
+            self.routed += 1
+            self.keyword_routed += keyword
+        return Route([self.sections[i] for i in sorted(chosen)], best, keyword)
+
+    def record_fallback(self):
+        with self._lock:
+            self.fallbacks += 1
+
+    def stats(self) -> dict:
+        queries = self.routed + self.unrouted
+        return {
+            "sections": len(self.sections),
+            "corpus_version": self.corpus_version,
+            "routed": self.routed,
+            "keyword_routed": self.keyword_routed,
+            "unrouted": self.unrouted,
+            "fallbacks": self.fallbacks,
+            "routed_rate": self.routed / queries if queries else 0.0,
+        }
@@ -0,0 +1,320 @@
+"""
+Server-side conversation sessions.
+
+A client sends a session id and only its new message; the server keeps what
+later turns need:
+- the last few question/answer pairs verbatim, and a rolling summary of the
+  older ones (one condensed line per turn, trimmed to a token budget)
+- the embeddings of the recent questions, to recognise a follow-up that
+  asks about the same thing again
+- the chunks retrieved for the recent turns, by point id, so such a
+  follow-up is answered from them instead of running augmentation and
+  retrieval again
+
+Sessions live in a SessionStore: InMemorySessionStore (LRU + TTL) by
+default, or SQLiteSessionStore to keep them in a local file shared by
+several worker processes and across restarts.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .context_packer import estimate_tokens, split_sentences
+
+
+class Session:
+    """
+    Conversation state of one client, kept between turns.
+
+    Args:
+        session_id: Id chosen by (or returned to) the client
+
+    Attributes:
+        turns: Recent (question, answer) pairs, oldest first
+        summary: One condensed line per older turn, oldest first
+        query_vectors: Embeddings of the questions of `turns`
+        chunks: Chunks retrieved for the recent turns, by point id, most
+            recent last; (header, document_title, content) tuples
+        updated_at: Wall-clock time of the last turn
+    """
+
+    MAX_TURNS = 3
+    SUMMARY_TOKENS = 300
+    MAX_CHUNKS = 12
+    # Answers are cut to this in the prompt's conversation section.
+    MAX_ANSWER_CHARS = 600
+    MAX_SUMMARY_LINE_CHARS = 240
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.turns = []
+        self.summary = []
+        self.query_vectors = []
+        self.chunks = OrderedDict()
+        self.updated_at = time.time()
+
+    def __bool__(self):
+        # A session without any turn yet behaves like no session.
+        return bool(self.turns or self.summary)
+
+    def record_turn(self, question: str, answer: str, query_vector=None, chunk_ids=(), chunks=()):
+        """
+        Add a finished turn, folding the oldest one into the summary if needed.
+
+        Args:
+            question: The user's message
+            answer: The generated answer
+            query_vector: Embedding of `question`
+            chunk_ids: Point ids of the chunks the answer was based on
+            chunks: The matching (header, document_title, content, ...) tuples
+        """
+        self.turns.append((question, answer))
+        self.query_vectors.append(
+            None if query_vector is None else np.asarray(query_vector, dtype=np.float32)
+        )
+        while len(self.turns) > self.MAX_TURNS:
+            self.summary.append(self._condense(*self.turns.pop(0)))
+            self.query_vectors.pop(0)
+        while len(self.summary) > 1 and estimate_tokens("\n".join(self.summary)) > self.SUMMARY_TOKENS:
+            self.summary.pop(0)
+
+        for chunk_id, chunk in zip(chunk_ids, chunks):
+            self.chunks.pop(str(chunk_id), None)
+            self.chunks[str(chunk_id)] = tuple(chunk[:3])
+        while len(self.chunks) > self.MAX_CHUNKS:
+            self.chunks.popitem(last=False)
+        self.updated_at = time.time()
+
+    def _condense(self, question: str, answer: str) -> str:
+        sentences = split_sentences(answer)
+        line = f"User asked: {question} Answer: {sentences[0] if sentences else ''}"
+        if len(line) > self.MAX_SUMMARY_LINE_CHARS:
+            line = line[:self.MAX_SUMMARY_LINE_CHARS - 3].rstrip() + "..."
+        return line
+
+    def conversation_text(self) -> str:
+        """The conversation so far, as put in prompts: the summary, then the recent turns."""
+        lines = list(self.summary)
+        for question, answer in self.turns:
+            if len(answer) > self.MAX_ANSWER_CHARS:
+                answer = answer[:self.MAX_ANSWER_CHARS - 3].rstrip() + "..."
+            lines.append(f"User: {question}")
+            lines.append(f"Assistant: {answer}")
+        return "\n".join(lines)
+
+    def similarity(self, query_vector) -> float:
+        """Highest cosine similarity between `query_vector` and a recent question (0 if none)."""
+        vectors = [vector for vector in self.query_vectors if vector is not None]
+        if not vectors:
+            return 0.0
+        vectors = np.stack(vectors)
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+        return float(np.max((vectors @ query_vector) / np.maximum(norms, 1e-12)))
+
+    def recent_chunks(self):
+        """Point ids and (header, document_title, content, score) tuples of the remembered chunks, newest first."""
+        ids = list(reversed(self.chunks))
+        return ids, [self.chunks[chunk_id] + (0.0,) for chunk_id in ids]
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "turns": [list(turn) for turn in self.turns],
+            "summary": self.summary,
+            "query_vectors": [None if vector is None else vector.tolist() for vector in self.query_vectors],
+            "chunks": [[chunk_id, *chunk] for chunk_id, chunk in self.chunks.items()],
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Session":
+        session = cls(data["session_id"])
+        session.turns = [tuple(turn) for turn in data["turns"]]
+        session.summary = list(data["summary"])
+        session.query_vectors = [
+            None if vector is None else np.asarray(vector, dtype=np.float32) for vector in data["query_vectors"]
+        ]
+        session.chunks = OrderedDict((chunk[0], tuple(chunk[1:])) for chunk in data["chunks"])
+        session.updated_at = data["updated_at"]
+        return session
+
+
+class InMemorySessionStore:
+    """
+    Bounded LRU + TTL store of sessions in this process.
+
+    Args:
+        max_sessions: Most sessions kept; the least recently used go first
+        ttl: Seconds a session is kept after its last turn (None = forever)
+    """
+
+    # Whether get/put do I/O, and so must not run on an event loop.
+    blocking = False
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str):
+        """Return the session, or None if it does not exist or expired."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                session, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._sessions.move_to_end(session_id)
+                    self.hits += 1
+                    return session
+                del self._sessions[session_id]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, session: Session):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._sessions.pop(session.session_id, None)
+            self._sessions[session.session_id] = (session, expires_at)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SQLiteSessionStore:
+    """
+    Session store in a local SQLite file, shared by every process using it.
+
+    Sessions are stored as JSON. Expired sessions are ignored on read and
+    deleted, together with the least recently updated ones past
+    `max_sessions`, every `prune_interval` writes.
+
+    Args:
+        path: SQLite database file (created if missing)
+        max_sessions: Most sessions kept
+        ttl: Seconds a session is kept after its last turn (None = forever)
+        prune_interval: Writes between two pruning passes
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, max_sessions: int = 10000, ttl: float = 3600, prune_interval: int = 100):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, session_id: str):
+        """Return the session, or None if it does not exist or expired."""
+        row = self._connection().execute(
+            "SELECT data, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or (self.ttl is not None and row[1] + self.ttl <= time.time()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return Session.from_dict(json.loads(row[0]))
+
+    def put(self, session: Session):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)",
+                (session.session_id, json.dumps(session.to_dict()), session.updated_at),
+            )
+        self._writes += 1
+        if self._writes % self.prune_interval == 0:
+            self.prune()
+
+    def prune(self):
+        """Delete expired sessions and the least recently updated ones past `max_sessions`."""
+        connection = self._connection()
+        with connection:
+            if self.ttl is not None:
+                connection.execute("DELETE FROM sessions WHERE updated_at <= ?", (time.time() - self.ttl,))
+            connection.execute(
+                "DELETE FROM sessions WHERE session_id IN "
+                "(SELECT session_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+
+    def delete(self, session_id: str) -> bool:
+        connection = self._connection()
+        with connection:
+            cursor = connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        return cursor.rowcount > 0
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self),
+            "max_sessions": self.max_sessions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_session_store(path: str = None, max_sessions: int = 10000, ttl: float = 3600):
+    """SQLiteSessionStore at `path`, or an InMemorySessionStore without one."""
+    if path:
+        return SQLiteSessionStore(path, max_sessions=max_sessions, ttl=ttl)
+    return InMemorySessionStore(max_sessions=max_sessions, ttl=ttl)
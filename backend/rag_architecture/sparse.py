@@ -0,0 +1,150 @@
+"""
+Lexical (BM25) sparse vectors for hybrid retrieval.
+
+Dense MiniLM embeddings are weak on exact terms such as course codes
+("CSC2701H"), names and dates. Each chunk therefore also gets a sparse
+vector holding the BM25 term-frequency weight of every token, indexed by a
+stable hash of the token. The IDF half of BM25 is left to Qdrant
+(`Modifier.IDF` on the sparse vector), which keeps it up to date as the
+collection changes. Queries only list their tokens with weight 1.
+
+The length normalization needs the average chunk length of the collection.
+Its first ingestion computes it and records it in the collection's manifest
+(see manifest.py), and later ones reuse it.
+
+Ingestion and serving must tokenize the same way, so both use this module.
+"""
+
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+from qdrant_client import models
+
+SPARSE_VECTOR_NAME = "mscac-sparse-vector"
+
+# BM25 parameters.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.@'][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be been before but by can could
+did do does for from had has have how i if in into is it its may me must my no
+not of on or our should so such than that the their them then there these they
+this to was we were what when where which who why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> list:
+    """Lower-cased word tokens without stopwords; keeps codes, emails and decimals whole."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def token_index(token: str) -> int:
+    """Stable 32-bit index of a token (Python's hash() is salted per process)."""
+    return zlib.crc32(token.encode("utf-8"))
+
+
+def sparse_vector_params() -> models.SparseVectorParams:
+    """Collection config of the sparse vector: Qdrant applies IDF at query time."""
+    return models.SparseVectorParams(modifier=models.Modifier.IDF)
+
+
+def average_document_length(texts) -> float:
+    """Mean token count of `texts` (at least 1): the BM25 average document length."""
+    lengths = [len(tokenize(text)) for text in texts]
+    return max(1.0, sum(lengths) / len(lengths)) if lengths else 1.0
+
+
+def document_sparse_vector(text: str, average_length: float = None) -> models.SparseVector:
+    """
+    BM25 term-frequency weights of a chunk.
+
+    Args:
+        text: Chunk text (header and content)
+        average_length: Average token count of the collection's chunks (see
+            `average_document_length`); None leaves out length normalization
+
+    Returns:
+        SparseVector with one entry per distinct token
+    """
+    tokens = tokenize(text)
+    counts = Counter(token_index(token) for token in tokens)
+    length_ratio = len(tokens) / average_length if average_length else 1.0
+    length_norm = BM25_K1 * (1 - BM25_B + BM25_B * length_ratio)
+    indices = sorted(counts)
+    return models.SparseVector(
+        indices=indices,
+        values=[counts[i] * (BM25_K1 + 1) / (counts[i] + length_norm) for i in indices],
+    )
+
+
+def query_sparse_vector(text: str) -> models.SparseVector:
+    """Sparse query vector: every distinct token with weight 1."""
+    indices = sorted({token_index(token) for token in tokenize(text)})
+    return models.SparseVector(indices=indices, values=[1.0] * len(indices))
+
+
+def hybrid_query_request(
+        dense_vector,
+        text: str,
+        limit: int,
+        prefetch_limit: int,
+        dense_vector_name: str,
+        with_payload=True,
+        search_params: models.SearchParams = None,
+        query_filter: models.Filter = None
+    ) -> models.QueryRequest:
+    """
+    One Query API request fusing a dense and a sparse search server-side.
+
+    Both searches run as prefetches of `prefetch_limit` candidates and are
+    merged with reciprocal rank fusion inside Qdrant. A text without any
+    searchable token falls back to the dense search alone.
+
+    Args:
+        dense_vector: Query embedding
+        text: Query text, tokenized for the sparse search
+        limit: Number of fused points to return
+        prefetch_limit: Candidates fetched by each of the two searches
+        dense_vector_name: Name of the collection's dense vector
+        with_payload: Payload selector of the returned points
+        search_params: Search parameters of the dense search (HNSW ef,
+            quantization rescoring)
+        query_filter: Payload filter applied to both searches
+
+    Returns:
+        QueryRequest for `query_points` / `query_batch_points`
+    """
+    sparse_vector = query_sparse_vector(text)
+    if not sparse_vector.indices:
+        return models.QueryRequest(
+            query=np.asarray(dense_vector).tolist(),
+            using=dense_vector_name,
+            limit=limit,
+            filter=query_filter,
+            params=search_params,
+            with_payload=with_payload,
+            with_vector=False,
+        )
+    return models.QueryRequest(
+        prefetch=[
+            models.Prefetch(
+                query=np.asarray(dense_vector).tolist(),
+                using=dense_vector_name,
+                limit=prefetch_limit,
+                filter=query_filter,
+                params=search_params,
+            ),
+            models.Prefetch(
+                query=sparse_vector, using=SPARSE_VECTOR_NAME, limit=prefetch_limit, filter=query_filter
+            ),
+        ],
+        query=models.FusionQuery(fusion=models.Fusion.RRF),
+        limit=limit,
+        with_payload=with_payload,
+        with_vector=False,
+    )
@@ -0,0 +1,141 @@
+"""
+Concurrent requests on one RAG instance.
+
+Runs N `run_async` calls at once against a FakeGeminiServer (which echoes
+the question it is asked to answer), an in-memory Qdrant collection and a
+bag-of-words stub encoder, and checks that no per-request state leaks from
+one question to another and that the requests really overlap.
+
+Run from the repository root: python -m pytest backend/tests
+"""
+
+import asyncio
+import hashlib
+import re
+import time
+
+import numpy as np
+import pytest
+from qdrant_client import models
+
+from backend.benchmarks.fake_gemini import FakeGeminiServer
+from backend.rag_architecture import llm
+from backend.rag_architecture import rag as rag_module
+
+DIMENSION = 384
+LLM_LATENCY = 0.2
+CONCURRENT_REQUESTS = 16
+
+CHUNKS = [
+    ("COURSE REQUIREMENTS", "Students must complete four technical graduate courses."),
+    ("THE INTERNSHIP PROCESS", "The applied research internship lasts eight months."),
+    ("IMPORTANT CONTACTS", "Contact the program office for administrative questions."),
+    ("FEES AND FINANCES", "Tuition fees are paid each session."),
+]
+
+
+class StubEncoder:
+    """Deterministic bag-of-words embeddings; no model download."""
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), DIMENSION), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % DIMENSION] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class EchoGeminiServer(FakeGeminiServer):
+    """Answers every question with the question it found in the prompt."""
+
+    def answer_tokens(self, prompt: str):
+        if "JSON array" in prompt:
+            return super().answer_tokens(prompt)
+        match = re.search(r"USER QUESTION:\s*(\S+)", prompt)
+        return ["answer to ", match.group(1) if match else "nothing"]
+
+
+@pytest.fixture
+def gemini():
+    with EchoGeminiServer(latency=LLM_LATENCY) as server:
+        llm.configure(api_key="fake", base_url=server.url)
+        yield server
+    llm.configure()
+
+
+@pytest.fixture
+def rag(monkeypatch):
+    monkeypatch.setattr(rag_module, "load_embedding_model", lambda *args, **kwargs: StubEncoder())
+    instance = rag_module.RAG(
+        vector_db_url=":memory:",
+        retrieval_mode="dense",
+        answer_cache_size=0,
+        embedding_cache_bytes=0,
+    )
+    yield instance
+    instance.embedding_executor.shutdown(wait=False)
+
+
+async def seed_collection(rag):
+    client = rag.async_vector_db_client
+    await client.create_collection(
+        rag.vector_db_collection,
+        vectors_config={
+            "mscac-dense-vector": models.VectorParams(size=DIMENSION, distance=models.Distance.COSINE),
+        },
+    )
+    vectors = StubEncoder().encode([f"{header} {content}" for header, content in CHUNKS])
+    await client.upsert(
+        rag.vector_db_collection,
+        points=[
+            models.PointStruct(
+                id=i,
+                vector={"mscac-dense-vector": vector.tolist()},
+                payload={"header": header, "document_title": "handbook.txt", "content": content},
+            )
+            for i, ((header, content), vector) in enumerate(zip(CHUNKS, vectors))
+        ],
+    )
+
+
+def test_concurrent_requests_keep_their_own_state(gemini, rag):
+    # One token per question that appears in no other question or chunk.
+    questions = [f"q{i:03d}x" for i in range(CONCURRENT_REQUESTS)]
+    prepared = []
+    prepare_async = rag.prepare_async
+
+    async def recording_prepare_async(request):
+        prepared.append(request)
+        return await prepare_async(request)
+
+    rag.prepare_async = recording_prepare_async
+
+    async def scenario():
+        await seed_collection(rag)
+        start = time.perf_counter()
+        await rag.run_async(questions[0])
+        single = time.perf_counter() - start
+        prepared.clear()
+
+        start = time.perf_counter()
+        answers = await asyncio.gather(*(rag.run_async(question) for question in questions))
+        return single, time.perf_counter() - start, answers
+
+    single, concurrent, answers = asyncio.run(scenario())
+
+    for question, answer in zip(questions, answers):
+        assert answer == f"answer to {question}"
+
+    assert sorted(request.user_query for request in prepared) == sorted(questions)
+    for request in prepared:
+        others = [question for question in questions if question != request.user_query]
+        assert request.augmented_queries[0] == request.user_query
+        assert len(request.query_vectors) == len(request.augmented_queries)
+        assert request.user_query in request.retrieval_prompt
+        assert not any(other in request.retrieval_prompt for other in others)
+        assert request.response_to_user == f"answer to {request.user_query}"
+
+    # Two LLM calls per question: serially this would take N times as long.
+    assert single >= 2 * LLM_LATENCY
+    assert concurrent < CONCURRENT_REQUESTS * single / 4
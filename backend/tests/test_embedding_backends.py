@@ -0,0 +1,125 @@
+"""
+Accuracy tolerance of the ONNX embedding backends.
+
+bench_embedding_backends.py checks the real model against torch, which needs
+a model download and PyTorch. This test runs the same check (`agreement`,
+`within_tolerance`) offline: it writes a small transformer-shaped ONNX model
+and word-level tokenizer for the handbook vocabulary, loads it through
+`export_onnx_model` (which writes the int8 variant) and OnnxEmbeddingModel,
+and compares both backends to the same network computed in numpy.
+
+Run from the repository root: python -m pytest backend/tests
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+import pytest
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+pytest.importorskip("huggingface_hub")
+
+from onnx import TensorProto, helper, numpy_helper
+from tokenizers import Tokenizer, models, normalizers, pre_tokenizers
+
+from backend.benchmarks.bench_embedding_backends import TOLERANCES, agreement, within_tolerance
+from backend.benchmarks.bench_hybrid_retrieval import HANDBOOK_PATH, load_questions
+from backend.rag_architecture.embeddings import OnnxEmbeddingModel, export_onnx_model
+from backend.vector_db.parsers import split_text_by_headers
+
+DIMENSION = 64
+HIDDEN = 256
+MAX_SEQ_LENGTH = 256
+K = 5
+
+
+@pytest.fixture(scope="module")
+def texts():
+    with open(HANDBOOK_PATH, "r", encoding="utf-8") as file:
+        chunks = [chunk["content"] for chunk in split_text_by_headers(file.read())]
+    return chunks, [question["question"] for question in load_questions()]
+
+
+@pytest.fixture(scope="module")
+def network(texts):
+    """Weights of the test model: token embeddings and a residual feed-forward layer."""
+    words = sorted({word for text in texts[0] + texts[1] for word in re.findall(r"\w+", text.lower())})
+    vocab = {"[PAD]": 0, "[UNK]": 1, **{word: i + 2 for i, word in enumerate(words)}}
+    rng = np.random.default_rng(0)
+    return {
+        "vocab": vocab,
+        "embeddings": rng.normal(size=(len(vocab), DIMENSION)).astype(np.float32),
+        "w1": (rng.normal(size=(DIMENSION, HIDDEN)) / np.sqrt(DIMENSION)).astype(np.float32),
+        "w2": (rng.normal(size=(HIDDEN, DIMENSION)) / np.sqrt(HIDDEN)).astype(np.float32),
+    }
+
+
+@pytest.fixture(scope="module")
+def model_dir(network, tmp_path_factory):
+    model_dir = str(tmp_path_factory.mktemp("onnx-model"))
+
+    tokenizer = Tokenizer(models.WordLevel(network["vocab"], unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.Lowercase()
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.save(os.path.join(model_dir, "tokenizer.json"))
+    for name, config in {
+        "sentence_bert_config.json": {"max_seq_length": MAX_SEQ_LENGTH},
+        "pooling_config.json": {"pooling_mode_mean_tokens": True},
+        "modules.json": [{"type": "sentence_transformers.models.Normalize"}],
+    }.items():
+        with open(os.path.join(model_dir, name), "w", encoding="utf-8") as file:
+            json.dump(config, file)
+
+    graph = helper.make_graph(
+        [
+            helper.make_node("Gather", ["embeddings", "input_ids"], ["tokens"]),
+            helper.make_node("MatMul", ["tokens", "w1"], ["hidden"]),
+            helper.make_node("Tanh", ["hidden"], ["activated"]),
+            helper.make_node("MatMul", ["activated", "w2"], ["projected"]),
+            helper.make_node("Add", ["projected", "tokens"], ["last_hidden_state"]),
+        ],
+        "test-encoder",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"])],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", DIMENSION])],
+        initializer=[numpy_helper.from_array(network[name], name) for name in ("embeddings", "w1", "w2")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, os.path.join(model_dir, "model.onnx"))
+    # model.onnx exists, so nothing is downloaded; writes model_int8.onnx.
+    return export_onnx_model("test-encoder", model_dir, quantize=True)
+
+
+def reference_encode(network, model_dir, texts) -> np.ndarray:
+    """The test network in float64 numpy, standing in for the torch reference."""
+    tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+    tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+    vectors = []
+    for encoding in tokenizer.encode_batch(texts):
+        tokens = network["embeddings"][encoding.ids].astype(np.float64)
+        hidden = np.tanh(tokens @ network["w1"]) @ network["w2"] + tokens
+        vector = hidden.mean(axis=0)
+        vectors.append(vector / np.linalg.norm(vector))
+    return np.array(vectors)
+
+
+def encode_all(encode, texts) -> dict:
+    chunks, questions = texts
+    return {
+        "chunk_vectors": np.asarray(encode(chunks), dtype=np.float32),
+        "query_vectors": np.asarray(encode(questions), dtype=np.float32),
+    }
+
+
+@pytest.mark.parametrize("backend", list(TOLERANCES))
+def test_onnx_backend_within_tolerance(backend, network, model_dir, texts):
+    reference = encode_all(lambda batch: reference_encode(network, model_dir, batch), texts)
+    model = OnnxEmbeddingModel(model_dir, quantized=backend == "onnx-int8")
+    result = encode_all(model.encode, texts)
+
+    min_cosine, overlap = agreement(reference, result, K)
+    assert within_tolerance(backend, min_cosine, overlap), (backend, min_cosine, overlap)
@@ -1,116 +1,565 @@
-import re
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 
 from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, VectorParams, Distance
-from sentence_transformers import SentenceTransformer
+from qdrant_client.models import (
+    Disabled,
+    Distance,
+    FieldCondition,
+    Filter,
+    MatchValue,
+    PointIdsList,
+    PointStruct,
+    VectorParams,
+    VectorParamsDiff,
+)
+
+from backend.rag_architecture.chunk_store import ChunkStore
+from backend.rag_architecture.embedding_store import EmbeddingStore
+from backend.rag_architecture.embeddings import embedding_model_key, load_embedding_model
+from backend.rag_architecture.local_index import LocalVectorIndex
+from backend.rag_architecture.manifest import (
+    bump_corpus_version,
+    read_average_document_length,
+    read_corpus_version,
+    record_average_document_length,
+)
+from backend.rag_architecture.metrics import INGEST_STAGE_SECONDS, REGISTRY, span
+from backend.rag_architecture.qdrant_clients import get_qdrant_client
+from backend.rag_architecture.qdrant_config import hnsw_config, quantization_config
+from backend.rag_architecture.router import has_header_centroids, update_header_centroids
+from backend.rag_architecture.sparse import (
+    SPARSE_VECTOR_NAME,
+    average_document_length,
+    document_sparse_vector,
+    sparse_vector_params,
+)
+from backend.vector_db.parsers import split_text_by_headers
+
+# Point ids are UUIDv5s of (document, header, content) in this namespace, so
+# an unchanged chunk keeps its id across runs and edits only touch their own.
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "csc2701/chunks")
+
+
+def chunk_point_id(document_title: str, chunk) -> str:
+    """Deterministic point id derived from the chunk's document, header and content."""
+    return str(uuid.uuid5(
+        POINT_ID_NAMESPACE,
+        f"{document_title}\n{chunk['title']}\n{chunk['content']}"
+    ))
+
+
+def chunk_payload(item, include_content: bool = True):
+    """Payload of a chunk's point; without `include_content` the text is left to a ChunkStore."""
+    payload = {
+        "header": item["title"],
+        "content": item["content"],
+        "document_title": item["document_title"]
+    }
+    if not include_content:
+        del payload["content"]
+    return payload
+
+
+def sparse_text(item) -> str:
+    """Text a chunk's BM25 sparse vector is computed from: its header and content."""
+    return f"{item['title']}\n{item['content']}"
+
+
+def strip_content_payloads(client: QdrantClient, collection_name: str, point_ids: list):
+    """Remove the chunk text from points uploaded before it moved to a ChunkStore."""
+    if point_ids:
+        client.delete_payload(collection_name=collection_name, keys=["content"], points=point_ids, wait=True)
+
+
+def create_collection_if_missing(
+        client: QdrantClient,
+        collection_name: str,
+        quantization: str = None,
+        on_disk: bool = None,
+        hnsw_m: int = None,
+        hnsw_ef_construct: int = None
+    ) -> bool:
+    """
+    Create the chunk collection (dense + sparse vectors, payload indexes) if it does not exist.
+
+    The storage options apply to the dense vector. On an existing collection
+    the options that are given are updated in place; Qdrant then rebuilds
+    the affected segments in the background.
+
+    Args:
+        client: Qdrant client
+        collection_name: Collection to create
+        quantization: 'scalar', 'binary' or 'none' (see qdrant_config);
+            None keeps the current setting
+        on_disk: Keep the float32 originals memory-mapped on disk instead of
+            in RAM; None keeps the current setting
+        hnsw_m: Edges per node of the HNSW graph
+        hnsw_ef_construct: Candidate list size while building the graph
+
+    Returns:
+        Whether the collection has the sparse vector used by hybrid retrieval
+    """
+    all_collections = client.get_collections().collections
+    names = [d.name for d in all_collections]
+
+    if collection_name not in names:
+        print(f"Creating collection '{collection_name}'")
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config={
+                "mscac-dense-vector": VectorParams(
+                    size=384,
+                    distance=Distance.COSINE,
+                    on_disk=on_disk,
+                    hnsw_config=hnsw_config(hnsw_m, hnsw_ef_construct),
+                    quantization_config=quantization_config(quantization),
+                ),
+            },
+            sparse_vectors_config={
+                SPARSE_VECTOR_NAME: sparse_vector_params(),
+            },
+        )
+
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name="header",
+            field_schema="keyword",
+        )
+
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name="document_title",
+            field_schema="keyword",
+        )
+
+        return True
+
+    print(f"Collection '{collection_name}' already exists")
+    if quantization is not None or on_disk is not None or hnsw_m is not None or hnsw_ef_construct is not None:
+        print(f"Updating vector storage of '{collection_name}'")
+        client.update_collection(
+            collection_name=collection_name,
+            vectors_config={
+                "mscac-dense-vector": VectorParamsDiff(
+                    on_disk=on_disk,
+                    hnsw_config=hnsw_config(hnsw_m, hnsw_ef_construct),
+                    quantization_config=quantization_config(quantization) or (
+                        Disabled.DISABLED if quantization == "none" else None
+                    ),
+                ),
+            },
+        )
+    sparse_vectors = client.get_collection(collection_name).config.params.sparse_vectors or {}
+    if SPARSE_VECTOR_NAME not in sparse_vectors:
+        # Qdrant cannot add a vector to an existing collection.
+        print(
+            f"Collection '{collection_name}' has no '{SPARSE_VECTOR_NAME}'; uploading dense vectors only. "
+            f"Delete the collection and re-run ingestion to enable hybrid retrieval."
+        )
+        return False
+    return True
+
+
+def upsert_point_batches(
+        items,
+        upsert_batch_size: int = 64,
+        max_upsert_bytes: int = 4 * 1024 * 1024,
+        sparse: bool = True,
+        include_content: bool = True,
+        average_document_length: float = None
+    ):
+    """
+    Split embedded items into PointStruct lists bounded by count and estimated size.
+
+    With `sparse`, every point also gets the BM25 sparse vector of its header
+    and content, length-normalized by `average_document_length` (the
+    collection's, see manifest.py). Without `include_content` the payload
+    leaves out the text.
+    """
+    points, size = [], 0
+    for item in items:
+        vector = {"mscac-dense-vector": item["embedding"].tolist()}
+        if sparse:
+            vector[SPARSE_VECTOR_NAME] = document_sparse_vector(sparse_text(item), average_document_length)
+        point = PointStruct(
+            id=item["id"],
+            vector=vector,
+            payload=chunk_payload(item, include_content)
+        )
+        # ~10 bytes per float once JSON-encoded, plus the payload text (the
+        # sparse vector is about as large as the text it was built from).
+        point_size = 10 * len(item["embedding"]) + (int(sparse) + int(include_content)) * len(item["content"].encode("utf-8"))
+        if points and (len(points) >= upsert_batch_size or size + point_size > max_upsert_bytes):
+            yield points
+            points, size = [], 0
+        points.append(point)
+        size += point_size
+    if points:
+        yield points
+
+
+def upload_embedded_batches(
+        client: QdrantClient,
+        collection_name: str,
+        batches,
+        upload_workers: int = 4,
+        upsert_batch_size: int = 64,
+        max_upsert_bytes: int = 4 * 1024 * 1024,
+        on_uploaded=None,
+        sparse: bool = True,
+        include_content: bool = True,
+        average_document_length: float = None
+    ) -> int:
+    """
+    Upsert batches of embedded items as they are produced.
+
+    While the caller produces (encodes) the next batch, the previous one is
+    already being sent, in parallel requests of at most `upsert_batch_size`
+    points / `max_upsert_bytes` that do not wait for indexing. At most two
+    requests per upload worker are in flight, so memory stays bounded. A
+    final upsert with wait=True acts as a consistency barrier.
+
+    Args:
+        client: Qdrant client
+        collection_name: Collection to write to
+        batches: Iterable of lists of embedded items
+        upload_workers: Number of parallel upsert requests
+        upsert_batch_size: Maximum points per request
+        max_upsert_bytes: Maximum estimated request size
+        on_uploaded: Optional callback called with the size of each acknowledged request
+        sparse: Also upload the BM25 sparse vector of each item
+        include_content: Put the chunk text in the payload (False when it
+            is kept in a ChunkStore)
+        average_document_length: Average chunk length the sparse vectors
+            are normalized by (None: no length normalization)
+
+    Returns:
+        Number of points uploaded
+    """
+    uploaded = 0
+    last_points = []
+    in_flight = threading.BoundedSemaphore(2 * upload_workers)
+
+    def upsert(points):
+        try:
+            client.upsert(collection_name=collection_name, points=points, wait=False)
+            if on_uploaded is not None:
+                on_uploaded(len(points))
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=upload_workers) as executor:
+        futures = []
+        for batch in batches:
+            for points in upsert_point_batches(
+                    batch, upsert_batch_size, max_upsert_bytes, sparse, include_content, average_document_length
+            ):
+                in_flight.acquire()
+                futures.append(executor.submit(upsert, points))
+                uploaded += len(points)
+                last_points = points
+            # Drop finished requests, re-raising upload errors early.
+            running = []
+            for future in futures:
+                if future.done():
+                    future.result()
+                else:
+                    running.append(future)
+            futures = running
+        for future in futures:
+            future.result()
+
+    if last_points:
+        # Updates are applied in order, so once this (idempotent) re-send
+        # of the last batch is applied, every earlier one is as well.
+        client.upsert(collection_name=collection_name, points=last_points, wait=True)
+    return uploaded
 
 
 class DataPreprocessor:
-    def __init__(self, file_path, model_name="all-MiniLM-L6-v2", vector_db_url="http://3.138.107.103:6333"):
+    def __init__(
+            self,
+            file_path,
+            model_name="all-MiniLM-L6-v2",
+            vector_db_url="http://3.138.107.103:6333",
+            local_index_dir=None,
+            encode_batch_size=32,
+            upsert_batch_size=64,
+            max_upsert_bytes=4 * 1024 * 1024,
+            upload_workers=4,
+            embedding_store_path=None,
+            quantization=None,
+            on_disk=None,
+            hnsw_m=None,
+            hnsw_ef_construct=None,
+            embedding_backend="torch",
+            prefer_grpc=None,
+            chunk_store_dir=None
+        ):
         self.file_path = file_path
+        self.document_title = file_path.split("/")[-1]
         self.vector_db_url = vector_db_url
-        self.model = SentenceTransformer(model_name)
+        # None: QDRANT_PREFER_GRPC, see qdrant_clients.py
+        self.prefer_grpc = prefer_grpc
+        self.model_name = model_name
+        self.embedding_backend = embedding_backend
+        self._model = None
+        self.encode_batch_size = encode_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.max_upsert_bytes = max_upsert_bytes
+        self.upload_workers = upload_workers
+        self.embedding_store = EmbeddingStore(embedding_store_path) if embedding_store_path else None
+        # Chunk texts go here instead of into the point payloads.
+        self.chunk_store = ChunkStore(chunk_store_dir, create=True) if chunk_store_dir else None
+        # Dense vector storage options, see create_collection_if_missing.
+        self.vector_storage = {
+            "quantization": quantization,
+            "on_disk": on_disk,
+            "hnsw_m": hnsw_m,
+            "hnsw_ef_construct": hnsw_ef_construct,
+        }
 
-        self.hand_book_txt = self.read_text_file()
-        self.hand_book_text_chunks = self.split_by_headers()
-        self.hand_book_embeddings = self.create_embeddings()
-        self.upload_to_vector_db()
+        with span("read", INGEST_STAGE_SECONDS):
+            self.hand_book_txt = self.read_text_file()
+        with span("split", INGEST_STAGE_SECONDS):
+            self.hand_book_text_chunks = self.split_by_headers()
+        self.hand_book_embeddings = []
+        # Encodes and uploads new or changed chunks batch by batch, filling
+        # hand_book_embeddings.
+        self.corpus_version = self.upload_to_vector_db()
+        if local_index_dir:
+            self.write_local_index(local_index_dir)
+
+    @property
+    def model(self):
+        # Loaded on first use: re-ingesting an unchanged document never encodes.
+        if self._model is None:
+            self._model = load_embedding_model(self.model_name, backend=self.embedding_backend)
+        return self._model
 
     def read_text_file(self):
         with open(self.file_path, "r", encoding="utf-8") as file:
             return file.read()
 
     def split_by_headers(self) -> List[Dict[str, str]]:
+        return split_text_by_headers(self.hand_book_txt)
+
+    def point_id(self, chunk) -> str:
+        """Deterministic point id derived from the chunk's document, header and content."""
+        return chunk_point_id(self.document_title, chunk)
+
+    def embedding_batches(self, chunks=None):
+        """
+        Encode chunks in batches of `encode_batch_size`, yielding each batch.
 
-        text = self.hand_book_txt.replace('\r', '')
+        Chunks are sorted by length first so each batch pads to similar
+        lengths. Every item carries its point id in "id" and is also
+        appended to `hand_book_embeddings`.
 
-        header_pattern = re.compile(
-            r'(?P<header>^[A-Z0-9 ,\-&/\(\)]+(?:\n|$))', re.MULTILINE
+        Args:
+            chunks: Chunks to encode; defaults to all of `hand_book_text_chunks`
+        """
+        chunks = sorted(
+            self.hand_book_text_chunks if chunks is None else chunks,
+            key=lambda chunk: len(chunk["content"]),
+            reverse=True
         )
+        for start in range(0, len(chunks), self.encode_batch_size):
+            batch_chunks = chunks[start:start + self.encode_batch_size]
+            with span("embed", INGEST_STAGE_SECONDS):
+                vectors = self.encode([chunk["content"] for chunk in batch_chunks])
+            batch = [
+                {
+                    "id": self.point_id(chunk),
+                    "document_title": self.document_title,
+                    "title": chunk["title"],
+                    "content": chunk["content"],
+                    "embedding": vector
+                }
+                for chunk, vector in zip(batch_chunks, vectors)
+            ]
+            self.hand_book_embeddings.extend(batch)
+            yield batch
 
-        parts = re.split(header_pattern, text)
+    def create_embeddings(self):
+        self.hand_book_embeddings = []
+        for _ in self.embedding_batches():
+            pass
+        return self.hand_book_embeddings
 
-        chunks = []
-        current_header = None
+    def encode(self, texts):
+        """Encode texts, skipping those already in the persistent embedding store."""
+        if self.embedding_store is not None:
+            return self.embedding_store.encode(
+                self.model, embedding_model_key(self.model_name, self.embedding_backend), texts,
+                batch_size=self.encode_batch_size
+            )
+        return self.model.encode(texts, batch_size=self.encode_batch_size)
 
-        for part in parts:
-            part = part.strip()
-            if not part:
-                continue
-            if part.isupper() or re.match(r'^[A-Z0-9 ,\-&/\(\)]+$', part):
-                current_header = part
-            else:
-                if current_header:
-                    clean_text = re.sub(r'\n{2,}', '\n', part).strip()
-                    chunks.append({
-                        "title": current_header,
-                        "content": clean_text
-                    })
-                    current_header = None
-                else:
-                    chunks.append({
-                        "title": "PREFACE",
-                        "content": part
-                    })
-        return chunks
+    def existing_point_ids(self, client: QdrantClient, collection_name: str) -> dict:
+        """
+        Ids of the points already stored for this document.
 
-    def create_embeddings(self):
-        embeddings = []
-        for chunk in self.hand_book_text_chunks:
-            vector = self.model.encode(chunk['content'])
-            embeddings.append({
-                "title": chunk["title"],
-                "content": chunk["content"],
-                "embedding": vector
-            })
-        return embeddings
-    
-
-    def upload_to_vector_db(self, collection_name: str="csc2701"):
-        client = QdrantClient(self.vector_db_url)
-
-        all_collections = client.get_collections().collections
-        names = [d.name for d in all_collections]
-
-        if collection_name not in names:
-            print(f"Creating collection '{collection_name}'")
-            client.create_collection(
+        Scrolls ids only (no payloads or vectors).
+
+        Returns:
+            Dict mapping str(id) to the id as stored
+        """
+        existing = {}
+        offset = None
+        while True:
+            points, offset = client.scroll(
                 collection_name=collection_name,
-                vectors_config={
-                    "mscac-dense-vector": VectorParams(
-                        size=384,
-                        distance=Distance.COSINE
-                    ),
-                },
+                scroll_filter=Filter(must=[
+                    FieldCondition(key="document_title", match=MatchValue(value=self.document_title))
+                ]),
+                limit=1024,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False,
             )
+            existing.update((str(point.id), point.id) for point in points)
+            if offset is None:
+                return existing
 
-            client.create_payload_index(
-                collection_name=collection_name,
-                field_name="header",
-                field_schema="keyword",
+    def upload_to_vector_db(self, collection_name: str="csc2701", batches=None):
+        """
+        Upsert the embedded chunks into the collection, creating it if needed.
+
+        Encoding and uploading are pipelined: while the next batch is being
+        encoded, the previous one is already being sent, in parallel
+        requests of at most `upsert_batch_size` points / `max_upsert_bytes`
+        that do not wait for indexing. A final upsert with wait=True acts as
+        a consistency barrier before the corpus version is bumped.
+
+        Args:
+            collection_name: Qdrant collection to write to
+            batches: Iterable of embedded item batches; defaults to
+                `embedding_batches()`
+
+        Returns:
+            The new corpus version
+        """
+        client = get_qdrant_client(self.vector_db_url, prefer_grpc=self.prefer_grpc)
+        sparse = create_collection_if_missing(client, collection_name, **self.vector_storage)
+
+        chunks_by_id = {}
+        for chunk in self.hand_book_text_chunks:
+            chunks_by_id.setdefault(self.point_id(chunk), chunk)
+        with span("diff", INGEST_STAGE_SECONDS):
+            existing_ids = self.existing_point_ids(client, collection_name)
+        changed_chunks = [chunk for point_id, chunk in chunks_by_id.items() if point_id not in existing_ids]
+        orphan_ids = [point_id for key, point_id in existing_ids.items() if key not in chunks_by_id]
+        print(
+            f"'{self.document_title}': {len(changed_chunks)} new or changed chunks, "
+            f"{len(chunks_by_id) - len(changed_chunks)} unchanged, {len(orphan_ids)} orphaned"
+        )
+
+        migrated_ids = []
+        if self.chunk_store is not None:
+            # Committed before the points are upserted, so every point a
+            # search can return is already in the store.
+            with span("chunk_store", INGEST_STAGE_SECONDS):
+                stored_ids = self.chunk_store.append(
+                    (point_id, chunk["title"], self.document_title, chunk["content"])
+                    for point_id, chunk in chunks_by_id.items()
+                )
+                self.chunk_store.commit()
+            # Unchanged points uploaded before the store existed still carry their text.
+            migrated_ids = [existing_ids[point_id] for point_id in stored_ids if point_id in existing_ids]
+            strip_content_payloads(client, collection_name, migrated_ids)
+
+        if not changed_chunks and not orphan_ids:
+            print(f"Collection '{collection_name}' is up to date")
+            if not has_header_centroids(client, collection_name):
+                update_header_centroids(client, collection_name, vector_size=384)
+            if migrated_ids:
+                # The manifest has to say the payloads no longer hold the text.
+                corpus_version = bump_corpus_version(client, collection_name, vector_size=384, payload_content=False)
+            else:
+                corpus_version = read_corpus_version(client, collection_name)
+            if self.chunk_store is not None:
+                self.chunk_store.commit(corpus_version)
+            return corpus_version
+
+        average_length = read_average_document_length(client, collection_name) if sparse else None
+        if sparse and average_length is None:
+            # First ingestion of the collection; later ones reuse this average.
+            average_length = record_average_document_length(
+                client,
+                collection_name,
+                average_document_length(sparse_text(chunk) for chunk in chunks_by_id.values()),
+                vector_size=384,
             )
 
-        else:
-            print(f"Collection '{collection_name}' already exists")
+        if batches is None:
+            self.hand_book_embeddings = []
+            batches = self.embedding_batches(changed_chunks)
 
-        client.upsert(
-            collection_name=collection_name,
-            points=[
-                PointStruct(
-                    id=idx,
-                    vector={"mscac-dense-vector": item["embedding"].tolist()},
-                    payload={
-                        "header": item["title"],
-                        "content": item["content"],
-                        "document_title": self.file_path.split("/")[-1]
-                    }
+        # Includes the encodes of the batches, which are pipelined with the upserts.
+        with span("embed_and_upload", INGEST_STAGE_SECONDS):
+            uploaded = upload_embedded_batches(
+                client,
+                collection_name,
+                batches,
+                upload_workers=self.upload_workers,
+                upsert_batch_size=self.upsert_batch_size,
+                max_upsert_bytes=self.max_upsert_bytes,
+                sparse=sparse,
+                include_content=self.chunk_store is None,
+                average_document_length=average_length,
+            )
+        print(f"Uploaded {uploaded} points to '{collection_name}'")
+
+        if orphan_ids:
+            # Deleted only after the replacements are in, so no search sees a gap.
+            with span("delete_orphans", INGEST_STAGE_SECONDS):
+                client.delete(
+                    collection_name=collection_name,
+                    points_selector=PointIdsList(points=orphan_ids),
+                    wait=True,
                 )
-                for idx, item in enumerate(self.hand_book_embeddings)
-            ]
+            print(f"Deleted {len(orphan_ids)} orphaned points from '{collection_name}'")
+
+        # Section centroids of the query router; stored before the version
+        # bump that makes serving reload them.
+        with span("centroids", INGEST_STAGE_SECONDS):
+            sections = update_header_centroids(client, collection_name, vector_size=384)
+        print(f"Stored the centroids of {sections} sections of '{collection_name}'")
+        # Lets serving drop answers cached against the previous corpus.
+        corpus_version = bump_corpus_version(
+            client, collection_name, vector_size=384, payload_content=self.chunk_store is None
+        )
+        if self.chunk_store is not None:
+            self.chunk_store.commit(corpus_version)
+        print(f"Collection '{collection_name}' is at corpus version {corpus_version}")
+        return corpus_version
+
+    def write_local_index(self, index_dir: str, collection_name: str = "csc2701", dtype: str = "float32"):
+        """
+        Write the collection as a LocalVectorIndex, the in-process retrieval backend.
+
+        Exported from Qdrant rather than from `hand_book_embeddings`, which
+        only holds the chunks that were (re-)encoded in this run.
+        """
+        LocalVectorIndex.export_from_qdrant(
+            get_qdrant_client(self.vector_db_url, prefer_grpc=self.prefer_grpc),
+            collection_name,
+            index_dir,
+            dtype=dtype,
+            corpus_version=self.corpus_version,
         )
+        print(f"Wrote local index to '{index_dir}'")
 
 
 if __name__ == "__main__":
-    hand_book_path = "../data/docs/handbook.txt"
-    data_preprocessor = DataPreprocessor(hand_book_path)
+    # Run from the repository root: python -m backend.vector_db.data_preprocessor
+    hand_book_path = os.path.join(os.path.dirname(__file__), "../../data/docs/handbook.txt")
+    data_preprocessor = DataPreprocessor(hand_book_path, chunk_store_dir=os.getenv("CHUNK_STORE_DIR"))
+    # Stage timings for node_exporter's textfile collector.
+    if os.getenv("INGEST_METRICS_FILE"):
+        REGISTRY.write(os.environ["INGEST_METRICS_FILE"])
@@ -0,0 +1,476 @@
+"""
+Directory-level ingestion pipeline.
+
+Indexes every supported document under a directory (see parsers.PARSERS)
+into one Qdrant collection:
+
+1. parse: files are read and chunked in a process pool, one task per file,
+   with a bounded number of files in flight
+2. embed: new or changed chunks stream through a bounded queue into
+   batched encodes (sorted by length within a window to limit padding)
+3. upload: embedded batches are upserted in parallel while the next batch
+   is being encoded
+
+Every stage is bounded, so memory stays flat regardless of corpus size.
+Point ids are content hashes, as in DataPreprocessor, so unchanged chunks
+are skipped and chunks that disappeared are deleted.
+
+With --chunk-store, chunk texts are written to a ChunkStore (committed
+before each upload batch) and left out of the point payloads.
+
+Run from the repository root:
+
+    python -m backend.vector_db.ingest data/docs --collection csc2701
+"""
+
+import argparse
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointIdsList
+from tqdm import tqdm
+
+from backend.rag_architecture.chunk_store import ChunkStore
+from backend.rag_architecture.embedding_store import EmbeddingStore
+from backend.rag_architecture.embeddings import EMBEDDING_BACKENDS, embedding_model_key, load_embedding_model
+from backend.rag_architecture.manifest import (
+    bump_corpus_version,
+    read_average_document_length,
+    read_corpus_version,
+    record_average_document_length,
+)
+from backend.rag_architecture.metrics import INGEST_STAGE_SECONDS, REGISTRY
+from backend.rag_architecture.qdrant_clients import get_qdrant_client
+from backend.rag_architecture.qdrant_config import QUANTIZATION_TYPES
+from backend.rag_architecture.router import has_header_centroids, update_header_centroids
+from backend.rag_architecture.sparse import average_document_length
+from backend.vector_db.data_preprocessor import (
+    chunk_point_id,
+    create_collection_if_missing,
+    sparse_text,
+    strip_content_payloads,
+    upload_embedded_batches,
+)
+from backend.vector_db.parsers import PARSERS, parse_document
+
+# Number of encode batches gathered and length-sorted together.
+SORT_WINDOW_BATCHES = 8
+
+
+class StageStats:
+    """
+    Item count and timing of one pipeline stage.
+
+    Busy time is also observed in the ingest_stage_seconds histogram.
+    """
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.count = 0
+        self.busy_seconds = 0.0
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.started_at = self.finished_at = time.perf_counter()
+
+    def add(self, count: int, busy_seconds: float = 0.0):
+        with self._lock:
+            self.finished_at = time.perf_counter()
+            self.count += count
+            self.busy_seconds += busy_seconds
+        if busy_seconds:
+            INGEST_STAGE_SECONDS.observe(busy_seconds, self.name)
+
+    def summary(self) -> str:
+        wall = (self.finished_at - self.started_at) if self.started_at else 0.0
+        rate = self.count / wall if wall else 0.0
+        busy = f"{self.busy_seconds:8.2f}s busy" if self.busy_seconds else " " * 13
+        return f"{self.name:<8} {self.count:>8} {self.unit:<7} {wall:8.2f}s wall {busy} {rate:10.1f} {self.unit}/s"
+
+
+class DirectoryIngestor:
+    """
+    Streaming ingestion of all documents under a directory.
+
+    Args:
+        root_dir: Directory to index (searched recursively)
+        collection_name: Qdrant collection to write to
+        model_name: SentenceTransformer model used for embeddings
+        vector_db_url: URL of the Qdrant instance
+        parse_workers: Number of parser processes (default: CPU count)
+        encode_batch_size: Chunks per encode call
+        upsert_batch_size: Maximum points per upsert request
+        max_upsert_bytes: Maximum estimated size of an upsert request
+        upload_workers: Number of parallel upsert requests
+        queue_size: Maximum number of encode batches waiting for the embedder
+        embedding_store_path: Optional persistent EmbeddingStore file
+        prune: Also delete points of documents that no longer exist under
+            `root_dir` (otherwise only stale chunks of parsed documents are)
+        progress: Show progress bars
+        quantization: Dense vector quantization, 'scalar', 'binary' or 'none'
+        on_disk: Keep the original dense vectors on disk
+        hnsw_m: Edges per node of the HNSW graph
+        hnsw_ef_construct: Candidate list size while building the graph
+        embedding_backend: 'torch', 'onnx' or 'onnx-int8' (see embeddings.py)
+        prefer_grpc: Upload over gRPC instead of REST (None:
+            QDRANT_PREFER_GRPC, see qdrant_clients.py)
+        chunk_store_dir: Keep the chunk texts in this ChunkStore instead of
+            the point payloads; compacted when `prune` is set
+    """
+
+    def __init__(
+            self,
+            root_dir,
+            collection_name="csc2701",
+            model_name="all-MiniLM-L6-v2",
+            vector_db_url="http://3.138.107.103:6333",
+            parse_workers=None,
+            encode_batch_size=32,
+            upsert_batch_size=64,
+            max_upsert_bytes=4 * 1024 * 1024,
+            upload_workers=4,
+            queue_size=16,
+            embedding_store_path=None,
+            prune=False,
+            progress=True,
+            quantization=None,
+            on_disk=None,
+            hnsw_m=None,
+            hnsw_ef_construct=None,
+            embedding_backend="torch",
+            prefer_grpc=None,
+            chunk_store_dir=None
+        ):
+        self.root_dir = root_dir
+        self.collection_name = collection_name
+        self.model_name = model_name
+        self.embedding_backend = embedding_backend
+        self.vector_db_url = vector_db_url
+        self.prefer_grpc = prefer_grpc
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.encode_batch_size = encode_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.max_upsert_bytes = max_upsert_bytes
+        self.upload_workers = upload_workers
+        self.queue_size = queue_size
+        self.embedding_store = EmbeddingStore(embedding_store_path) if embedding_store_path else None
+        self.chunk_store = ChunkStore(chunk_store_dir, create=True) if chunk_store_dir else None
+        self.prune = prune
+        self.progress = progress
+        self.vector_storage = {
+            "quantization": quantization,
+            "on_disk": on_disk,
+            "hnsw_m": hnsw_m,
+            "hnsw_ef_construct": hnsw_ef_construct,
+        }
+        self._model = None
+        # Average chunk length of the first sort window, set by the producer.
+        self._sample_average_length = None
+
+        self.stats = {
+            "parse": StageStats("parse", "files"),
+            "embed": StageStats("embed", "chunks"),
+            "upload": StageStats("upload", "points"),
+        }
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = load_embedding_model(self.model_name, backend=self.embedding_backend)
+        return self._model
+
+    def document_paths(self):
+        for directory, subdirectories, files in os.walk(self.root_dir):
+            subdirectories.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in PARSERS:
+                    yield os.path.join(directory, name)
+
+    def parsed_documents(self, paths):
+        """
+        Parse files in the process pool, yielding (document_title, chunks) in path order.
+
+        At most two files per worker are submitted ahead of the consumer.
+        """
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as pool:
+            pending = deque()
+            for path in paths:
+                pending.append(pool.submit(parse_document, path, self.root_dir))
+                if len(pending) >= 2 * self.parse_workers:
+                    yield self._parsed(pending.popleft().result())
+            while pending:
+                yield self._parsed(pending.popleft().result())
+
+    def _parsed(self, result):
+        document_title, chunks, parse_seconds = result
+        self.stats["parse"].add(1, parse_seconds)
+        return document_title, chunks
+
+    def existing_points(self, client: QdrantClient) -> dict:
+        """Map str(id) -> (id, document_title) for every point in the collection."""
+        existing = {}
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=self.collection_name,
+                limit=1024,
+                offset=offset,
+                with_payload=["document_title"],
+                with_vectors=False,
+            )
+            existing.update(
+                (str(point.id), (point.id, (point.payload or {}).get("document_title")))
+                for point in points
+            )
+            if offset is None:
+                return existing
+
+    def _produce_chunk_batches(self, paths, existing, seen_ids, seen_documents, stored_ids, chunk_queue, bars, stop):
+        """
+        Parse documents and put encode batches of new or changed chunks on the queue.
+
+        With a chunk store, every chunk it does not hold yet is appended to
+        it (and its id to `stored_ids`) before its batch is queued.
+        """
+        try:
+            window = []
+            window_size = self.encode_batch_size * SORT_WINDOW_BATCHES
+            for document_title, chunks in self.parsed_documents(paths):
+                if stop.is_set():
+                    return
+                seen_documents.add(document_title)
+                bars["files"].update(1)
+                document_chunks = []
+                for chunk in chunks:
+                    point_id = chunk_point_id(document_title, chunk)
+                    if point_id in seen_ids:
+                        continue
+                    seen_ids.add(point_id)
+                    document_chunks.append((point_id, chunk["title"], document_title, chunk["content"]))
+                    if point_id not in existing:
+                        window.append({"id": point_id, "document_title": document_title, **chunk})
+                if self.chunk_store is not None:
+                    stored_ids.extend(self.chunk_store.append(document_chunks))
+                if len(window) >= window_size:
+                    self._put_sorted_batches(window, chunk_queue)
+                    window = []
+            self._put_sorted_batches(window, chunk_queue)
+            chunk_queue.put(None)
+        except BaseException as error:
+            chunk_queue.put(error)
+
+    def _put_sorted_batches(self, items, chunk_queue):
+        if self._sample_average_length is None and items:
+            self._sample_average_length = average_document_length(sparse_text(item) for item in items)
+        items.sort(key=lambda item: len(item["content"]), reverse=True)
+        for start in range(0, len(items), self.encode_batch_size):
+            chunk_queue.put(items[start:start + self.encode_batch_size])
+
+    def _embedded_batches(self, chunk_queue, bars):
+        while True:
+            batch = chunk_queue.get()
+            if batch is None:
+                return
+            if isinstance(batch, BaseException):
+                raise batch
+            start = time.perf_counter()
+            texts = [item["content"] for item in batch]
+            if self.embedding_store is not None:
+                vectors = self.embedding_store.encode(
+                    self.model, embedding_model_key(self.model_name, self.embedding_backend), texts,
+                    batch_size=self.encode_batch_size
+                )
+            else:
+                vectors = self.model.encode(texts, batch_size=self.encode_batch_size)
+            for item, vector in zip(batch, vectors):
+                item["embedding"] = vector
+            self.stats["embed"].add(len(batch), time.perf_counter() - start)
+            bars["chunks"].update(len(batch))
+            if self.chunk_store is not None:
+                # The batch's texts become visible before its points do;
+                # fsynced once at the end of the run.
+                self.chunk_store.commit(fsync=False)
+            yield batch
+
+    def run(self):
+        """
+        Index the directory.
+
+        Returns:
+            The collection's corpus version (unchanged if nothing changed)
+        """
+        started_at = time.perf_counter()
+        for stats in self.stats.values():
+            stats.start()
+        client = get_qdrant_client(self.vector_db_url, prefer_grpc=self.prefer_grpc)
+        sparse = create_collection_if_missing(client, self.collection_name, **self.vector_storage)
+        existing = self.existing_points(client)
+
+        paths = list(self.document_paths())
+        seen_ids, seen_documents, stored_ids = set(), set(), []
+        chunk_queue = queue.Queue(maxsize=self.queue_size)
+        bars = {
+            "files": tqdm(total=len(paths), desc="parsed", unit="file", disable=not self.progress),
+            "chunks": tqdm(desc="embedded", unit="chunk", disable=not self.progress),
+            "points": tqdm(desc="uploaded", unit="point", disable=not self.progress),
+        }
+
+        def on_uploaded(count):
+            self.stats["upload"].add(count)
+            bars["points"].update(count)
+
+        self._sample_average_length = None
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce_chunk_batches,
+            args=(paths, existing, seen_ids, seen_documents, stored_ids, chunk_queue, bars, stop),
+            daemon=True,
+        )
+        producer.start()
+        try:
+            batches = self._embedded_batches(chunk_queue, bars)
+            average_length = read_average_document_length(client, self.collection_name) if sparse else None
+            if sparse and average_length is None:
+                # First ingestion of the collection: the average comes from the
+                # first sort window, set before its first batch was queued (a
+                # batch alone is a biased sample, windows are sorted by length).
+                first_batch = next(batches, None)
+                if first_batch is not None:
+                    average_length = record_average_document_length(
+                        client, self.collection_name, self._sample_average_length, vector_size=384
+                    )
+                    batches = itertools.chain([first_batch], batches)
+            uploaded = upload_embedded_batches(
+                client,
+                self.collection_name,
+                batches,
+                upload_workers=self.upload_workers,
+                upsert_batch_size=self.upsert_batch_size,
+                max_upsert_bytes=self.max_upsert_bytes,
+                on_uploaded=on_uploaded,
+                sparse=sparse,
+                include_content=self.chunk_store is None,
+                average_document_length=average_length,
+            )
+        finally:
+            # On failure, unblock the producer so it can shut the parser pool down.
+            stop.set()
+            while producer.is_alive():
+                try:
+                    chunk_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            producer.join()
+            for bar in bars.values():
+                bar.close()
+
+        orphan_ids = [
+            point_id
+            for key, (point_id, document_title) in existing.items()
+            if key not in seen_ids and (self.prune or document_title in seen_documents)
+        ]
+        if orphan_ids:
+            client.delete(
+                collection_name=self.collection_name,
+                points_selector=PointIdsList(points=orphan_ids),
+                wait=True,
+            )
+
+        migrated_ids = []
+        if self.chunk_store is not None:
+            self.chunk_store.commit()
+            # Unchanged points uploaded before the store existed still carry their text.
+            migrated_ids = [existing[key][0] for key in stored_ids if key in existing]
+            strip_content_payloads(client, self.collection_name, migrated_ids)
+
+        if uploaded or orphan_ids or not has_header_centroids(client, self.collection_name):
+            # Query router centroids, stored before the version bump that makes serving reload them.
+            update_header_centroids(client, self.collection_name, vector_size=384)
+        if uploaded or orphan_ids or migrated_ids:
+            corpus_version = bump_corpus_version(
+                client, self.collection_name, vector_size=384, payload_content=self.chunk_store is None
+            )
+        else:
+            corpus_version = read_corpus_version(client, self.collection_name)
+
+        if self.chunk_store is not None:
+            if self.prune and len(self.chunk_store) > len(seen_ids):
+                self.chunk_store.compact(seen_ids, corpus_version)
+            else:
+                self.chunk_store.commit(corpus_version)
+
+        print(
+            f"Indexed {len(seen_documents)} documents into '{self.collection_name}': "
+            f"{uploaded} points uploaded, {len(seen_ids) - uploaded} unchanged, "
+            f"{len(orphan_ids)} deleted, corpus version {corpus_version}"
+        )
+        for stats in self.stats.values():
+            print(stats.summary())
+        print(f"total    {time.perf_counter() - started_at:8.2f}s")
+        return corpus_version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index a directory of documents into Qdrant.")
+    parser.add_argument("root_dir", help="Directory of documents (.txt, .md, .html, .csv)")
+    parser.add_argument("--collection", default="csc2701")
+    parser.add_argument("--vector-db-url", default="http://3.138.107.103:6333")
+    parser.add_argument("--prefer-grpc", action="store_true", default=None,
+                        help="Upload over gRPC (default: QDRANT_PREFER_GRPC)")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, default="torch")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--encode-batch-size", type=int, default=32)
+    parser.add_argument("--upsert-batch-size", type=int, default=64)
+    parser.add_argument("--upload-workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--embedding-store", default=None, help="Persistent embedding store (SQLite file)")
+    parser.add_argument("--chunk-store", default=os.getenv("CHUNK_STORE_DIR"),
+                        help="Keep chunk texts in this ChunkStore directory instead of the Qdrant payloads")
+    parser.add_argument("--prune", action="store_true", help="Delete points of documents no longer present")
+    parser.add_argument("--no-progress", action="store_true")
+    parser.add_argument("--quantization", choices=QUANTIZATION_TYPES, default=None,
+                        help="Dense vector quantization (default: keep the collection's setting)")
+    parser.add_argument("--on-disk", action="store_true", default=None, help="Keep original dense vectors on disk")
+    parser.add_argument("--hnsw-m", type=int, default=None)
+    parser.add_argument("--hnsw-ef-construct", type=int, default=None)
+    parser.add_argument("--metrics-file", default=os.getenv("INGEST_METRICS_FILE"),
+                        help="Write stage timing histograms here (Prometheus text format)")
+    args = parser.parse_args()
+
+    DirectoryIngestor(
+        args.root_dir,
+        collection_name=args.collection,
+        model_name=args.model,
+        vector_db_url=args.vector_db_url,
+        parse_workers=args.workers,
+        encode_batch_size=args.encode_batch_size,
+        upsert_batch_size=args.upsert_batch_size,
+        upload_workers=args.upload_workers,
+        queue_size=args.queue_size,
+        embedding_store_path=args.embedding_store,
+        prune=args.prune,
+        progress=not args.no_progress,
+        quantization=args.quantization,
+        on_disk=args.on_disk,
+        hnsw_m=args.hnsw_m,
+        hnsw_ef_construct=args.hnsw_ef_construct,
+        embedding_backend=args.embedding_backend,
+        prefer_grpc=args.prefer_grpc,
+        chunk_store_dir=args.chunk_store,
+    ).run()
+    if args.metrics_file:
+        REGISTRY.write(args.metrics_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Document parsers used by ingestion.
+
+Each parser turns one file into a list of {"title", "content"} chunks. The
+module only depends on the standard library so the process-pool workers of
+the directory ingestion pipeline start quickly.
+
+Supported formats:
+- .txt: plain text split at upper-case header lines (the handbook format)
+- .md: Markdown split at '#' headings
+- .html / .htm: web exports split at <h1>-<h4> headings
+- .csv: tables such as course timetables, grouped into row blocks
+"""
+
+import csv
+import os
+import re
+import time
+from html.parser import HTMLParser
+from typing import List, Dict
+
+
+def split_text_by_headers(text: str) -> List[Dict[str, str]]:
+    """Split a plain-text document into {"title", "content"} chunks at upper-case header lines."""
+    text = text.replace('\r', '')
+
+    header_pattern = re.compile(
+        r'(?P<header>^[A-Z0-9 ,\-&/\(\)]+(?:\n|$))', re.MULTILINE
+    )
+
+    parts = re.split(header_pattern, text)
+
+    chunks = []
+    current_header = None
+
+    for part in parts:
+        part = part.strip()
+        if not part:
+            continue
+        if part.isupper() or re.match(r'^[A-Z0-9 ,\-&/\(\)]+$', part):
+            current_header = part
+        else:
+            if current_header:
+                clean_text = re.sub(r'\n{2,}', '\n', part).strip()
+                chunks.append({
+                    "title": current_header,
+                    "content": clean_text
+                })
+                current_header = None
+            else:
+                chunks.append({
+                    "title": "PREFACE",
+                    "content": part
+                })
+    return chunks
+
+
+def parse_text(path: str) -> List[Dict[str, str]]:
+    with open(path, "r", encoding="utf-8") as file:
+        return split_text_by_headers(file.read())
+
+
+def parse_markdown(path: str) -> List[Dict[str, str]]:
+    chunks = []
+    title, lines = "PREFACE", []
+
+    def flush():
+        content = "\n".join(lines).strip()
+        if content:
+            chunks.append({"title": title, "content": re.sub(r'\n{2,}', '\n', content)})
+
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            heading = re.match(r'^#{1,6}\s+(.*)$', line.rstrip())
+            if heading:
+                flush()
+                title, lines = heading.group(1).strip().upper(), []
+            else:
+                lines.append(line.rstrip())
+    flush()
+    return chunks
+
+
+class _SectionHTMLParser(HTMLParser):
+    HEADINGS = {"h1", "h2", "h3", "h4"}
+    SKIPPED = {"script", "style", "nav", "footer", "head"}
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.title = "PREFACE"
+        self.heading = None
+        self.text = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self.skip_depth += 1
+        elif tag in self.HEADINGS:
+            self.flush()
+            self.heading = []
+        elif tag in ("p", "br", "li", "tr", "div"):
+            self.text.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in self.HEADINGS and self.heading is not None:
+            self.title = " ".join("".join(self.heading).split()).upper() or self.title
+            self.heading = None
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        if self.heading is not None:
+            self.heading.append(data)
+        else:
+            self.text.append(data)
+
+    def flush(self):
+        lines = [" ".join(line.split()) for line in "".join(self.text).split("\n")]
+        content = "\n".join(line for line in lines if line)
+        if content:
+            self.chunks.append({"title": self.title, "content": content})
+        self.text = []
+
+
+def parse_html(path: str) -> List[Dict[str, str]]:
+    parser = _SectionHTMLParser()
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        for block in iter(lambda: file.read(64 * 1024), ""):
+            parser.feed(block)
+    parser.close()
+    parser.flush()
+    return parser.chunks
+
+
+def parse_csv(path: str, rows_per_chunk: int = 25) -> List[Dict[str, str]]:
+    name = os.path.splitext(os.path.basename(path))[0].replace("_", " ").upper()
+    chunks = []
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        reader = csv.reader(file)
+        columns = next(reader, None)
+        if not columns:
+            return chunks
+        block, first_row = [], 1
+        for row_number, row in enumerate(reader, start=1):
+            block.append("; ".join(f"{column}: {value}" for column, value in zip(columns, row) if value))
+            if len(block) == rows_per_chunk:
+                chunks.append({"title": f"{name} (ROWS {first_row}-{row_number})", "content": "\n".join(block)})
+                block, first_row = [], row_number + 1
+        if block:
+            chunks.append({"title": f"{name} (ROWS {first_row}-{first_row + len(block) - 1})", "content": "\n".join(block)})
+    return chunks
+
+
+PARSERS = {
+    ".txt": parse_text,
+    ".md": parse_markdown,
+    ".html": parse_html,
+    ".htm": parse_html,
+    ".csv": parse_csv,
+}
+
+
+def parse_document(path: str, root_dir: str):
+    """
+    Parse one file; runs inside an ingestion worker process.
+
+    Returns:
+        Tuple (document_title, chunks, parse_seconds). The document title is
+        the path relative to `root_dir`, so `data/docs/handbook.txt` keeps the
+        title "handbook.txt" used by single-file ingestion.
+    """
+    start = time.perf_counter()
+    parser = PARSERS[os.path.splitext(path)[1].lower()]
+    chunks = parser(path)
+    document_title = os.path.relpath(path, root_dir).replace(os.sep, "/")
+    return document_title, chunks, time.perf_counter() - start
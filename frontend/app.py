@@ -1,9 +1,47 @@
+import itertools
+import json
+import uuid
 import streamlit as st
 import requests
 
 API_URL = "http://localhost:8080/chat"
+STREAM_API_URL = f"{API_URL}/stream"
 st.set_page_config(page_title="MScAC Chatbot", page_icon="💬", layout="centered")
 
+
+@st.cache_resource
+def get_http_session():
+    # One keep-alive session per server process instead of a new TCP/TLS
+    # connection for every question.
+    return requests.Session()
+
+
+def stream_answer(session_id, message):
+    """
+    Yield answer tokens from the backend's Server-Sent Events stream.
+
+    Only the new message is sent; the backend keeps the conversation under
+    `session_id`.
+    """
+    with get_http_session().post(
+        STREAM_API_URL, json={"session_id": session_id, "message": message}, stream=True, timeout=(5, 120)
+    ) as response:
+        response.raise_for_status()
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                event = None
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                if event == "error":
+                    raise RuntimeError(data.get("error", "Unknown error"))
+                if event == "done":
+                    return
+                yield data.get("token", "")
+
+
 st.markdown(
     """
     <h1 style='text-align: center;'> MScAC Information Chatbot</h1>
@@ -14,6 +52,8 @@ st.markdown(
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
 for msg in st.session_state.messages:
     with st.chat_message(msg["role"]):
@@ -28,18 +68,17 @@ if user_input:
         st.markdown(user_input)
 
     with st.chat_message("assistant"):
-        placeholder = st.empty()
-        placeholder.markdown("Thinking...")
-
         try:
-            response = requests.post(API_URL, json={"messages": st.session_state.messages})
-            response.raise_for_status()
-            data = response.json()
-            answer = data.get("response", "No response received.")
-            placeholder.markdown(answer)
+            with st.spinner("Thinking..."):
+                tokens = stream_answer(st.session_state.session_id, user_input)
+                first_token = next(tokens, "")
+            answer = st.write_stream(itertools.chain([first_token], tokens))
+            if not answer:
+                answer = "No response received."
+                st.markdown(answer)
 
         except Exception as e:
             answer = f"Error: {e}"
-            placeholder.markdown(answer)
+            st.markdown(answer)
 
     st.session_state.messages.append({"role": "assistant", "content": answer})